@@ -1,21 +1,27 @@
 # Send message requiring ACK
 from datetime import datetime, timezone
+import random
 import time
 from utils.app_state import AppState
-from utils.utils import build_message
+from utils.codec import encode_message
 from utils import globals
 
 
-def send_with_ack(sock, message: dict, app_state: AppState, ip: str):
+def send_with_ack(sock, message: dict, app_state: AppState, ip: str, tracker=None):
+    """
+    tracker is optional, an object with on_retransmit(ack_id, rto) and
+    on_ack/on_give_up(ack_id), e.g. the file sender's SendWindow
+    """
     ackable = {
         "TICTACTOE_INVITE",
         "TICTACTOE_MOVE",
         "TICTACTOE_RESULT",
         "DM",
         "FILE_CHUNK",
+        "FILE_SIGNATURE",
+        "FILE_DELTA",
     }  # Add more message types here
-    sock.sendto(build_message(message).encode("utf-8"), (ip, globals.PORT))
-
+    data = encode_message(message)
     if message["TYPE"] in ackable:
         # Generate appropriate message ID for ACK tracking
         if message["TYPE"] == "FILE_CHUNK":
@@ -25,19 +31,147 @@ def send_with_ack(sock, message: dict, app_state: AppState, ip: str):
             # For other message types, use MESSAGE_ID
             ack_id = message["MESSAGE_ID"]
 
+        entry = {
+            "type": message["TYPE"],
+            "data": data,  # encoded once, every retry sends these bytes
+            "destination": ip,
+            "retries": 0,
+            "resent": False,  # any retransmission, timed out or requested
+            "timestamp": time.time(),
+            "sent_at": time.monotonic(),
+            "timer": None,
+            "tracker": tracker,
+        }
         with app_state.lock:
-            app_state.pending_acks[ack_id] = {
-                "message": message,
-                "destination": ip,
-                "retries": 0,
-                "timestamp": time.time(),
-            }
+            old = app_state.pending_acks.get(ack_id)
+            if old and old["timer"]:
+                old["timer"].cancelled = True
+            app_state.pending_acks[ack_id] = entry
+            if app_state.scheduler is not None:
+                entry["timer"] = app_state.scheduler.call_later(
+                    retransmit_timeout(app_state, entry),
+                    ack_timeout,
+                    sock,
+                    app_state,
+                    ack_id,
+                    entry,
+                )
+
+    # registered first so an ACK that beats us back still finds its entry
+    sock.sendto(data, (ip, globals.PORT))
+
+
+def get_retry_policy(msg_type: str) -> dict:
+    return globals.RETRY_POLICIES.get(msg_type, globals.RETRY_POLICIES["default"])
+
+
+def get_rto(app_state: AppState, ip: str) -> float:
+    """Current base RTO for a destination, before backoff"""
+    estimate = app_state.rtt_estimates.get(ip)
+    if estimate is None:
+        return globals.ACK_TIMEOUT
+    return estimate["rto"]
+
+
+def update_rtt(app_state: AppState, ip: str, sample: float):
+    """Fold one ACK round trip into the peer's SRTT/RTTVAR (RFC 6298), caller holds the lock"""
+    estimate = app_state.rtt_estimates.get(ip)
+    if estimate is None:
+        estimate = {"srtt": sample, "rttvar": sample / 2, "samples": 0}
+        app_state.rtt_estimates[ip] = estimate
+    else:
+        estimate["rttvar"] = 0.75 * estimate["rttvar"] + 0.25 * abs(
+            estimate["srtt"] - sample
+        )
+        estimate["srtt"] = 0.875 * estimate["srtt"] + 0.125 * sample
+    estimate["samples"] += 1
+    estimate["rto"] = estimate["srtt"] + max(0.01, 4 * estimate["rttvar"])
+
+
+def retransmit_timeout(app_state: AppState, entry: dict) -> float:
+    """Delay until the next resend: peer RTO, doubled per retry, clamped by the TYPE policy, jittered"""
+    policy = get_retry_policy(entry["type"])
+    rto = max(get_rto(app_state, entry["destination"]), policy["min_rto"])
+    rto = min(rto * (2 ** entry["retries"]), policy["max_rto"])
+    return rto * random.uniform(1 - globals.RTO_JITTER, 1 + globals.RTO_JITTER)
+
+
+def ack_timeout(sock, app_state: AppState, ack_id: str, entry: dict):
+    """Scheduler callback, fires once per retransmission deadline of one message"""
+    with app_state.lock:
+        # ACKed (or replaced by a newer send) in the meantime
+        if app_state.pending_acks.get(ack_id) is not entry:
+            return
+
+        gave_up = (
+            entry["retries"] >= get_retry_policy(entry["type"])["max_retries"]
+        )
+        if gave_up:
+            del app_state.pending_acks[ack_id]
+        else:
+            entry["retries"] += 1
+            entry["resent"] = True
+            entry["timestamp"] = time.time()
+            timeout = retransmit_timeout(app_state, entry)
+            entry["timer"] = app_state.scheduler.call_later(
+                timeout, ack_timeout, sock, app_state, ack_id, entry
+            )
+
+    tracker = entry["tracker"]
+    if gave_up:
+        if globals.verbose:
+            print(f"\n[DROP !]")
+            print(f"MessageID    : {ack_id}")
+            print(f"Reason       : Max retries reached\n")
+            print(f"[RESEND !] Gave up on {ack_id}")
+        if tracker:
+            tracker.on_give_up(ack_id)
+        return
+
+    if tracker:
+        tracker.on_retransmit(ack_id, timeout)
+    sock.sendto(entry["data"], (entry["destination"], globals.PORT))
+
+    if globals.verbose or globals.induce_loss:
+        print(f"\n[RESEND !]")
+        print(f"Message Type : {entry['type']}")
+        print(f"Timestamp    : {datetime.now(timezone.utc).timestamp()}")
+        print(f"From IP      : {app_state.user_id.split('@')[1]}")
+        print(f"From         : {app_state.user_id}")
+        print(f"MessageID    : {ack_id}")
+        print(f"Retry Count  : {entry['retries']}")
+        print(f"Destination  : {entry['destination']}\n")
+
+
+def retransmit_now(sock, app_state: AppState, ack_id: str) -> int:
+    """
+    Resend a pending message before its timer fires (the receiver told us it is
+    missing) and restart its retransmit timer. Returns 1 if it was still pending.
+    The receiver is evidently alive, so this doesn't use up a retry.
+    """
+    with app_state.lock:
+        entry = app_state.pending_acks.get(ack_id)
+        if entry is None:
+            return 0
+        if entry["timer"]:
+            app_state.scheduler.cancel(entry["timer"])
+        entry["resent"] = True
+        entry["timestamp"] = time.time()
+        timeout = retransmit_timeout(app_state, entry)
+        entry["timer"] = app_state.scheduler.call_later(
+            timeout, ack_timeout, sock, app_state, ack_id, entry
+        )
+
+    if entry["tracker"]:
+        entry["tracker"].on_retransmit(ack_id, timeout)
+    sock.sendto(entry["data"], (entry["destination"], globals.PORT))
+    return 1
 
 
 # Send back ACK
 def send_ack(sock, msg_id, target_ip, app_state):
     ack = {"TYPE": "ACK", "MESSAGE_ID": msg_id, "STATUS": "RECEIVED"}
-    sock.sendto(build_message(ack).encode("utf-8"), (target_ip, globals.PORT))
+    sock.sendto(encode_message(ack), (target_ip, globals.PORT))
 
     if globals.verbose:
         print(f"\n[SEND >]")
@@ -50,17 +184,61 @@ def send_ack(sock, msg_id, target_ip, app_state):
         print(f"Status       : RECEIVED\n")
 
 
+def acknowledge(app_state: AppState, ack_ids) -> int:
+    """
+    Clear a batch of pending ACK entries at once (one ACK, or a whole FILE_SACK
+    range) and notify their trackers. Returns how many were still pending.
+    """
+    acked = []
+    newest = None
+    with app_state.lock:
+        for ack_id in ack_ids:
+            entry = app_state.pending_acks.pop(ack_id, None)
+            if entry is None:
+                continue
+            if entry["timer"]:
+                app_state.scheduler.cancel(entry["timer"])
+            acked.append((ack_id, entry))
+            # Karn's rule, a retransmitted message gives an ambiguous sample
+            if not entry["resent"] and (
+                newest is None or entry["sent_at"] > newest["sent_at"]
+            ):
+                newest = entry
+
+        # one RTT sample per batch, from the most recently sent message
+        if newest is not None:
+            update_rtt(
+                app_state, newest["destination"], time.monotonic() - newest["sent_at"]
+            )
+
+    for ack_id, entry in acked:
+        if entry["tracker"]:
+            entry["tracker"].on_ack(ack_id)
+    return len(acked)
+
+
+def forget(app_state: AppState, ack_id: str):
+    """Drop a pending entry that will never be ACKed (it couldn't be sent), its tracker isn't told"""
+    with app_state.lock:
+        entry = app_state.pending_acks.pop(ack_id, None)
+        if entry is not None and entry["timer"]:
+            app_state.scheduler.cancel(entry["timer"])
+
+
 def handle_ack(msg, app_state, sender_ip):
     msg_id = msg.get("MESSAGE_ID")
-    with app_state.lock:
-        if msg_id in app_state.pending_acks:
-            del app_state.pending_acks[msg_id]
-            # print(f"[ACK RECEIVED] {msg_id}")
-
-            if globals.verbose:
-                print(f"\n[RECV <]")
-                print(f"Message Type : ACK")
-                print(f"From IP      : {sender_ip}")
-                print(f"Timestamp    : {datetime.now(timezone.utc).timestamp()}")
-                print(f"MessageID    : {msg_id}")
-                print(f"Status       : {msg.get('STATUS', 'RECEIVED')}\n")
+    if acknowledge(app_state, (msg_id,)):
+        # print(f"[ACK RECEIVED] {msg_id}")
+
+        if globals.verbose:
+            print(f"\n[RECV <]")
+            print(f"Message Type : ACK")
+            print(f"From IP      : {sender_ip}")
+            print(f"Timestamp    : {datetime.now(timezone.utc).timestamp()}")
+            print(f"MessageID    : {msg_id}")
+            print(f"Status       : {msg.get('STATUS', 'RECEIVED')}\n")
+
+
+def register_handlers(dispatcher):
+    # ACK has no FROM field
+    dispatcher.register("ACK", handle_ack, check_from=False, needs_addr=True)
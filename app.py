@@ -3,12 +3,14 @@ import sys
 import ipaddress
 from net_comms import (
     get_local_ip,
-    broadcast_loop,
     listener_loop,
-    ack_resend_loop,
-    peer_cleanup_loop,
+    schedule_jobs,
+    build_dispatcher,
 )
 from utils import AppState, globals
+from file_transfer import get_disk_writer, index_received_files
+from worker_pool import WorkerPool
+from scheduler import Scheduler
 import threading
 import ascii_magic
 import os
@@ -19,11 +21,12 @@ import os
 
 # Persistent Live variables in app_state class
 # App flow for now is
-# - 2 seperate threads for broadcasting profile and listening to LSP messages
+# - listener thread that only receives, handlers run on the worker pool
+# - one scheduler thread for beacons, retransmits and cleanup
 # - Main loop in app.py for executing commands
 
 
-def main(display_name, user_name, avatar_source_file=None):
+def main(display_name, user_name, avatar_source_file=None, use_async=False):
     app_state = AppState()
     app_state.local_ip = get_local_ip()
     app_state.broadcast_ip = str(
@@ -61,7 +64,17 @@ def main(display_name, user_name, avatar_source_file=None):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow rebinding
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)  # Enable broadcast
+        # room for a full file window of large chunks
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, globals.SOCKET_BUFFER)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, globals.SOCKET_BUFFER)
         sock.bind(("0.0.0.0", globals.PORT))  # Use PORT constant
+        if globals.MULTICAST_GROUP:
+            # one to many file sends go to the group instead of the broadcast address
+            membership = socket.inet_aton(globals.MULTICAST_GROUP) + socket.inet_aton(
+                app_state.local_ip
+            )
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
         print(f"[INFO] Socket bound to port {globals.PORT}")
         print(f"[INFO] Local IP: {app_state.local_ip}")
         print(f"[INFO] user_id: {app_state.user_id}")
@@ -70,12 +83,27 @@ def main(display_name, user_name, avatar_source_file=None):
         print(f"[ERROR] Failed to create/bind socket: {e}")
         return
 
-    threading.Thread(target=broadcast_loop, args=(sock, app_state), daemon=True).start()
-    threading.Thread(target=listener_loop, args=(sock, app_state), daemon=True).start()
+    # files from earlier sessions can be seeded, and offers of them skipped
+    get_disk_writer(app_state).call(index_received_files, app_state)
+
+    if use_async:
+        import asyncio
+        import async_runtime
+
+        asyncio.run(async_runtime.run(sock, app_state))
+        return
+
+    app_state.dispatcher = build_dispatcher()
+    app_state.worker_pool = WorkerPool(app_state.dispatcher, app_state, sock)
+    app_state.worker_pool.start()
+
+    app_state.scheduler = Scheduler()
+    app_state.scheduler.start()
+    schedule_jobs(app_state.scheduler, sock, app_state)
+
     threading.Thread(
-        target=ack_resend_loop, args=(sock, app_state), daemon=True
+        target=listener_loop, args=(sock, app_state, app_state.worker_pool), daemon=True
     ).start()
-    threading.Thread(target=peer_cleanup_loop, args=(app_state,), daemon=True).start()
 
     from cli_commands import get_cli_commands
 
@@ -93,13 +121,21 @@ def main(display_name, user_name, avatar_source_file=None):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3 or len(sys.argv) > 4:
-        print("Usage: python app.py <display_name> <user_name> [avatar_source_file]")
+    args = sys.argv[1:]
+    use_async = "--async" in args
+    if use_async:
+        args.remove("--async")
+
+    if len(args) < 2 or len(args) > 3:
+        print(
+            "Usage: python app.py [--async] <display_name> <user_name> [avatar_source_file]"
+        )
         print("Example: python app.py 'Juan Tamad' juan")
         print("Example: python app.py 'Juan Tamad' juan juan_tamad.png")
+        print("Example: python app.py --async 'Juan Tamad' juan")
         sys.exit(1)
 
-    display_name = sys.argv[1]
-    user_name = sys.argv[2]
-    avatar_source_file = sys.argv[3] if len(sys.argv) == 4 else None
-    main(display_name, user_name, avatar_source_file)
+    display_name = args[0]
+    user_name = args[1]
+    avatar_source_file = args[2] if len(args) == 3 else None
+    main(display_name, user_name, avatar_source_file, use_async)
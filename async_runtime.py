@@ -0,0 +1,126 @@
+# async_runtime.py
+# Optional single-threaded runtime (python app.py --async ...)
+# Receiving and the beacon, retransmission and cleanup timers all run on one asyncio loop
+# and reuse the same handler modules as the threaded runtime.
+import asyncio
+import threading
+from net_comms import build_dispatcher, schedule_jobs
+from scheduler import Timer
+from utils import AppState, decode_message
+import utils.globals as globals
+
+
+class ThreadSafeTransport:
+    """
+    socket-like sendto() on top of the datagram transport, handlers get this
+    instead of the raw socket. CLI commands run in executor threads, so sends
+    from other threads are handed over to the loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, transport):
+        self.loop = loop
+        self.transport = transport
+        self.loop_thread = threading.get_ident()
+
+    def sendto(self, data: bytes, addr):
+        if threading.get_ident() == self.loop_thread:
+            self.transport.sendto(data, addr)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.sendto, data, addr)
+
+
+class LSNPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, app_state: AppState, dispatcher):
+        self.app_state = app_state
+        self.dispatcher = dispatcher
+        self.sock = None  # set once the transport exists
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            msg = decode_message(data)
+            self.dispatcher.dispatch(msg, self.app_state, self.sock, addr)
+        except Exception as e:
+            print("[ERROR] Could not parse message:", e)
+
+    def error_received(self, exc):
+        if globals.verbose:
+            print(f"[ERROR] Socket error: {exc}")
+
+
+class LoopScheduler:
+    """Same interface as scheduler.Scheduler but backed by the event loop's own timers"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+
+    def call_later(self, delay: float, callback, *args) -> Timer:
+        return self._schedule(Timer(self.loop.time() + delay, callback, args))
+
+    def call_at(self, when: float, callback, *args) -> Timer:
+        # when is on time.monotonic(), same clock as the default loop.time()
+        return self._schedule(Timer(when, callback, args))
+
+    def call_every(self, interval: float, callback, *args, first_delay=0) -> Timer:
+        timer = Timer(self.loop.time() + first_delay, callback, args, interval)
+        return self._schedule(timer)
+
+    def cancel(self, timer: Timer):
+        timer.cancelled = True
+
+    def _schedule(self, timer: Timer) -> Timer:
+        if threading.get_ident() == self.loop_thread:
+            self.loop.call_at(timer.when, self._fire, timer)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.call_at, timer.when, self._fire, timer)
+        return timer
+
+    def _fire(self, timer: Timer):
+        if timer.cancelled:
+            return
+        timer.run()
+        if timer.interval is not None and not timer.cancelled:
+            timer.when = max(timer.when + timer.interval, self.loop.time())
+            self.loop.call_at(timer.when, self._fire, timer)
+
+
+async def cli_task(sock, app_state: AppState):
+    # commands prompt with input() themselves, so both the command line and the
+    # command run in the executor and the loop keeps serving the socket meanwhile
+    from cli_commands import get_cli_commands
+
+    loop = asyncio.get_running_loop()
+    commands = get_cli_commands(sock, app_state, globals)
+
+    while True:
+        cmd = await loop.run_in_executor(None, input, "Enter command: \n")
+        func = commands.get(cmd)
+        if func:
+            result = await loop.run_in_executor(None, func)
+            if result == "__exit__":
+                break
+        else:
+            print("Unknown command.")
+
+
+async def run(sock, app_state: AppState):
+    """Run the node on an already bound UDP socket until the user exits"""
+    loop = asyncio.get_running_loop()
+    app_state.event_loop = loop
+    app_state.dispatcher = build_dispatcher()
+
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: LSNPProtocol(app_state, app_state.dispatcher), sock=sock
+    )
+    out = ThreadSafeTransport(loop, transport)
+    protocol.sock = out
+    print(f"[LISTENING] UDP port {globals.PORT} on {app_state.local_ip} (asyncio)...\n")
+
+    # beacon, retransmit and cleanup timers all live on the loop
+    app_state.scheduler = LoopScheduler(loop)
+    schedule_jobs(app_state.scheduler, out, app_state)
+    try:
+        await cli_task(out, app_state)
+    finally:
+        transport.close()
+        app_state.event_loop = None
@@ -0,0 +1,177 @@
+# avatar.py
+# Content-addressed avatars. PROFILE, POST and DM carry AVATAR_HASH (sha256
+# of the base64 AVATAR_DATA), the art itself is fetched once per hash with
+# AVATAR_REQUEST / AVATAR_DATA and kept in app_state.avatars, already
+# decoded, so showing it again costs nothing. Peers say they fetch by hash
+# with AVATAR_FETCH in their PROFILE, the rest still get the art inline.
+import functools
+import hashlib
+import time
+import utils.globals as globals
+from utils import decode_avatar_data, encode_message
+
+
+@functools.lru_cache(maxsize=16)
+def avatar_hash(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def own_hash(app_state):
+    """AVATAR_HASH for our outgoing messages, None without an avatar"""
+    if not app_state.avatar_data:
+        return None
+    return avatar_hash(app_state.avatar_data)
+
+
+def fetches_by_hash(app_state, user_ids) -> bool:
+    """Every one of user_ids is a peer whose PROFILE had AVATAR_FETCH"""
+    with app_state.lock:
+        peers = [app_state.peers.get(user_id) for user_id in user_ids]
+    return bool(peers) and all(peer and peer.get("avatar_fetch") for peer in peers)
+
+
+def add_avatar(message: dict, app_state, to_user_ids=None):
+    """
+    Sender side, AVATAR_HASH and, unless every recipient fetches by hash,
+    the inline AVATAR_TYPE / ENCODING / DATA fields as well. to_user_ids
+    None is a broadcast, to every peer we know (or don't know yet).
+    """
+    digest = own_hash(app_state)
+    if not digest:
+        return
+    message["AVATAR_HASH"] = digest
+    if to_user_ids is None:
+        to_user_ids = list(app_state.peers)
+    if not fetches_by_hash(app_state, to_user_ids):
+        message["AVATAR_TYPE"] = "text"
+        message["AVATAR_ENCODING"] = "base64"
+        message["AVATAR_DATA"] = app_state.avatar_data
+
+
+def lookup(app_state, digest: str):
+    """Base64 avatar data for a hash, ours or a cached one"""
+    if digest == own_hash(app_state):
+        return app_state.avatar_data
+    entry = app_state.avatars.get(digest)
+    return entry["data"] if entry else None
+
+
+def store(app_state, data: str) -> str:
+    """Caches avatar data (decoded once), returns its hash"""
+    digest = avatar_hash(data)
+    with app_state.lock:
+        if digest not in app_state.avatars:
+            while len(app_state.avatars) >= globals.AVATAR_CACHE_SIZE:
+                del app_state.avatars[next(iter(app_state.avatars))]
+            app_state.avatars[digest] = {"data": data, "text": decode_avatar_data(data)}
+        app_state.avatar_requests.pop(digest, None)
+    return digest
+
+
+def from_message(sock, app_state, message: dict, user_id: str, sender_ip: str):
+    """
+    AVATAR_HASH of a received PROFILE / POST / DM, asks the sender for the
+    art if we don't have it yet. Inline AVATAR_DATA (peers from before
+    AVATAR_HASH) goes straight into the cache.
+    """
+    data = message.get("AVATAR_DATA")
+    if data:
+        return store(app_state, data)
+    digest = message.get("AVATAR_HASH")
+    if not digest:
+        return None
+    if digest not in app_state.avatars:
+        request_avatar(sock, app_state, digest, user_id, sender_ip)
+    return digest
+
+
+def request_avatar(sock, app_state, digest: str, user_id: str, ip: str):
+    now = time.monotonic()
+    with app_state.lock:
+        asked = app_state.avatar_requests.get(digest)
+        if asked is not None and now - asked < globals.AVATAR_REQUEST_RETRY:
+            return  # one in flight already, lost ones are asked again on the next message
+        app_state.avatar_requests[digest] = now
+
+    message = {
+        "TYPE": "AVATAR_REQUEST",
+        "FROM": app_state.user_id,
+        "TO": user_id,
+        "AVATAR_HASH": digest,
+        "TIMESTAMP": int(time.time()),
+    }
+    sock.sendto(encode_message(message), (ip, globals.PORT))
+    if globals.verbose:
+        print(f"[INFO] AVATAR_REQUEST for {digest[:12]} to {user_id}")
+
+
+def show_avatar(app_state, digest):
+    """Prints a cached avatar, nothing if it is still being fetched"""
+    entry = app_state.avatars.get(digest) if digest else None
+    if entry is None:
+        return
+    if entry["text"]:
+        print("Avatar:")
+        print(entry["text"])
+    else:
+        print("Avatar: [Unable to decode]")
+
+
+def handle_avatar_request(message, app_state, sock, sender_ip):
+    """Known peers only, and at most one reply per AVATAR_REPLY_INTERVAL to an ip"""
+    if message["FROM"] not in app_state.peers:
+        if globals.verbose:
+            print(f"[DEBUG] Ignoring AVATAR_REQUEST from unknown {message['FROM']}")
+        return
+    digest = message.get("AVATAR_HASH", "")
+    data = lookup(app_state, digest)
+    if data is None:
+        return
+    now = time.monotonic()
+    with app_state.lock:
+        replied = app_state.avatar_replies.get(sender_ip)
+        if replied is not None and now - replied < globals.AVATAR_REPLY_INTERVAL:
+            return  # they ask again on their next message if it was lost
+        app_state.avatar_replies[sender_ip] = now
+
+    reply = {
+        "TYPE": "AVATAR_DATA",
+        "FROM": app_state.user_id,
+        "TO": message["FROM"],
+        "AVATAR_HASH": digest,
+        "AVATAR_TYPE": "text",
+        "AVATAR_ENCODING": "base64",
+        "AVATAR_DATA": data,
+        "TIMESTAMP": int(time.time()),
+    }
+    try:
+        sock.sendto(encode_message(reply), (sender_ip, globals.PORT))
+    except OSError as e:
+        # an avatar too big for one datagram can't be sent at all
+        print(f"[ERROR] Could not send avatar to {message['FROM']}: {e}")
+        return
+    if globals.verbose:
+        print(f"[INFO] AVATAR_DATA for {digest[:12]} to {message['FROM']}")
+
+
+def handle_avatar_data(message, app_state):
+    digest = message.get("AVATAR_HASH", "")
+    data = message.get("AVATAR_DATA", "")
+    if digest not in app_state.avatar_requests or avatar_hash(data) != digest:
+        if globals.verbose:
+            print(f"[DEBUG] Ignoring unrequested or mismatched AVATAR_DATA from {message['FROM']}")
+        return
+    store(app_state, data)
+
+    # the PROFILE / POST / DM that named it went out without it, show it now
+    peer = app_state.peers.get(message["FROM"], {})
+    print(f"\n[AVATAR] {peer.get('display_name', message['FROM'])}")
+    show_avatar(app_state, digest)
+    print()
+
+
+def register_handlers(dispatcher):
+    dispatcher.register(
+        "AVATAR_REQUEST", handle_avatar_request, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register("AVATAR_DATA", handle_avatar_data)
@@ -0,0 +1,36 @@
+# bench_chunk_size.py
+# File transfer throughput over loopback at several fixed chunk sizes
+#
+# python benchmarks/bench_chunk_size.py [size_mb]
+import contextlib
+import io
+import sys
+import time
+from common import globals, make_pair, run_transfer
+
+CHUNK_SIZES = [256, 1024, 4096, 16384, 47616]
+
+
+def main(size_mb=4):
+    size = int(size_mb * 1024 * 1024)
+    with contextlib.redirect_stdout(io.StringIO()):
+        (sender, sender_sock), (receiver, receiver_sock) = make_pair()
+        time.sleep(0.1)  # let the listener threads start
+    # keep the size fixed, this measures the size itself and not the fallback
+    globals.CHUNK_FALLBACK_LOSS = float("inf")
+
+    print(f"{'chunk size':>10} | {'seconds':>8} | {'MB/s':>8}")
+    for chunk_size in CHUNK_SIZES:
+        globals.MAX_CHUNK_SIZE = chunk_size
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = run_transfer(
+                sender, sender_sock, receiver, receiver_sock, size
+            )
+        if elapsed is None:
+            print(f"{chunk_size:>10} | {'timeout':>8} |")
+            continue
+        print(f"{chunk_size:>10} | {elapsed:>8.2f} | {size_mb / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 4)
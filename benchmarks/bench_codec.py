@@ -0,0 +1,102 @@
+# bench_codec.py
+# Microseconds to encode a message, and to decode + dispatch a received one,
+# with the old string codec (build_message / parse_message of the whole
+# datagram) and with utils.codec. The handler reads a few fields like the
+# real ones do, our own broadcasts coming back are dropped by the dispatcher.
+#
+# python benchmarks/bench_codec.py
+import timeit
+from common import globals
+from dispatcher import Dispatcher
+from utils import decode_message, encode_avatar_data, encode_message, parse_message
+
+ME = "alice@192.168.1.10"
+PEER = "bob@192.168.1.11"
+
+
+class Node:
+    user_id = ME
+
+
+def old_build_message(data: dict) -> str:
+    return "\n".join(f"{k}: {v}" for k, v in data.items()) + "\n\n"
+
+
+def old_parse_datagram(data: bytes) -> dict:
+    end = data.find(b"\n\n")
+    if data.find(b"\nPAYLOAD: ", 0, end) < 0:
+        return parse_message(data.decode("utf-8"))
+    result = parse_message(data[:end].decode("utf-8"))
+    result["PAYLOAD"] = memoryview(data)[end + 2 :]
+    return result
+
+
+def messages():
+    avatar = encode_avatar_data("\x1b[38;5;208m@" * 300)
+    return {
+        "PING": {"TYPE": "PING", "USER_ID": PEER},
+        "POST": {
+            "TYPE": "POST",
+            "USER_ID": PEER,
+            "CONTENT": "hello everyone",
+            "TTL": 3600,
+            "MESSAGE_ID": "a1b2c3d4",
+            "TOKEN": f"{PEER}|1700003600|broadcast",
+            "TIMESTAMP": 1700000000,
+        },
+        "PROFILE": {
+            "TYPE": "PROFILE",
+            "USER_ID": PEER,
+            "DISPLAY_NAME": "Bob",
+            "STATUS": "around",
+            "AVATAR_TYPE": "text",
+            "AVATAR_ENCODING": "base64",
+            "AVATAR_DATA": avatar,
+        },
+        "FILE_CHUNK": {
+            "TYPE": "FILE_CHUNK",
+            "FROM": PEER,
+            "TO": ME,
+            "FILEID": "abcd1234",
+            "CHUNK_INDEX": 5,
+            "TOTAL_CHUNKS": 100,
+            "TOKEN": f"{PEER}|1700003600|file",
+            "PAYLOAD": bytes(16384),
+        },
+    }
+
+
+def per_call(func, number=20000) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    dispatcher = Dispatcher()
+    for msg_type in messages():
+        dispatcher.register(
+            msg_type,
+            lambda msg, app_state: (msg.get("TIMESTAMP"), msg.get("TOKEN"), msg.get("TO")),
+            check_from=False,
+        )
+    node = Node()
+    addr = ("192.168.1.11", globals.PORT)
+
+    print(f"{'message':>21} | {'old us':>7} | {'codec us':>8}")
+    for msg_type, message in messages().items():
+        text = {k: v for k, v in message.items() if k != "PAYLOAD"}
+        old = per_call(lambda: old_build_message(text).encode("utf-8"))
+        new = per_call(lambda: encode_message(text))
+        print(f"{'encode ' + msg_type:>21} | {old:>7.2f} | {new:>8.2f}")
+
+    for sender in (PEER, ME):
+        for msg_type, message in messages().items():
+            key = "FROM" if "FROM" in message else "USER_ID"
+            data = encode_message(dict(message, **{key: sender}))
+            old = per_call(lambda: dispatcher.dispatch(old_parse_datagram(data), node, None, addr))
+            new = per_call(lambda: dispatcher.dispatch(decode_message(data), node, None, addr))
+            label = ("own " if sender == ME else "") + msg_type
+            print(f"{'decode ' + label:>21} | {old:>7.2f} | {new:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
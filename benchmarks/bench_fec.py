@@ -0,0 +1,46 @@
+# bench_fec.py
+# Time to complete a loopback file transfer with and without FEC parity,
+# across induced loss rates (globals.induce_loss drops FILE_CHUNK and
+# FILE_PARITY on the receiving side)
+#
+# python benchmarks/bench_fec.py [size_mb]
+import contextlib
+import io
+import sys
+import time
+from common import globals, make_pair, run_transfer
+
+LOSS_RATES = [0.0, 0.01, 0.05, 0.1, 0.2, 0.3]
+FEC_MODES = [0, 4, "auto"]
+CHUNK_SIZE = 4096
+
+
+def main(size_mb=1):
+    size = int(size_mb * 1024 * 1024)
+    with contextlib.redirect_stdout(io.StringIO()):
+        (sender, sender_sock), (receiver, receiver_sock) = make_pair()
+        time.sleep(0.1)  # let the listener threads start
+    # fixed chunk size, so only FEC differs between runs
+    globals.MAX_CHUNK_SIZE = CHUNK_SIZE
+    globals.CHUNK_FALLBACK_LOSS = float("inf")
+
+    header = " | ".join(f"{f'fec {mode}':>9}" for mode in FEC_MODES)
+    print(f"{'loss':>5} | {header}   (seconds)")
+    for loss in LOSS_RATES:
+        globals.induce_loss = loss > 0
+        globals.loss_rate = loss
+        row = []
+        for mode in FEC_MODES:
+            globals.FEC_GROUP = mode
+            # start every run from the same RTT estimate
+            sender.rtt_estimates.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = run_transfer(
+                    sender, sender_sock, receiver, receiver_sock, size
+                )
+            row.append(f"{elapsed:>9.2f}" if elapsed is not None else f"{'timeout':>9}")
+        print(f"{loss:>5.2f} | " + " | ".join(row))
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1)
@@ -0,0 +1,39 @@
+# bench_framing.py
+# Loopback file transfer throughput with base64 text chunks (DATA) and with
+# binary framing (raw PAYLOAD after the header), at the same chunk sizes and
+# at the largest chunk each framing fits in one datagram
+#
+# python benchmarks/bench_framing.py [size_mb]
+import contextlib
+import io
+import sys
+import time
+from common import globals, make_pair, run_transfer
+
+CHUNK_SIZES = [1024, 4096, 16384, None]  # None = largest that fits
+
+
+def main(size_mb=8):
+    size = int(size_mb * 1024 * 1024)
+    with contextlib.redirect_stdout(io.StringIO()):
+        (sender, sender_sock), (receiver, receiver_sock) = make_pair()
+        time.sleep(0.1)  # let the listener threads start
+    globals.CHUNK_FALLBACK_LOSS = float("inf")
+
+    print(f"{'chunk size':>10} | {'text MB/s':>9} | {'binary MB/s':>11}")
+    for chunk_size in CHUNK_SIZES:
+        globals.MAX_CHUNK_SIZE = chunk_size
+        row = []
+        for binary in (False, True):
+            globals.BINARY_CHUNKS = binary
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = run_transfer(
+                    sender, sender_sock, receiver, receiver_sock, size
+                )
+            row.append(f"{size_mb / elapsed:.2f}" if elapsed is not None else "timeout")
+        label = chunk_size or "max"
+        print(f"{label:>10} | {row[0]:>9} | {row[1]:>11}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 8)
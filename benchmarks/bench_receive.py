@@ -0,0 +1,73 @@
+# bench_receive.py
+# Datagrams handled per second by listener_loop + the worker pool, with the
+# reusable receive buffers and without them (plain recvfrom per datagram),
+# for small PINGs and for 32 KB one to many FILE_CHUNKs nobody is receiving
+#
+# python benchmarks/bench_receive.py [count]
+import contextlib
+import io
+import socket
+import sys
+import time
+from common import globals, make_node
+from utils import encode_message
+
+SENDER_IP = "127.0.0.3"
+
+
+def messages():
+    ping = {"TYPE": "PING", "USER_ID": f"bench@{SENDER_IP}"}
+    chunk = {
+        "TYPE": "FILE_CHUNK",
+        "FROM": f"bench@{SENDER_IP}",
+        "FILEID": "00000000",
+        "MULTI": "1",
+        "CHUNK_INDEX": 0,
+        "TOTAL_CHUNKS": 1,
+        "PAYLOAD": bytes(32 * 1024),
+    }
+    return [("PING", encode_message(ping)), ("FILE_CHUNK", encode_message(chunk))]
+
+
+def run(node, sock, msg_type, data, count):
+    """Blast count copies of data at the node, returns datagrams handled per second"""
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind((SENDER_IP, 0))
+    before = node.dispatcher.stats().get(msg_type, 0)
+    start = time.perf_counter()
+    for n in range(count):
+        sender.sendto(data, (node.local_ip, globals.PORT))
+        if n % 64 == 63:
+            time.sleep(0)  # let the receiving threads run, the socket buffer is finite
+    handled = 0
+    while True:
+        time.sleep(0.05)
+        now = node.dispatcher.stats().get(msg_type, 0) - before
+        if now == handled:
+            break
+        handled = now
+    sender.close()
+    return handled / (time.perf_counter() - start - 0.05)
+
+
+def main(count=50000):
+    results = {}
+    for label, ip, buffers in (("recvfrom", "127.0.0.4", 0), ("pooled", "127.0.0.5", None)):
+        if buffers is not None:
+            globals.RECV_BUFFERS = globals.RECV_SMALL_BUFFERS = buffers
+        with contextlib.redirect_stdout(io.StringIO()):
+            node, sock = make_node(ip, label)
+            time.sleep(0.1)  # let the listener thread start
+        for msg_type, data in messages():
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[label, msg_type] = run(node, sock, msg_type, data, count)
+
+    print(f"{'message':>10} | {'recvfrom /s':>11} | {'pooled /s':>9}")
+    for msg_type, _ in messages():
+        plain = results["recvfrom", msg_type]
+        pooled = results["pooled", msg_type]
+        print(f"{msg_type:>10} | {plain:>11.0f} | {pooled:>9.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,83 @@
+# common.py
+# Helpers for the loopback benchmarks: two full nodes in one process, bound to
+# 127.0.0.1 and 127.0.0.2 on the same port (Linux routes all of 127/8 to lo,
+# on macOS add the alias first: sudo ifconfig lo0 alias 127.0.0.2)
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.globals as globals
+from utils import AppState
+from net_comms import build_dispatcher, listener_loop
+from worker_pool import WorkerPool
+from scheduler import Scheduler
+import file_transfer
+
+
+def make_node(ip: str, name: str):
+    app_state = AppState(
+        user_id=f"{name}@{ip}", display_name=name, local_ip=ip, broadcast_ip=ip
+    )
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, globals.SOCKET_BUFFER)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, globals.SOCKET_BUFFER)
+    sock.bind((ip, globals.PORT))
+
+    app_state.dispatcher = build_dispatcher()
+    app_state.worker_pool = WorkerPool(app_state.dispatcher, app_state, sock)
+    app_state.worker_pool.start()
+    app_state.scheduler = Scheduler()
+    app_state.scheduler.start()
+    threading.Thread(
+        target=listener_loop, args=(sock, app_state, app_state.worker_pool), daemon=True
+    ).start()
+    return app_state, sock
+
+
+def make_pair():
+    sender, sender_sock = make_node("127.0.0.1", "sender")
+    receiver, receiver_sock = make_node("127.0.0.2", "receiver")
+    for a, b in ((sender, receiver), (receiver, sender)):
+        a.peers[b.user_id] = {
+            "ip": b.local_ip,
+            "display_name": b.display_name,
+            "status": "",
+            "last_seen": time.time() + 10**6,
+        }
+    return (sender, sender_sock), (receiver, receiver_sock)
+
+
+def run_transfer(sender, sender_sock, receiver, receiver_sock, size, timeout=300):
+    """Offer, accept and wait for a size byte random file, returns seconds taken or None"""
+    workdir = tempfile.mkdtemp(prefix="lsnp_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open("payload.bin", "wb") as f:
+            f.write(os.urandom(size))
+
+        start = time.perf_counter()
+        file_transfer.send_file(sender_sock, sender, receiver.user_id, "payload.bin")
+        while not receiver.pending_file_offers:
+            if time.perf_counter() - start > timeout:
+                return None
+            time.sleep(0.001)
+        file_id = next(iter(receiver.pending_file_offers))
+        file_transfer.accept_file(file_id, receiver, receiver_sock)
+
+        while file_id in receiver.file_transfers or not os.path.exists(
+            os.path.join("received_files", "payload.bin")
+        ):
+            if time.perf_counter() - start > timeout:
+                return None
+            time.sleep(0.001)
+        return time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
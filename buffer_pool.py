@@ -0,0 +1,64 @@
+# buffer_pool.py
+import collections
+import weakref
+
+RECV_SIZE = 65535  # the largest UDP datagram
+SMALL_SIZE = 2048  # most LSNP messages, everything but file chunks and avatars
+
+
+class BufferPool:
+    """
+    Reusable receive buffers for listener_loop's recvfrom_into, so a datagram
+    costs no allocation. Buffers are made on demand up to max_buffers, after
+    that acquire() returns None and the caller allocates like before.
+
+    A buffer goes back once its datagram is handled. If a handler kept the
+    message's PAYLOAD (a memoryview into the buffer, e.g. a chunk queued for
+    the disk writer) it goes back when that view is gone instead, so handlers
+    that keep a slice of PAYLOAD past PAYLOAD itself must copy it.
+    """
+
+    def __init__(self, max_buffers: int, size: int = RECV_SIZE):
+        self.size = size
+        self.max_buffers = max_buffers
+        self.allocated = 0
+        self.misses = 0  # datagrams received without a pooled buffer
+        # deque append/pop are atomic, buffers come back from any thread
+        self._free = collections.deque()
+        self._held = {}  # id(weakref) -> (weakref, buffer) waiting on a payload
+
+    def acquire(self):
+        """Called from the listener thread only"""
+        try:
+            return self._free.pop()
+        except IndexError:
+            pass
+        if self.allocated >= self.max_buffers:
+            self.misses += 1
+            return None
+        self.allocated += 1
+        return bytearray(self.size)
+
+    def release(self, buf: bytearray):
+        self._free.append(buf)
+
+    def recycle(self, buf: bytearray, msg):
+        """The datagram in buf was handled, msg is what it decoded to (or None)"""
+        payload = msg.pop("PAYLOAD", None) if msg is not None else None
+        if not isinstance(payload, memoryview):
+            self.release(buf)
+            return
+        ref = weakref.ref(payload, self._payload_gone)
+        self._held[id(ref)] = (ref, buf)
+        # payload goes out of scope here, if nobody kept it the buffer is back right away
+
+    def _payload_gone(self, ref):
+        self.release(self._held.pop(id(ref))[1])
+
+    def stats(self) -> dict:
+        return {
+            "allocated": self.allocated,
+            "free": len(self._free),
+            "held": len(self._held),
+            "misses": self.misses,
+        }
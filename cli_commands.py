@@ -1,3 +1,4 @@
+import os
 import random
 from pprint import pprint
 from follow import send_follow, send_unfollow
@@ -6,7 +7,9 @@ from post import send_post
 from like import send_like
 from group import create_group, update_group, group_message
 from tictactoe import move, send_invite, print_board, send_result
-from file_transfer import accept_file, send_file
+from file_transfer import accept_file, interrupted_transfers, resume_file, send_file
+from file_multicast import group_recipients, send_file_multi
+from file_batch import send_batch
 
 
 def get_cli_commands(sock, app_state, globals):
@@ -223,6 +226,8 @@ def get_cli_commands(sock, app_state, globals):
             print(f"{idx}) ID: {file_id}")
             print(f"   From: {offer['from']}")
             print(f"   Filename: {offer['filename']} ({offer['filesize']} bytes)")
+            if offer["batch"]:
+                print(f"   Folder of {offer['batch']['count']} files")
             print(f"   Description: {offer.get('description', 'No description')}")
             print(f"   Timestamp: {offer['timestamp']}")
             print("-" * 40)
@@ -237,18 +242,79 @@ def get_cli_commands(sock, app_state, globals):
             print("Invalid input.")
             return
 
-        accept_file(file_id, app_state, sock)
+        swarm = False
+        offer = app_state.pending_file_offers[file_id]
+        if offer["filehash"] and not (offer["multi"] or offer["batch"]):
+            answer = input("Also download from other peers that have it? (y/N): ")
+            swarm = answer.strip().lower() == "y"
+        accept_file(file_id, app_state, sock, swarm)
+
+    def cmd_resume_file():
+        transfers = interrupted_transfers(app_state)
+        if not transfers:
+            print("\n[INFO] No interrupted file transfers.\n")
+            return
+
+        print("\n[INTERRUPTED FILE TRANSFERS]")
+        for idx, transfer in enumerate(transfers, start=1):
+            have = min(len(transfer["blocks"]) * globals.CHUNK_SIZE, transfer["filesize"])
+            print(f"{idx}) ID: {transfer['checkpoint_id']}")
+            print(f"   From: {transfer['from']}")
+            print(f"   Filename: {transfer['filename']} ({transfer['filesize']} bytes)")
+            print(f"   Received: {have} bytes")
+            print("-" * 40)
+
+        try:
+            choice = int(input("Enter the number of the file to resume: "))
+            if not (1 <= choice <= len(transfers)):
+                print("Invalid choice.")
+                return
+        except ValueError:
+            print("Invalid input.")
+            return
+
+        resume_file(transfers[choice - 1]["checkpoint_id"], app_state, sock)
 
     def cmd_send_file():
         target_user_id = input("Enter target user id (e.g. bob@192.168.1.12): \n")
-        file_path = input("Enter path to file to send: \n")
+        file_path = input("Enter path to file or folder to send: \n")
         description = input("Optional file description: \n")
+        if os.path.isdir(file_path):
+            # every file in it as one stream, accepted once
+            send_batch(sock, app_state, target_user_id, file_path, description)
+            return
         send_file(sock, app_state, target_user_id, file_path, description)
 
+    def cmd_send_file_group():
+        target = input("Enter group id, or user ids separated by commas: \n")
+        recipients = group_recipients(app_state, target.strip())
+        if not recipients:
+            print("No recipients. See groups using 'check_groups'")
+            return
+        file_path = input("Enter path to file to send: \n")
+        description = input("Optional file description: \n")
+        send_file_multi(sock, app_state, recipients, file_path, description)
+
     def cmd_induce_loss_on():
         globals.induce_loss = True
         print("Induced packet loss ENABLED for Game and File messages.")
 
+    def cmd_set_fec():
+        choice = input(
+            f"FEC parity for sent files (currently {globals.FEC_GROUP}): "
+            f"off, auto, or chunks per parity chunk: \n"
+        ).strip()
+        if choice in ("off", "0"):
+            globals.FEC_GROUP = 0
+        elif choice == "auto":
+            globals.FEC_GROUP = "auto"
+        elif choice.isdigit() and int(choice) >= 2:
+            globals.FEC_GROUP = int(choice)
+        else:
+            print("Invalid input.")
+            return
+        print(f"FEC set to {globals.FEC_GROUP}")
+
     def cmd_induce_loss_off():
         globals.induce_loss = False
         print("Induced packet loss DISABLED for Game and File messages.")
@@ -318,12 +384,81 @@ def get_cli_commands(sock, app_state, globals):
             print(f"Message ID: {msg_id} | Expiry: {expiry}")
         print()
 
+    def cmd_check_rtt():
+        print("\n[RTT ESTIMATES]")
+        with app_state.lock:
+            estimates = {ip: dict(e) for ip, e in app_state.rtt_estimates.items()}
+        if not estimates:
+            print("No RTT samples yet.")
+        for ip, estimate in estimates.items():
+            print(
+                f"{ip:<15} SRTT: {estimate['srtt'] * 1000:.1f} ms | "
+                f"RTTVAR: {estimate['rttvar'] * 1000:.1f} ms | "
+                f"RTO: {estimate['rto'] * 1000:.1f} ms | "
+                f"Samples: {estimate['samples']}"
+            )
+        print()
+
+    def cmd_dispatch_stats():
+        print("\n[DISPATCH STATS]")
+        for msg_type, count in sorted(app_state.dispatcher.stats().items()):
+            print(f"{msg_type:<17}: {count}")
+        print(f"{'DROPPED':<17}: {app_state.dispatcher.dropped}")
+        print()
+
+    def cmd_queue_stats():
+        if app_state.worker_pool is None:
+            print("\n[INFO] No worker pool, handlers run on the asyncio loop.\n")
+            return
+        stats = app_state.worker_pool.stats()
+        print("\n[WORK QUEUE STATS]")
+        print(f"Workers        : {stats['workers']}")
+        print(f"Queue depths   : {stats['depths']}")
+        print(f"Fast lane depth: {stats['fast_lane_depth']}")
+        print(f"Max depth      : {stats['max_depth']}")
+        print(f"Overflow drops : {stats['overflow_drops']}")
+        for label, key in (("Recv buffers   ", "buffers"), ("Small buffers  ", "small_buffers")):
+            buffers = stats[key]
+            print(
+                f"{label}: {buffers['allocated']} allocated, {buffers['free']} free, "
+                f"{buffers['held']} held by handlers, {buffers['misses']} misses"
+            )
+        print()
+
+    def cmd_transfer_stats():
+        sends = app_state.transfer_engine.stats() if app_state.transfer_engine else []
+        if not sends:
+            print("\n[INFO] No file sends in progress.\n")
+            return
+        print("\n[FILE SENDS]")
+        for send in sends:
+            print(f"File ID    : {send['file_id']} to {send['to_ip']}")
+            print(f"Sent       : {send['sent_bytes']}/{send['total_bytes']} bytes")
+            print(f"Throughput : {send['rate'] / 1024:.1f} KB/s")
+            if send["cwnd"] is not None:
+                print(f"Window     : {send['cwnd']:.1f} chunks, {send['retransmits']} retransmits")
+            print("-" * 40)
+
+    def cmd_set_file_rate():
+        try:
+            total = int(input("Max KB/s for all file sends (0 = no cap): \n") or 0)
+            peer = int(input("Max KB/s per peer (0 = no cap): \n") or 0)
+        except ValueError:
+            print("Invalid input.")
+            return
+        globals.FILE_RATE_LIMIT = total * 1024
+        globals.FILE_PEER_RATE_LIMIT = peer * 1024
+        print(f"File send rate cap: {total or 'none'} KB/s total, {peer or 'none'} KB/s per peer")
+
     commands = {
         # fmt: off
         "exit": lambda: "__exit__",
         "help": cmd_help,
         "verbose": cmd_verbose,
         "broadcast_verbose": cmd_broadcast_verbose,
+        "dispatch_stats": cmd_dispatch_stats,
+        "queue_stats": cmd_queue_stats,
+        "check_rtt": cmd_check_rtt,
 
         "follow": cmd_follow,
         "unfollow": cmd_unfollow,
@@ -355,9 +490,14 @@ def get_cli_commands(sock, app_state, globals):
         "forfeit": cmd_forfeit,
 
         "accept_file": cmd_accept_file,
+        "resume_file": cmd_resume_file,
         "send_file": cmd_send_file,
+        "send_file_group": cmd_send_file_group,
         
         "induce_loss_on": cmd_induce_loss_on,
         "induce_loss_off": cmd_induce_loss_off,
+        "set_fec": cmd_set_fec,
+        "set_file_rate": cmd_set_file_rate,
+        "transfer_stats": cmd_transfer_stats,
     }
     return commands
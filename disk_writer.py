@@ -0,0 +1,192 @@
+# disk_writer.py
+import os
+import queue
+import shutil
+import threading
+from utils import encode_message, parse_message
+
+SAVE_DIR = "received_files"
+
+
+def create_part_file(file_id: str, filesize: int):
+    """
+    Preallocate the temporary file a transfer is written into, returns
+    (path, file object). Chunks are written at their offsets as they arrive.
+    """
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    path = os.path.join(SAVE_DIR, f".{file_id}.part")
+    f = open(path, "w+b")
+    try:
+        if hasattr(os, "posix_fallocate") and filesize:
+            os.posix_fallocate(f.fileno(), 0, filesize)
+        else:
+            f.truncate(filesize)
+    except OSError:
+        f.truncate(filesize)  # e.g. filesystems without fallocate support
+    return path, f
+
+
+def open_part_file(file_id: str, filesize: int):
+    """Reopen the part file of an interrupted transfer without truncating it"""
+    path = os.path.join(SAVE_DIR, f".{file_id}.part")
+    f = open(path, "r+b")
+    if os.fstat(f.fileno()).st_size != filesize:
+        f.close()
+        raise OSError(f"{path} does not have the expected size")
+    return path, f
+
+
+def read_at(f, offset: int, length: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), length, offset)
+    f.seek(offset)
+    return f.read(length)
+
+
+def write_at(f, offset: int, data: bytes):
+    if hasattr(os, "pwrite"):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def checkpoint_path(file_id: str) -> str:
+    return os.path.join(SAVE_DIR, f".{file_id}.state")
+
+
+def save_checkpoint(meta: dict, bitmap: bytes):
+    """
+    Write the LSNP-style meta block followed by the raw bitmap of blocks
+    already on disk. Goes through a temp file so a crash never leaves a
+    half written checkpoint.
+    """
+    path = checkpoint_path(meta["FILEID"])
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode_message(meta))
+        f.write(bitmap)
+    os.replace(tmp, path)
+
+
+def load_checkpoints():
+    """(meta, bitmap bytes) for every checkpoint in SAVE_DIR"""
+    if not os.path.isdir(SAVE_DIR):
+        return []
+    checkpoints = []
+    for name in os.listdir(SAVE_DIR):
+        if not (name.startswith(".") and name.endswith(".state")):
+            continue
+        try:
+            with open(os.path.join(SAVE_DIR, name), "rb") as f:
+                head, _, bitmap = f.read().partition(b"\n\n")
+            meta = parse_message(head.decode("utf-8") + "\n\n")
+        except (OSError, UnicodeDecodeError):
+            continue
+        checkpoints.append((meta, bitmap))
+    return checkpoints
+
+
+def remove_checkpoint(file_id: str):
+    try:
+        os.remove(checkpoint_path(file_id))
+    except OSError:
+        pass
+
+
+def index_path() -> str:
+    return os.path.join(SAVE_DIR, ".index")
+
+
+def save_content_index(entries: dict):
+    """
+    sha256 -> (size, mtime_ns, name) of the finished files in SAVE_DIR, one
+    "hash size mtime_ns name" line each. Temp file first, like checkpoints.
+    """
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    path = index_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for filehash, (size, mtime_ns, name) in entries.items():
+            f.write(f"{filehash} {size} {mtime_ns} {name}\n")
+    os.replace(tmp, path)
+
+
+def load_content_index() -> dict:
+    """Inverse of save_content_index, whether the files are unchanged is up to the caller"""
+    entries = {}
+    try:
+        with open(index_path(), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    filehash, size, mtime_ns, name = line.rstrip("\n").split(" ", 3)
+                    entries[filehash] = (int(size), int(mtime_ns), name)
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def link_or_copy(src: str, dst: str):
+    """Hardlink src as dst, or copy it where links aren't possible (other filesystem, FAT...)"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def unique_path(filename: str) -> str:
+    """received_files/name.ext, or name_N.ext if that already exists"""
+    base_name, ext = os.path.splitext(os.path.basename(filename))
+    filepath = os.path.join(SAVE_DIR, f"{base_name}{ext}")
+    counter = 1
+    while os.path.exists(filepath):
+        filepath = os.path.join(SAVE_DIR, f"{base_name}_{counter}{ext}")
+        counter += 1
+    return filepath
+
+
+class DiskWriter:
+    """
+    Background I/O thread for received files. Handlers only queue the write,
+    so a slow disk (or the final rename) never holds up packet processing.
+    The queue is bounded so memory stays flat if the disk falls behind.
+    """
+
+    def __init__(self, max_pending=256):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, f, offset: int, data: bytes, done=None):
+        """done(offset, data) runs on the writer thread once the data is written"""
+        self._put(self._write, (f, offset, data, done))
+
+    def call(self, func, *args):
+        """Run func on the writer thread after every write queued before it"""
+        self._put(func, args)
+
+    def _put(self, func, args):
+        if threading.current_thread() is self._thread:
+            # queued from a job, e.g. share_file after assemble_file: waiting
+            # for room in our own full queue would never end, run it now
+            func(*args)
+        else:
+            self._queue.put((func, args))
+
+    def _write(self, f, offset, data, done):
+        write_at(f, offset, data)
+        if done is not None:
+            done(offset, data)
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"[ERROR] File write failed: {e}")
@@ -1,6 +1,7 @@
 # dm.py
 import socket
 import uuid
+import avatar
 import net_comms
 from ack import send_ack, send_with_ack
 import utils.globals as globals
@@ -38,11 +39,8 @@ def send_dm(
             ),
         }
 
-        # Add avatar fields if avatar data exists
-        if app_state.avatar_data:
-            message["AVATAR_TYPE"] = "text"
-            message["AVATAR_ENCODING"] = "base64"
-            message["AVATAR_DATA"] = app_state.avatar_data
+        # inline art too if they don't fetch it by hash
+        avatar.add_avatar(message, app_state, [target_user_id])
 
         # sock.send(build_message(message).encode('utf-8'), (target_user["ip"], globals.PORT))
 
@@ -99,7 +97,7 @@ def handle_dm(
     if timestamp_ttl - timestamp_now > 0 and scope == "chat":
         send_ack(sock, message["MESSAGE_ID"], sender_ip, app_state)
         display_name = app_state.peers[user_id]["display_name"]
-        avatar_data = message.get("AVATAR_DATA", "")
+        avatar_hash = avatar.from_message(sock, app_state, message, user_id, sender_ip)
 
         # Save received DM to app state
         with app_state.lock:
@@ -114,10 +112,8 @@ def handle_dm(
                 "token": message["TOKEN"],
                 "message_id": message["MESSAGE_ID"],
             }
-            if avatar_data:
-                dm_entry["avatar_data"] = avatar_data
-                dm_entry["avatar_type"] = message.get("AVATAR_TYPE", "")
-                dm_entry["avatar_encoding"] = message.get("AVATAR_ENCODING", "")
+            if avatar_hash:
+                dm_entry["avatar_hash"] = avatar_hash
             app_state.dm_messages[user_id].append(dm_entry)
 
         if globals.verbose:
@@ -129,21 +125,16 @@ def handle_dm(
             print(f"Display Name : {display_name}")
             print(f"Message Id : {message['MESSAGE_ID']}")
             print(f"Content      : {content}")
-            if avatar_data:
-                print(f"Avatar Type  : {message.get('AVATAR_TYPE', '')}")
-                print(f"Avatar Encoding : {message.get('AVATAR_ENCODING', '')}")
-                # Decode base64 avatar for verbose display
-                from utils.utils import decode_avatar_data
-
-                decoded_avatar = decode_avatar_data(avatar_data)
-                print(f"Avatar Data  :\n{decoded_avatar}")
+            if avatar_hash:
+                print(f"Avatar Hash  : {avatar_hash}")
             print(f"Status       : RECEIVED\n")
         print(f"\n[DM] {display_name} chatted you: {content}")
-        if avatar_data:
-            from utils.utils import display_avatar
-
-            display_avatar(avatar_data)
+        avatar.show_avatar(app_state, avatar_hash)
         print(end="\n\n")
     else:
         if globals.verbose:
             print("\n[ERROR]: TOKEN invalid\n")
+
+
+def register_handlers(dispatcher):
+    dispatcher.register("DM", handle_dm, needs_sock=True, needs_addr=True)
@@ -0,0 +1,47 @@
+# fec.py
+# XOR parity over groups of file chunks. One FILE_PARITY per group lets the
+# receiver rebuild any single lost chunk of that group without a round trip.
+import utils.globals as globals
+
+
+def group_size(window, sent: int) -> int:
+    """
+    Chunks per parity chunk for the next group, 0 for no parity.
+
+    globals.FEC_GROUP is 0 (off), a fixed group size, or "auto": once
+    FEC_SAMPLES chunks are out, size groups so about half a chunk per group
+    is expected to be lost, since one parity chunk only repairs one loss.
+    """
+    if globals.FEC_GROUP != "auto":
+        return int(globals.FEC_GROUP)
+    if sent < globals.FEC_SAMPLES:
+        return 0
+    # chunks the receiver rebuilt were lost too, they just never got retransmitted
+    loss = (window.retransmits + window.recovered) / sent
+    if loss < globals.FEC_MIN_LOSS:
+        return 0
+    return max(2, min(round(0.5 / loss) - 1, globals.FEC_MAX_GROUP))
+
+
+def new_group(size: int, first_index: int, offset: int) -> dict:
+    return {"size": size, "first": first_index, "offset": offset, "lengths": [], "parity": 0}
+
+
+def add_chunk(group: dict, data: bytes) -> bool:
+    """XOR data into the group's parity, returns True once the group is full"""
+    group["lengths"].append(len(data))
+    # XOR as little endian ints, shorter chunks are implicitly zero padded
+    group["parity"] ^= int.from_bytes(data, "little")
+    return len(group["lengths"]) >= group["size"]
+
+
+def parity_bytes(group: dict) -> bytes:
+    return group["parity"].to_bytes(max(group["lengths"]), "little")
+
+
+def rebuild(parity: bytes, others, length: int) -> bytes:
+    """The one missing chunk of a group, from its parity and every other chunk"""
+    value = int.from_bytes(parity, "little")
+    for data in others:
+        value ^= int.from_bytes(data, "little")
+    return value.to_bytes(len(parity), "little")[:length]
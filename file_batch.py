@@ -0,0 +1,280 @@
+# file_batch.py
+# Folders (or many small files) as one transfer. The stream is a manifest,
+# one "size relative/path" line per file, followed by the files' contents
+# back to back. It is offered, accepted, chunked, acked and resumed like a
+# single file (FILE_OFFER with BATCH:"1"), and the receiver unpacks every
+# file into received_files/<folder>/ as soon as the in-order part of the
+# stream covers it, so one prompt and one FILE_RECEIVED cover them all.
+import bisect
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import PurePosixPath
+import utils.globals as globals
+from utils import encode_message
+from disk_writer import read_at, unique_path
+
+IO_SIZE = 1 << 20
+
+
+# --- sender side ---------------------------------------------------------
+
+
+def collect_files(root: str) -> list:
+    """(relative posix path, path, size) of every regular file under root, in a stable order"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            relpath = os.path.relpath(path, root).replace(os.sep, "/")
+            if "\n" in relpath or safe_relpath(relpath) is None:
+                print(f"[WARN] Skipping {path}, its name can't be sent")
+                continue
+            files.append((relpath, path, os.path.getsize(path)))
+    return files
+
+
+def build_manifest(files) -> bytes:
+    return "".join(f"{size} {relpath}\n" for relpath, _, size in files).encode("utf-8")
+
+
+class BatchData:
+    """
+    The stream as one sliceable byte string, like the mmap of a single
+    file: manifest + contents, read on demand. Only one file is open at a
+    time, sends mostly go forward.
+    """
+
+    def __init__(self, manifest: bytes, files):
+        self.manifest = manifest
+        self.files = files  # (path, size)
+        self.starts = []
+        offset = len(manifest)
+        for _, size in files:
+            self.starts.append(offset)
+            offset += size
+        self.size = offset
+        self._open = None  # (index, file object)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key: slice) -> bytes:
+        start, stop, _ = key.indices(self.size)
+        parts = []
+        if start < len(self.manifest):
+            parts.append(self.manifest[start:stop])
+            start = len(self.manifest)
+        index = bisect.bisect_right(self.starts, start) - 1
+        while start < stop and index < len(self.files):
+            end = min(stop, self.starts[index] + self.files[index][1])
+            if start < end:
+                parts.append(read_at(self._file(index), start - self.starts[index], end - start))
+                start = end
+            index += 1
+        return b"".join(parts)
+
+    def _file(self, index: int):
+        if self._open is None or self._open[0] != index:
+            self.close()
+            self._open = (index, open(self.files[index][0], "rb"))
+        return self._open[1]
+
+    def close(self):
+        if self._open is not None:
+            self._open[1].close()
+            self._open = None
+
+
+def open_batch(batch: dict, filesize: int):
+    """BatchData of an offered batch, None if a file changed size since the offer"""
+    for path, size in batch["files"]:
+        if os.path.getsize(path) != size:
+            return None
+    data = BatchData(batch["manifest"], batch["files"])
+    return data if len(data) == filesize else None
+
+
+def stream_hash(data: BatchData) -> str:
+    digest = hashlib.sha256()
+    for offset in range(0, len(data), IO_SIZE):
+        digest.update(data[offset : offset + IO_SIZE])
+    data.close()
+    return digest.hexdigest()
+
+
+def send_batch(sock, app_state, to_user_id, root, description=""):
+    from file_transfer import max_chunk_size_for
+
+    if "@" not in to_user_id or len(to_user_id.split("@")) < 2:
+        print("Invalid user ID format. Expected format: username@ip_address")
+        return
+    try:
+        files = collect_files(root)
+        if not files:
+            print("No files to send.")
+            return
+        manifest = build_manifest(files)
+        batch = {"manifest": manifest, "files": [(path, size) for _, path, size in files]}
+        filehash = stream_hash(BatchData(manifest, batch["files"]))
+    except OSError as e:
+        print(f"[ERROR] Could not read {root}: {e}")
+        return
+    filesize = len(manifest) + sum(size for _, size in batch["files"])
+
+    file_id = uuid.uuid4().hex[:8]
+    timestamp = int(time.time())
+    token = f"{app_state.user_id}|{timestamp + globals.POST_TTL}|file"
+    to_ip = to_user_id.split("@")[1]
+    name = os.path.basename(os.path.normpath(root))
+
+    offer_msg = {
+        "TYPE": "FILE_OFFER",
+        "FROM": app_state.user_id,
+        "TO": to_user_id,
+        "FILENAME": name,
+        "FILESIZE": filesize,
+        "FILETYPE": "inode/directory",
+        "FILEID": file_id,
+        "DESCRIPTION": description,
+        "TIMESTAMP": timestamp,
+        "TOKEN": token,
+        "SACK": "1",
+        "FILEHASH": filehash,  # of the whole stream
+        "MAX_CHUNK_SIZE": max_chunk_size_for(to_ip),
+        "BATCH": "1",
+        "MANIFEST_SIZE": len(manifest),
+        "FILECOUNT": len(files),
+    }
+    if globals.BINARY_CHUNKS:
+        offer_msg["BINARY"] = "1"
+    sock.sendto(encode_message(offer_msg), (to_ip, globals.PORT))
+
+    with app_state.lock:
+        app_state.pending_file_sends[file_id] = {
+            "sock": sock,
+            "to_user_id": to_user_id,
+            "to_ip": to_ip,
+            "token": token,
+            "filesize": filesize,
+            "filepath": root,
+            "batch": batch,
+        }
+
+    print(
+        f"[SENT FILE OFFER] {root} ({len(files)} files, {filesize} bytes) to {to_user_id}"
+    )
+    print(f"Waiting for FILE_ACCEPTED to send chunks...")
+
+
+# --- receiver side -------------------------------------------------------
+
+
+def safe_relpath(name: str):
+    """The path parts of a manifest entry, None if it could leave the folder"""
+    path = PurePosixPath(name)
+    if path.is_absolute() or "\\" in name or ":" in name:
+        return None
+    parts = name.split("/")
+    if any(part in ("", ".", "..") for part in parts):
+        return None
+    return parts
+
+
+def new_batch(offer, dest=None) -> dict:
+    return {
+        "manifest_size": offer["manifest_size"],
+        "count": offer["count"],
+        "dest": dest,  # received_files/<folder>, made when accepted
+        "entries": None,  # (offset, size, path), parsed once the manifest is in
+        "next": 0,  # entries before this one are unpacked
+        "error": None,
+    }
+
+
+def start_batch(filename: str, offer_batch: dict) -> dict:
+    dest = unique_path(filename)
+    os.makedirs(dest)
+    return new_batch(offer_batch, dest)
+
+
+def parse_manifest(text: str, batch: dict, filesize: int) -> list:
+    entries = []
+    offset = batch["manifest_size"]
+    if not text.endswith("\n"):
+        raise ValueError("truncated manifest")
+    for line in text[:-1].split("\n"):
+        size, _, name = line.partition(" ")
+        parts = safe_relpath(name)
+        if parts is None or not size.isdigit():
+            raise ValueError(f"bad manifest entry {line!r}")
+        entries.append((offset, int(size), os.path.join(batch["dest"], *parts)))
+        offset += int(size)
+    if offset != filesize or len(entries) != batch["count"]:
+        raise ValueError("manifest doesn't match the offer")
+    return entries
+
+
+def extract_ready(transfer):
+    """
+    Runs on the disk writer thread after every write. Unpacks each file the
+    in-order prefix of the stream (digest_offset) fully covers.
+    """
+    batch = transfer["batch"]
+    prefix = transfer["digest_offset"]
+    if batch["error"] is not None:
+        return
+    try:
+        if batch["entries"] is None:
+            if prefix < batch["manifest_size"]:
+                return
+            manifest = read_at(transfer["file"], 0, batch["manifest_size"])
+            batch["entries"] = parse_manifest(
+                manifest.decode("utf-8"), batch, transfer["filesize"]
+            )
+        entries = batch["entries"]
+        while batch["next"] < len(entries):
+            offset, size, path = entries[batch["next"]]
+            if offset + size > prefix:
+                break
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as out:
+                for start in range(offset, offset + size, IO_SIZE):
+                    out.write(read_at(transfer["file"], start, min(IO_SIZE, offset + size - start)))
+            batch["next"] += 1
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        print(f"[ERROR] Could not unpack {transfer['filename']}: {e}")
+        batch["error"] = e
+
+
+def discard_batch(transfer):
+    """The stream was bad, don't leave half of it behind"""
+    if transfer["batch"]["dest"]:
+        shutil.rmtree(transfer["batch"]["dest"], ignore_errors=True)
+
+
+def checkpoint_fields(batch: dict) -> dict:
+    return {
+        "BATCH_MANIFEST_SIZE": batch["manifest_size"],
+        "BATCH_COUNT": batch["count"],
+        "BATCH_DEST": batch["dest"],
+        "BATCH_NEXT": batch["next"],
+    }
+
+
+def load_batch(meta) -> dict:
+    """From checkpoint_fields, raises KeyError/ValueError like load_transfer expects"""
+    batch = new_batch(
+        {
+            "manifest_size": int(meta["BATCH_MANIFEST_SIZE"]),
+            "count": int(meta["BATCH_COUNT"]),
+        },
+        meta["BATCH_DEST"],
+    )
+    batch["next"] = int(meta["BATCH_NEXT"])
+    return batch
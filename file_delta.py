@@ -0,0 +1,449 @@
+# file_delta.py
+# rsync style delta transfers. When the receiver already has an older copy
+# of an offered file in received_files/ it sends a signature of it instead
+# of FILE_ACCEPTED: per block an Adler-32 (rolling) and an 8 byte BLAKE2b
+# (strong) checksum, in FILE_SIGNATURE messages. The sender slides a window
+# over its file, and wherever the window matches a block of the old copy it
+# emits a copy instruction instead of the bytes. The resulting delta stream
+# (literal data plus copy instructions) goes through the normal FILE_CHUNK
+# flow as if it were the file, the receiver rebuilds the file from it and
+# its old copy and checks the result against the offer's FILEHASH.
+import base64
+import hashlib
+import math
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zlib
+import utils.globals as globals
+from ack import send_ack, send_with_ack
+from disk_writer import SAVE_DIR, read_at
+
+SIGNATURE_ENTRY = struct.Struct(">I8s")  # adler32, blake2b-64
+COPY = struct.Struct(">II")  # first block, block count
+LITERAL = struct.Struct(">I")  # length, the data follows
+ADLER_MOD = 65521
+IO_SIZE = 1 << 20
+
+
+def block_size_for(basis_size: int) -> int:
+    """About sqrt(size) like rsync, whole CHUNK_SIZE blocks between 1 and 64 KB"""
+    size = int(math.sqrt(basis_size)) // globals.CHUNK_SIZE * globals.CHUNK_SIZE
+    return max(1024, min(size, 64 * 1024))
+
+
+def strong_sum(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+def find_basis(filename: str):
+    """Newest name.ext or name_N.ext in SAVE_DIR, the copy an update most likely replaces"""
+    base_name, ext = os.path.splitext(os.path.basename(filename))
+    best = None
+    try:
+        names = os.listdir(SAVE_DIR)
+    except OSError:
+        return None
+    for name in names:
+        stem, name_ext = os.path.splitext(name)
+        if name_ext != ext:
+            continue
+        suffix = stem[len(base_name) + 1 :]
+        if stem != base_name and not (
+            stem.startswith(base_name + "_") and suffix.isdigit()
+        ):
+            continue
+        path = os.path.join(SAVE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if not stat.S_ISREG(st.st_mode) or not st.st_size:
+            continue  # e.g. a received folder
+        if best is None or st.st_mtime > best[0]:
+            best = (st.st_mtime, path)
+    return best[1] if best else None
+
+
+def signature(path: str, block_size: int) -> bytes:
+    parts = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            parts.append(SIGNATURE_ENTRY.pack(zlib.adler32(block), strong_sum(block)))
+    return b"".join(parts)
+
+
+def compute_delta(data, sig: bytes, block_size: int, basis_size: int, out, max_literal: int):
+    """
+    Write the delta of data against the signature to out. Returns the literal
+    byte count, or None as soon as it would exceed max_literal.
+
+    The window checksum is only rolled byte by byte (in Python) where nothing
+    matches, after a match the next window's Adler-32 comes from zlib, so an
+    unchanged file is mostly C speed. Rolling is slow, so a run of
+    DELTA_PROBE_BLOCKS blocks without a match also gives up if more of what
+    was scanned so far is new than max_literal allows for the whole file:
+    an unrelated file that only shares the name costs a probe, not a full
+    scan. A file whose first probe is all new goes whole as well.
+    """
+    table = {}  # adler32 -> {strong -> block index}
+    blocks = len(sig) // SIGNATURE_ENTRY.size
+    for index in range(blocks):
+        weak, strong = SIGNATURE_ENTRY.unpack_from(sig, index * SIGNATURE_ENTRY.size)
+        table.setdefault(weak, {}).setdefault(strong, index)
+    last_size = basis_size - (blocks - 1) * block_size if blocks else 0
+
+    n = len(data)
+    literal = 0
+    pending = [None]  # copy run [first, count] not written yet
+
+    def flush_copy():
+        if pending[0] is not None:
+            out.write(b"C" + COPY.pack(*pending[0]))
+            pending[0] = None
+
+    def emit_literal(start, end):
+        nonlocal literal
+        if start >= end:
+            return
+        flush_copy()
+        literal += end - start
+        for offset in range(start, end, IO_SIZE):
+            piece = data[offset : min(offset + IO_SIZE, end)]
+            out.write(b"L" + LITERAL.pack(len(piece)))
+            out.write(piece)
+
+    def emit_copy(index):
+        run = pending[0]
+        if run is not None and run[0] + run[1] == index:
+            run[1] += 1
+        else:
+            flush_copy()
+            pending[0] = [index, 1]
+
+    pos = 0
+    literal_start = 0
+    B = block_size
+    probe = globals.DELTA_PROBE_BLOCKS * B
+    window = None  # adler32 of data[pos:pos + B], None = recompute
+    while pos + B <= n:
+        if window is None:
+            window = zlib.adler32(data[pos : pos + B])
+        candidates = table.get(window)
+        if candidates:
+            index = candidates.get(strong_sum(data[pos : pos + B]))
+            if index is not None and (index < blocks - 1 or last_size == B):
+                emit_literal(literal_start, pos)
+                emit_copy(index)
+                pos += B
+                literal_start = pos
+                window = None
+                continue
+        run = pos - literal_start
+        if literal + run > max_literal or (
+            run >= probe and (literal + run) * n > max_literal * pos
+        ):
+            return None
+        if pos + B >= n:
+            break
+        # roll one byte: drop data[pos], take in data[pos + B]
+        x_out = data[pos]
+        a = window & 0xFFFF
+        b = window >> 16
+        a = (a - x_out + data[pos + B]) % ADLER_MOD
+        b = (b - B * x_out + a - 1) % ADLER_MOD
+        window = (b << 16) | a
+        pos += 1
+
+    # the basis' last block is usually short, it can only match our tail
+    tail = n - literal_start
+    if blocks and 0 < last_size < B and tail >= last_size:
+        start = n - last_size
+        piece = data[start:n]
+        weak_match = table.get(zlib.adler32(piece), {})
+        if weak_match.get(strong_sum(piece)) == blocks - 1:
+            emit_literal(literal_start, start)
+            emit_copy(blocks - 1)
+            literal_start = n
+    emit_literal(literal_start, n)
+    flush_copy()
+    return literal if literal <= max_literal else None
+
+
+def apply_delta(delta, basis, block_size: int, basis_size: int):
+    """Yields the rebuilt file in pieces, ValueError if the delta is malformed"""
+    while True:
+        op = delta.read(1)
+        if not op:
+            return
+        if op == b"C":
+            first, count = COPY.unpack(delta.read(COPY.size))
+            offset = first * block_size
+            end = min(offset + count * block_size, basis_size)
+            if offset >= end:
+                raise ValueError("copy outside of the old file")
+            while offset < end:
+                piece = read_at(basis, offset, min(IO_SIZE, end - offset))
+                if not piece:
+                    raise ValueError("old file is shorter than its signature")
+                yield piece
+                offset += len(piece)
+        elif op == b"L":
+            (length,) = LITERAL.unpack(delta.read(LITERAL.size))
+            piece = delta.read(length)
+            if len(piece) != length:
+                raise ValueError("truncated literal")
+            yield piece
+        else:
+            raise ValueError(f"unknown delta op {op!r}")
+
+
+# --- receiver side -------------------------------------------------------
+
+
+def request_delta(sock, app_state, file_id, offer, basis, chunk_size) -> bool:
+    """Send the signature of basis instead of accepting the full file"""
+    try:
+        basis_size = os.path.getsize(basis)
+        block_size = block_size_for(basis_size)
+        sig = signature(basis, block_size)
+    except OSError as e:
+        print(f"[ERROR] Could not read {basis}, transferring the whole file: {e}")
+        return False
+
+    with app_state.lock:
+        app_state.pending_deltas[file_id] = {
+            "offer": offer,
+            "basis": basis,
+            "basis_size": basis_size,
+            "block_size": block_size,
+        }
+
+    to_id = offer["from"]
+    to_ip = to_id.split("@")[1]
+    # entries per message, sized like file chunks so nothing fragments
+    per_part = max(1, chunk_size // SIGNATURE_ENTRY.size) * SIGNATURE_ENTRY.size
+    parts = max(1, -(-len(sig) // per_part))
+    for part in range(parts):
+        data = sig[part * per_part : (part + 1) * per_part]
+        message = {
+            "TYPE": "FILE_SIGNATURE",
+            "FROM": app_state.user_id,
+            "TO": to_id,
+            "FILEID": file_id,
+            "MESSAGE_ID": f"{file_id}_sig_{part}",
+            "PART": part,
+            "PARTS": parts,
+            "BLOCK_SIZE": block_size,
+            "BASIS_SIZE": basis_size,
+            "DATA": base64.b64encode(data).decode("utf-8"),
+            "TIMESTAMP": str(int(time.time())),
+        }
+        send_with_ack(sock, message, app_state, to_ip)
+
+    print(
+        f"Accepted file offer for {offer['filename']}, asking only for what "
+        f"changed since {os.path.basename(basis)}..."
+    )
+    if globals.verbose:
+        print(
+            f"[INFO] FILE_SIGNATURE for file_id={file_id}: {len(sig) // SIGNATURE_ENTRY.size} "
+            f"blocks of {block_size} bytes in {parts} messages"
+        )
+    return True
+
+
+def handle_file_delta(message, app_state, sock, sender_ip):
+    """The sender's answer to our signature, receive the delta (or the whole file)"""
+    file_id = message["FILEID"]
+    delta_size = None
+    if message.get("MODE") == "DELTA":
+        try:
+            delta_size = int(message["DELTA_SIZE"])
+        except (KeyError, ValueError):
+            delta_size = -1
+        if delta_size < 0:
+            # not ACKed and still pending, the sender sends it again
+            if globals.verbose:
+                print(f"[DEBUG] Malformed FILE_DELTA for file_id={file_id}, ignoring.")
+            return
+    send_ack(sock, message["MESSAGE_ID"], sender_ip, app_state)
+    with app_state.lock:
+        pending = app_state.pending_deltas.pop(file_id, None)
+    if pending is None:
+        return  # a retransmit, we already answered
+
+    # back through accept_file, which sends FILE_ACCEPTED for the stream
+    offer = dict(pending["offer"], delta=False)
+    if delta_size is not None:
+        offer["delta_target"] = {
+            "basis": pending["basis"],
+            "basis_size": pending["basis_size"],
+            "block_size": pending["block_size"],
+            "filesize": offer["filesize"],
+            "filehash": offer["filehash"],
+        }
+        offer["filesize"] = delta_size
+        offer["filehash"] = ""  # checked on the rebuilt file instead
+        print(
+            f"[INFO] {offer['filename']}: receiving {offer['filesize']} bytes "
+            f"of changes instead of {pending['offer']['filesize']}"
+        )
+    app_state.pending_file_offers[file_id] = offer
+
+    from file_transfer import accept_file
+
+    accept_file(file_id, app_state, sock)
+
+
+def rebuild_file(transfer):
+    """
+    Runs on the disk writer thread once the delta stream is complete.
+    Returns the path of the rebuilt file, or None if it doesn't match the
+    offered hash (the old copy changed meanwhile, or a checksum collision).
+    """
+    target = transfer["delta"]
+    out_path = os.path.join(SAVE_DIR, f".{transfer['checkpoint_id']}.out")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(transfer["part_path"], "rb") as delta, open(
+            target["basis"], "rb"
+        ) as basis, open(out_path, "wb") as out:
+            for piece in apply_delta(
+                delta, basis, target["block_size"], target["basis_size"]
+            ):
+                out.write(piece)
+                digest.update(piece)
+                size += len(piece)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[ERROR] Could not rebuild {transfer['filename']}: {e}")
+        ok = False
+    else:
+        ok = size == target["filesize"] and digest.hexdigest() == target["filehash"]
+    if not ok:
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+        return None
+    os.remove(transfer["part_path"])
+    return out_path
+
+
+# --- sender side ---------------------------------------------------------
+
+
+def handle_file_signature(message, app_state, sock, sender_ip):
+    send_ack(sock, message["MESSAGE_ID"], sender_ip, app_state)
+    file_id = message["FILEID"]
+    try:
+        part = int(message["PART"])
+        parts = int(message["PARTS"])
+        block_size = int(message["BLOCK_SIZE"])
+        basis_size = int(message["BASIS_SIZE"])
+        data = base64.b64decode(message["DATA"], validate=True)
+    except (KeyError, ValueError):
+        if globals.verbose:
+            print(f"[DEBUG] Malformed FILE_SIGNATURE for file_id={file_id}, ignoring.")
+        return
+
+    with app_state.lock:
+        send_info = app_state.pending_file_sends.get(file_id)
+        if send_info is None:
+            return
+        state = send_info.setdefault(
+            "signature",
+            {"parts": {}, "building": False},
+        )
+        state["parts"][part] = data
+        ready = len(state["parts"]) == parts and not state["building"]
+        if ready:
+            state["building"] = True
+            sig = b"".join(state["parts"][n] for n in range(parts))
+            send_info = dict(send_info)
+
+    if ready:
+        # CPU bound and possibly long, so not on a handler thread
+        threading.Thread(
+            target=send_delta,
+            args=(sock, app_state, file_id, send_info, sig, block_size, basis_size, sender_ip),
+            daemon=True,
+        ).start()
+
+
+def send_delta(sock, app_state, file_id, send_info, sig, block_size, basis_size, to_ip):
+    filesize = send_info["filesize"]
+    delta_path = None
+    literal = None
+    try:
+        with open(send_info["filepath"], "rb") as f:
+            data = b""
+            if filesize:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                fd, delta_path = tempfile.mkstemp(prefix=f"lsnp-{file_id}-", suffix=".delta")
+                with os.fdopen(fd, "wb") as out:
+                    literal = compute_delta(
+                        data,
+                        sig,
+                        block_size,
+                        basis_size,
+                        out,
+                        int(filesize * globals.DELTA_MAX_LITERAL),
+                    )
+            finally:
+                if filesize:
+                    data.close()
+    except OSError as e:
+        print(f"[ERROR] Could not compute the delta of {send_info['filepath']}: {e}")
+
+    message = {
+        "TYPE": "FILE_DELTA",
+        "FROM": app_state.user_id,
+        "TO": send_info["to_user_id"],
+        "FILEID": file_id,
+        "MESSAGE_ID": f"{file_id}_delta",
+        "TIMESTAMP": str(int(time.time())),
+    }
+    if literal is None:
+        # too different to be worth it, the receiver accepts the whole file
+        if delta_path is not None:
+            os.remove(delta_path)
+        message["MODE"] = "FULL"
+        print(f"[INFO] {send_info['filepath']} changed too much, sending all of it")
+    else:
+        delta_size = os.path.getsize(delta_path)
+        with app_state.lock:
+            current = app_state.pending_file_sends.get(file_id)
+            if current is not None:
+                # from now on this send is the delta stream, FILE_RESUME included
+                current["filesize"] = delta_size
+                current["delta_path"] = delta_path
+        if current is None:
+            os.remove(delta_path)  # the offer is gone meanwhile
+            return
+        message["MODE"] = "DELTA"
+        message["DELTA_SIZE"] = delta_size
+        print(
+            f"[INFO] Delta for {send_info['filepath']}: {literal} new bytes, "
+            f"{delta_size}/{filesize} bytes to send"
+        )
+    send_with_ack(sock, message, app_state, to_ip)
+
+
+def register_handlers(dispatcher):
+    dispatcher.register(
+        "FILE_SIGNATURE",
+        handle_file_signature,
+        lossy=True,
+        needs_sock=True,
+        needs_addr=True,
+    )
+    dispatcher.register(
+        "FILE_DELTA", handle_file_delta, lossy=True, needs_sock=True, needs_addr=True
+    )
@@ -0,0 +1,355 @@
+# file_multicast.py
+# One to many file sends. Every recipient gets its own FILE_OFFER, but the
+# chunks go out once to the broadcast address (or globals.MULTICAST_GROUP)
+# instead of once per recipient. Nobody ACKs them: each receiver NACKs only
+# the ranges it is missing (file_transfer.check_stall) and the sender
+# re-broadcasts the union of what was asked for, until every recipient sent
+# FILE_RECEIVED or nobody said anything for MULTI_IDLE seconds.
+import base64
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from functools import partial
+import utils.globals as globals
+from utils import encode_message, parse_ranges
+from transfer_engine import TokenBucket
+from file_transfer import (
+    file_type,
+    get_transfer_engine,
+    max_chunk_size_for,
+    sha256_file,
+    share_file,
+)
+
+
+def multi_destination(app_state) -> str:
+    return globals.MULTICAST_GROUP or app_state.broadcast_ip
+
+
+def group_recipients(app_state, target: str) -> list:
+    """User ids for a group id we own or joined, or a comma separated list of user ids"""
+    group = app_state.owned_groups.get(target) or app_state.joined_groups.get(target)
+    if group is not None:
+        members = group.get("MEMBERS", set())
+    else:
+        members = [user_id.strip() for user_id in target.split(",")]
+    return sorted(
+        user_id
+        for user_id in members
+        if "@" in user_id and user_id != app_state.user_id
+    )
+
+
+def send_file_multi(sock, app_state, recipients, filepath, description=""):
+    if not recipients:
+        print("No recipients.")
+        return
+    if not os.path.isfile(filepath):
+        print("File not found.")
+        return
+
+    filesize = os.path.getsize(filepath)
+    try:
+        filehash = sha256_file(filepath)
+    except OSError as e:
+        print(f"[ERROR] Could not read {filepath}: {e}")
+        return
+
+    file_id = uuid.uuid4().hex[:8]
+    timestamp = int(time.time())
+    token = f"{app_state.user_id}|{timestamp + globals.POST_TTL}|file"
+    to_ip = multi_destination(app_state)
+    # one size for everyone, chunk i is always the same bytes
+    chunk_size = max_chunk_size_for(to_ip)
+
+    session = {
+        "file_id": file_id,
+        "sock": sock,
+        "filepath": filepath,
+        "filesize": filesize,
+        "token": token,
+        "to_ip": to_ip,
+        "chunk_size": chunk_size,
+        "total_chunks": max(1, -(-filesize // chunk_size)),
+        "recipients": set(recipients),
+        "accepted": set(),
+        "done": {},  # user_id -> FILE_RECEIVED status
+        "repair": set(),  # chunk indices some receiver NACKed
+        "started": False,
+        "bucket": TokenBucket(globals.MULTI_RATE_INITIAL),
+        "rate_at": time.monotonic(),  # last additive increase
+        "cut_at": 0.0,  # last multiplicative decrease
+        "last_activity": time.monotonic(),
+        "idle_timer": None,
+        "lock": threading.Lock(),
+    }
+    with app_state.lock:
+        app_state.multi_sends[file_id] = session
+    share_file(app_state, filehash, filepath, recipients)
+
+    for to_user_id in recipients:
+        offer_msg = {
+            "TYPE": "FILE_OFFER",
+            "FROM": app_state.user_id,
+            "TO": to_user_id,
+            "FILENAME": os.path.basename(filepath),
+            "FILESIZE": filesize,
+            "FILETYPE": file_type(filepath),
+            "FILEID": file_id,
+            "DESCRIPTION": description,
+            "TIMESTAMP": timestamp,
+            "TOKEN": token,
+            "FILEHASH": filehash,
+            "MULTI": "1",
+            "CHUNK_SIZE": chunk_size,
+        }
+        sock.sendto(
+            encode_message(offer_msg),
+            (to_user_id.split("@")[1], globals.PORT),
+        )
+
+    print(
+        f"[SENT FILE OFFER] {filepath} ({filesize} bytes) to {len(recipients)} "
+        f"recipients: {', '.join(recipients)}"
+    )
+    print(f"Chunks start going to {to_ip} with the first FILE_ACCEPTED...")
+
+
+def handle_multi_accepted(message, app_state):
+    file_id = message["FILEID"]
+    from_id = message["FROM"]
+    session = app_state.multi_sends.get(file_id)
+    if session is None:
+        return
+    with session["lock"]:
+        if from_id not in session["recipients"]:
+            print(f"[WARN] FILE_ACCEPTED for file_id={file_id} from {from_id}, not a recipient")
+            return
+        session["accepted"].add(from_id)
+        session["last_activity"] = time.monotonic()
+        start = not session["started"]
+        session["started"] = True
+
+    print(
+        f"[INFO] {from_id} accepted file_id={file_id} "
+        f"({len(session['accepted'])}/{len(session['recipients'])})"
+    )
+    if not start:
+        # the stream is already going, the new receiver NACKs what it missed
+        return
+    engine = get_transfer_engine(app_state)
+    engine.add(
+        file_id,
+        session["to_ip"],
+        session["filesize"],
+        None,
+        iter_multi_chunks(session, app_state),
+        bucket=session["bucket"],
+    )
+    print(f"[INFO] Queued file_id={file_id} for sending")
+
+
+def handle_multi_nack(message, app_state, sender_ip):
+    """A receiver's own gaps, queued for the next re-broadcast"""
+    file_id = message["FILEID"]
+    session = app_state.multi_sends.get(file_id)
+    if session is None:
+        return
+    try:
+        ranges = parse_ranges(message.get("MISSING", ""))
+    except ValueError:
+        if globals.verbose:
+            print(f"[DEBUG] Malformed FILE_NACK for file_id={file_id}, ignoring.")
+        return
+
+    total = session["total_chunks"]
+    with session["lock"]:
+        before = len(session["repair"])
+        for first, last in ranges:
+            session["repair"].update(range(max(first, 0), min(last + 1, total)))
+        queued = len(session["repair"]) - before
+        session["last_activity"] = time.monotonic()
+        # nothing clocks the stream, so losses are the only sign it is too fast
+        slow_down(session)
+
+    if globals.verbose:
+        print(f"\n[RECV <]")
+        print(f"Message Type : FILE_NACK")
+        print(f"From IP      : {sender_ip}")
+        print(f"File ID      : {file_id}")
+        print(f"Missing      : {message.get('MISSING', '')}")
+        print(f"Queued       : {queued}\n")
+    if app_state.transfer_engine is not None:
+        app_state.transfer_engine.wake()
+
+
+def handle_multi_received(message, app_state):
+    file_id = message["FILEID"]
+    from_id = message.get("FROM")
+    session = app_state.multi_sends.get(file_id)
+    if session is None:
+        return
+    status = message.get("STATUS", "COMPLETE")
+    with session["lock"]:
+        session["done"][from_id] = status
+        session["last_activity"] = time.monotonic()
+        done = len(session["done"])
+        # everyone already had it, the stream never started
+        unused = not session["started"] and session["recipients"] <= session["done"].keys()
+    if unused:
+        with app_state.lock:
+            app_state.multi_sends.pop(file_id, None)
+
+    if status != "COMPLETE":
+        print(f"[ERROR] File {file_id} arrived {status} at {from_id}")
+    else:
+        print(f"[INFO] {from_id} received file_id={file_id} ({done}/{len(session['recipients'])})")
+    if app_state.transfer_engine is not None:
+        app_state.transfer_engine.wake()
+
+
+def slow_down(session):
+    """Multiplicative decrease, at most once per MULTI_RATE_HOLD. Caller holds the lock"""
+    now = time.monotonic()
+    bucket = session["bucket"]
+    if now - session["cut_at"] < globals.MULTI_RATE_HOLD:
+        return
+    bucket.rate = max(bucket.rate * 0.75, globals.MULTI_RATE_MIN)
+    session["cut_at"] = now
+
+
+def speed_up(session):
+    """Additive increase for the time since the last call. Caller holds the lock"""
+    now = time.monotonic()
+    bucket = session["bucket"]
+    bucket.rate = min(
+        bucket.rate + globals.MULTI_RATE_STEP * (now - session["rate_at"]),
+        globals.MULTI_RATE_MAX,
+    )
+    session["rate_at"] = now
+
+
+def multi_finished(session) -> bool:
+    if session["recipients"] <= session["done"].keys():
+        return True
+    # the rest never accepted, or went away without a word
+    return time.monotonic() - session["last_activity"] > globals.MULTI_IDLE
+
+
+def multi_ready(session) -> bool:
+    return bool(session["repair"]) or multi_finished(session)
+
+
+def iter_multi_chunks(session, app_state):
+    """
+    Driven by the TransferEngine like iter_send_file_chunks, paced by the
+    session's own token bucket. Yields the bytes sent after every chunk, and
+    the predicate to wait on once there's nothing to repair.
+    """
+    filesize = session["filesize"]
+    try:
+        with open(session["filepath"], "rb") as f:
+            if os.fstat(f.fileno()).st_size != filesize:
+                print(f"[ERROR] {session['filepath']} changed since it was offered")
+                return
+            data = b""
+            if filesize:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield from _stream_chunks(session, app_state, data)
+            finally:
+                if filesize:
+                    data.close()
+    except OSError as e:
+        print(f"[ERROR] Could not read {session['filepath']}: {e}")
+    finally:
+        with app_state.lock:
+            app_state.multi_sends.pop(session["file_id"], None)
+        if session["idle_timer"] is not None:
+            session["idle_timer"].cancelled = True
+
+
+def _stream_chunks(session, app_state, data):
+    file_id = session["file_id"]
+    print(f"[SENDING CHUNKS] for file_id={file_id} to {session['to_ip']}")
+
+    for index in range(session["total_chunks"]):
+        yield send_multi_chunk(session, app_state, data, index)
+
+    repaired = 0
+    while True:
+        with session["lock"]:
+            repair = sorted(session["repair"])
+            session["repair"].clear()
+        for index in repair:
+            yield send_multi_chunk(session, app_state, data, index)
+        repaired += len(repair)
+        if repair:
+            continue
+        if multi_finished(session):
+            break
+        # NACKs and FILE_RECEIVED wake the engine, this timer the idle check
+        if session["idle_timer"] is not None:
+            session["idle_timer"].cancelled = True
+        session["idle_timer"] = app_state.scheduler.call_later(
+            globals.MULTI_IDLE + 0.1, app_state.transfer_engine.wake
+        )
+        yield partial(multi_ready, session)
+
+    done = [user_id for user_id, status in session["done"].items() if status == "COMPLETE"]
+    missing = sorted(session["recipients"] - session["done"].keys())
+    print(
+        f"[SENT FILE] {session['filepath']} ({session['filesize']} bytes) to "
+        f"{len(done)}/{len(session['recipients'])} recipients, "
+        f"{repaired} chunks re-broadcast"
+    )
+    if missing:
+        print(f"[WARN] No confirmation from: {', '.join(missing)}")
+
+
+def send_multi_chunk(session, app_state, data, index) -> int:
+    offset = index * session["chunk_size"]
+    chunk_data = data[offset : offset + session["chunk_size"]]
+    chunk_msg = {
+        "TYPE": "FILE_CHUNK",
+        "FROM": app_state.user_id,
+        "FILEID": session["file_id"],
+        "MULTI": "1",
+        "CHUNK_INDEX": index,
+        "TOTAL_CHUNKS": session["total_chunks"],
+        "CHUNK_SIZE": len(chunk_data),
+        "OFFSET": offset,
+        "CRC": format(zlib.crc32(chunk_data), "08x"),
+        "TOKEN": session["token"],
+        "DATA": base64.b64encode(chunk_data).decode("utf-8"),
+    }
+    try:
+        session["sock"].sendto(
+            encode_message(chunk_msg), (session["to_ip"], globals.PORT)
+        )
+    except OSError as e:
+        # e.g. ENOBUFS, as good as lost on the way: receivers NACK it
+        if globals.verbose:
+            print(f"[DEBUG] Chunk {index} of file_id={session['file_id']} not sent: {e}")
+        with session["lock"]:
+            slow_down(session)
+        return 0
+    with session["lock"]:
+        session["last_activity"] = time.monotonic()
+        speed_up(session)
+
+    if globals.verbose:
+        print(f"\n[SEND >]")
+        print(f"Message Type : FILE_CHUNK")
+        print(f"Timestamp    : {int(time.time())}")
+        print(f"From         : {app_state.user_id}")
+        print(f"To IP        : {session['to_ip']}")
+        print(f"File ID      : {session['file_id']}")
+        print(f"Chunk        : {index + 1}/{session['total_chunks']}")
+        print(f"Chunk Size   : {len(chunk_data)} bytes")
+        print(f"Rate         : {session['bucket'].rate / 1024:.0f} KB/s")
+        print(f"Status       : SENT\n")
+    return len(chunk_data)
@@ -0,0 +1,294 @@
+# file_swarm.py
+# Swarm downloads. Files are also known by their sha256 (FILEHASH): anyone
+# who sent or fully received a file can seed it. A receiver that accepts an
+# offer with swarm=True broadcasts FILE_WHO_HAS, and after SWARM_DISCOVERY
+# seconds it splits the chunks it is missing among the offering sender and
+# every peer that answered FILE_HAVE. Each seeder gets a FILE_REQUEST for
+# its own part under the same FILEID, and all chunks land in the same part
+# file. Chunk i is always the bytes at i * chunk_size, so every seeder's
+# CHUNK_INDEX means the same thing to the receiver. Only known peers with a
+# file token are served, and only files we offered them or got in a swarm
+# or one to many send ourselves (share_file's seed_to).
+import os
+import time
+import utils.globals as globals
+from utils import encode_message, format_ranges, parse_ranges
+from file_transfer import (
+    ANY_PEER,
+    assemble_file,
+    check_stall,
+    find_shared_file,
+    get_disk_writer,
+    is_valid_token,
+    mark_blocks_received,
+    max_chunk_size_for,
+    start_sending,
+)
+
+
+def new_source(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "ranges": [],  # chunk index ranges asked of this seeder
+        "start": 0,  # first index of them, where its FILE_SACKs start
+        "last_chunk_at": 0.0,
+    }
+
+
+def may_seed(app_state, filehash: str, user_id: str) -> bool:
+    if user_id not in app_state.peers:
+        return False
+    entry = app_state.shared_files.get(filehash)
+    return entry is not None and bool({ANY_PEER, user_id} & entry["seed_to"])
+
+
+def find_seeders(sock, app_state, file_id, transfer, chunk_size):
+    """Receiver side, ask who else has the file, then start_swarm splits it up"""
+    sender_ip = transfer["from"].split("@")[-1]
+    with transfer["lock"]:
+        transfer["sack"] = True
+        transfer["sources"] = {sender_ip: new_source(transfer["from"])}
+
+    message = {
+        "TYPE": "FILE_WHO_HAS",
+        "FROM": app_state.user_id,
+        "FILEHASH": transfer["filehash"],
+        "FILESIZE": transfer["filesize"],
+        "TIMESTAMP": str(int(time.time())),
+    }
+    sock.sendto(
+        encode_message(message), (app_state.broadcast_ip, globals.PORT)
+    )
+    if app_state.scheduler is None:
+        start_swarm(sock, app_state, file_id, chunk_size)
+        return
+    app_state.scheduler.call_later(
+        globals.SWARM_DISCOVERY, start_swarm, sock, app_state, file_id, chunk_size
+    )
+
+
+def handle_file_who_has(message, app_state, sock, sender_ip):
+    filehash = message.get("FILEHASH", "")
+    if not may_seed(app_state, filehash, message.get("FROM", "")):
+        return
+    try:
+        path = find_shared_file(app_state, filehash, int(message.get("FILESIZE", -1)))
+    except ValueError:
+        return
+    if path is None:
+        return
+
+    reply = {
+        "TYPE": "FILE_HAVE",
+        "FROM": app_state.user_id,
+        "TO": message["FROM"],
+        "FILEHASH": filehash,
+        "FILESIZE": message["FILESIZE"],
+        "TIMESTAMP": str(int(time.time())),
+    }
+    sock.sendto(encode_message(reply), (sender_ip, globals.PORT))
+    if globals.verbose:
+        print(f"[INFO] FILE_HAVE for {filehash[:12]} to {message['FROM']}")
+
+
+def handle_file_have(message, app_state, sender_ip):
+    filehash = message.get("FILEHASH")
+    for transfer in list(app_state.file_transfers.values()):
+        if transfer["sources"] is None or transfer["filehash"] != filehash:
+            continue
+        with transfer["lock"]:
+            # too late once the file is split up, reassign_missing only uses known seeders
+            if transfer["total_chunks"] is None and sender_ip not in transfer["sources"]:
+                transfer["sources"][sender_ip] = new_source(message["FROM"])
+        if globals.verbose:
+            print(f"[INFO] {message['FROM']} has {transfer['filename']}")
+
+
+def split_ranges(ranges, parts: int) -> list:
+    """Inclusive index ranges cut into parts runs of about equal length, in order"""
+    total = sum(last - first + 1 for first, last in ranges)
+    share = -(-total // parts) if parts else total
+    result = []
+    current = []
+    room = share
+    for first, last in ranges:
+        while first <= last:
+            take = min(last - first + 1, room)
+            current.append((first, first + take - 1))
+            first += take
+            room -= take
+            if room == 0:
+                result.append(current)
+                current = []
+                room = share
+    if current:
+        result.append(current)
+    return result + [[] for _ in range(parts - len(result))]
+
+
+def start_swarm(sock, app_state, file_id, chunk_size):
+    transfer = app_state.file_transfers.get(file_id)
+    if transfer is None:
+        return
+
+    with transfer["lock"]:
+        sources = transfer["sources"]
+        # every seeder has to cut the same chunks, so the smallest path decides
+        chunk_size = min([chunk_size] + [max_chunk_size_for(ip) for ip in sources])
+        complete = mark_blocks_received(transfer, chunk_size)
+        received = transfer["received"]
+        missing = received.missing_ranges(0, received.size)
+        for source, part in zip(sources.values(), split_ranges(missing, len(sources))):
+            source["ranges"] = part
+            source["start"] = part[0][0] if part else 0
+        requests = [(ip, dict(source)) for ip, source in sources.items() if source["ranges"]]
+        transfer["last_chunk_at"] = time.monotonic()
+        if not complete and app_state.scheduler is not None:
+            transfer["nack_timer"] = app_state.scheduler.call_later(
+                globals.NACK_STALL,
+                check_stall,
+                sock,
+                app_state,
+                file_id,
+                transfer["from"].split("@")[-1],
+            )
+
+    if complete:
+        get_disk_writer(app_state).call(assemble_file, file_id, app_state, sock)
+        return
+    print(f"Transfer in progress from {len(requests)} peers...")
+    for ip, source in requests:
+        send_file_request(sock, app_state, file_id, transfer, ip, source)
+
+
+def reassign_missing(sock, app_state, file_id, transfer):
+    """
+    Called from check_stall once the stream stalled SWARM_REASSIGN times:
+    whatever is still missing goes to the seeder that finished its own part
+    most recently, a stalled seeder may be gone.
+    """
+    with transfer["lock"]:
+        received = transfer["received"]
+        missing = received.missing_ranges(transfer["cumulative"], received.size)
+        if not missing:
+            return
+        idle = [
+            (ip, source)
+            for ip, source in transfer["sources"].items()
+            if not any(
+                first <= end and start <= last
+                for first, last in source["ranges"]
+                for start, end in missing
+            )
+        ]
+        if not idle:
+            return  # everyone still has work, the NACKs cover the losses
+        ip, source = max(idle, key=lambda item: item[1]["last_chunk_at"])
+        source["ranges"] = missing
+        source["start"] = missing[0][0]
+        source = dict(source)
+
+    count = sum(last - first + 1 for first, last in missing)
+    print(f"[INFO] Fetching the {count} missing chunks of {transfer['filename']} from {source['user_id']}")
+    send_file_request(sock, app_state, file_id, transfer, ip, source)
+
+
+def send_file_request(sock, app_state, file_id, transfer, ip, source):
+    chunk_size = transfer["chunk_size"]
+    ranges = source["ranges"]
+    limit = globals.RESUME_MAX_RANGES
+    if len(ranges) > limit:
+        # too many holes for one message, the last range runs to the end of the
+        # part instead and the chunks we already have are just duplicates
+        ranges = ranges[: limit - 1] + [(ranges[limit - 1][0], ranges[-1][1])]
+    byte_ranges = [
+        (first * chunk_size, min((last + 1) * chunk_size, transfer["filesize"]) - 1)
+        for first, last in ranges
+    ]
+    message = {
+        "TYPE": "FILE_REQUEST",
+        "FROM": app_state.user_id,
+        "TO": source["user_id"],
+        "FILEID": file_id,
+        "FILEHASH": transfer["filehash"],
+        "FILESIZE": transfer["filesize"],
+        "CHUNK_SIZE": chunk_size,
+        "TOTAL_CHUNKS": transfer["total_chunks"],
+        "FEC": "1",
+        "BINARY": "1",
+        "MISSING": format_ranges(byte_ranges),
+        "TIMESTAMP": str(int(time.time())),
+        "TOKEN": f"{app_state.user_id}|{int(time.time()) + globals.POST_TTL}|file",
+    }
+    sock.sendto(encode_message(message), (ip, globals.PORT))
+
+    if globals.verbose:
+        print(f"\n[SEND >]")
+        print(f"Message Type : FILE_REQUEST")
+        print(f"Timestamp    : {int(time.time())}")
+        print(f"From         : {app_state.user_id}")
+        print(f"To           : {source['user_id']}")
+        print(f"File ID      : {file_id}")
+        print(f"Missing      : {message['MISSING']}\n")
+
+
+def handle_file_request(message, app_state, sock, sender_ip):
+    """Seeder side, send the requested byte ranges of a file we have by its hash"""
+    file_id = message.get("FILEID")
+    from_id = message.get("FROM")
+    if file_id is None or from_id is None:
+        return
+
+    try:
+        filesize = int(message["FILESIZE"])
+        chunk_size = int(message["CHUNK_SIZE"])
+        total_chunks = int(message["TOTAL_CHUNKS"])
+        ranges = parse_ranges(message.get("MISSING", ""))
+    except (KeyError, ValueError):
+        if globals.verbose:
+            print(f"[DEBUG] Malformed FILE_REQUEST for file_id={file_id}, ignoring.")
+        return
+    filehash = message.get("FILEHASH", "")
+    if not is_valid_token(message.get("TOKEN", ""), "file", from_id) or not may_seed(
+        app_state, filehash, from_id
+    ):
+        print(f"[WARN] FILE_REQUEST for file_id={file_id} from {from_id} refused")
+        return
+    path = find_shared_file(app_state, filehash, filesize)
+    if path is None or chunk_size <= 0 or chunk_size % globals.CHUNK_SIZE:
+        return
+
+    with app_state.lock:
+        if file_id in app_state.file_send_windows:
+            # still sending our last part, the receiver asks again if it stays stuck
+            return
+
+    timestamp = int(time.time())
+    send_info = {
+        "sock": sock,
+        "to_user_id": from_id,
+        "to_ip": sender_ip,
+        "token": f"{app_state.user_id}|{timestamp + globals.POST_TTL}|file",
+        "filesize": filesize,
+        "filepath": path,
+        "ranges": [
+            (first, min(last + 1, filesize)) for first, last in ranges if first < filesize
+        ],
+        "chunk_size": chunk_size,
+        "total_chunks": total_chunks,
+        "fec": message.get("FEC") == "1",
+        "binary": globals.BINARY_CHUNKS and message.get("BINARY") == "1",
+    }
+    resend = sum(end - start for start, end in send_info["ranges"])
+    print(f"[INFO] Seeding {resend} bytes of {os.path.basename(path)} to {from_id}")
+    start_sending(send_info, app_state, file_id, from_id)
+
+
+def register_handlers(dispatcher):
+    dispatcher.register(
+        "FILE_WHO_HAS", handle_file_who_has, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register("FILE_HAVE", handle_file_have, needs_addr=True)
+    dispatcher.register(
+        "FILE_REQUEST", handle_file_request, needs_sock=True, needs_addr=True
+    )
@@ -1,11 +1,47 @@
 import base64
+import errno
+import hashlib
+import ipaddress
+import mmap
 import os
 import time
 import uuid
 import threading
+import zlib
+from functools import partial
+import fec
 import utils.globals as globals
-from utils import build_message
-from ack import send_ack, send_with_ack
+from utils import ChunkBitmap, encode_message, format_ranges, parse_ranges
+from ack import acknowledge, forget, retransmit_now, send_ack, send_with_ack
+from send_window import SendWindow
+from transfer_engine import TransferEngine
+from file_delta import find_basis, rebuild_file, request_delta
+from file_batch import (
+    checkpoint_fields,
+    discard_batch,
+    extract_ready,
+    load_batch,
+    open_batch,
+    start_batch,
+)
+from disk_writer import (
+    DiskWriter,
+    SAVE_DIR,
+    create_part_file,
+    link_or_copy,
+    load_checkpoints,
+    load_content_index,
+    open_part_file,
+    read_at,
+    remove_checkpoint,
+    save_checkpoint,
+    save_content_index,
+    unique_path,
+    write_at,
+)
+
+# sendto of a datagram bigger than the path allows, WSAEMSGSIZE on Windows
+MSG_TOO_BIG = {errno.EMSGSIZE, getattr(errno, "WSAEMSGSIZE", errno.EMSGSIZE)}
 
 
 def is_valid_token(token: str, expected_scope: str, expected_user: str = None) -> bool:
@@ -19,6 +55,156 @@ def is_valid_token(token: str, expected_scope: str, expected_user: str = None) -
         return False
 
 
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# in seed_to, every known peer may fetch the file from us
+ANY_PEER = "*"
+
+
+def share_file(app_state, filehash: str, path: str, seed_to=()):
+    """
+    Remember that path has this content, to skip later offers of it. seed_to
+    are the user ids (or ANY_PEER) file_swarm may seed it to, nobody by
+    default. Files in SAVE_DIR also go into its on-disk content index.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    seed_to = set(seed_to)
+    with app_state.lock:
+        entry = app_state.shared_files.get(filehash)
+        if entry is not None and (entry["path"], entry["mtime_ns"]) == (path, st.st_mtime_ns):
+            seed_to |= entry["seed_to"]  # offered again, the earlier peers still may
+        app_state.shared_files[filehash] = {
+            "path": path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "seed_to": seed_to,
+        }
+    if in_save_dir(path):
+        get_disk_writer(app_state).call(save_received_index, app_state)
+
+
+def find_shared_file(app_state, filehash: str, filesize: int):
+    """Path of an unchanged local file with this content, or None"""
+    entry = app_state.shared_files.get(filehash)
+    if entry is None:
+        return None
+    try:
+        st = os.stat(entry["path"])
+    except OSError:
+        st = None
+    if st is None or (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+        # moved, deleted or edited since it was hashed
+        with app_state.lock:
+            if app_state.shared_files.get(filehash) is entry:
+                del app_state.shared_files[filehash]
+        return None
+    return entry["path"] if st.st_size == filesize else None
+
+
+def in_save_dir(path: str) -> bool:
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(SAVE_DIR)
+
+
+def save_received_index(app_state):
+    """Runs on the disk writer thread, so index writes never race"""
+    with app_state.lock:
+        entries = {
+            filehash: (entry["size"], entry["mtime_ns"], os.path.basename(entry["path"]))
+            for filehash, entry in app_state.shared_files.items()
+            if in_save_dir(entry["path"])
+        }
+    try:
+        save_content_index(entries)
+    except OSError as e:
+        print(f"[ERROR] Could not save the index of '{SAVE_DIR}': {e}")
+
+
+def index_received_files(app_state):
+    """
+    Runs on the disk writer thread at startup. Entries of the saved index
+    whose file is unchanged are kept, only files it doesn't cover (new,
+    edited, copied in by hand) get hashed, so a restart doesn't re-read
+    everything in SAVE_DIR.
+    """
+    if not os.path.isdir(SAVE_DIR):
+        return
+    entries = {}
+    known = set()  # (device, inode), hardlinks made by receive_from_copy are the same file
+    for filehash, (size, mtime_ns, name) in load_content_index().items():
+        path = os.path.join(SAVE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+            # a restart forgets who a file was seeded to
+            entries[filehash] = {
+                "path": path, "size": size, "mtime_ns": mtime_ns, "seed_to": set()
+            }
+            known.add((st.st_dev, st.st_ino))
+
+    hashed = 0
+    for name in sorted(os.listdir(SAVE_DIR)):
+        path = os.path.join(SAVE_DIR, name)
+        # dot files are part files, checkpoints and the index itself
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        try:
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) in known:
+                continue
+            filehash = sha256_file(path)
+        except OSError:
+            continue
+        known.add((st.st_dev, st.st_ino))
+        entries[filehash] = {
+            "path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "seed_to": set()
+        }
+        hashed += 1
+
+    with app_state.lock:
+        for filehash, entry in entries.items():
+            app_state.shared_files.setdefault(filehash, entry)
+    save_received_index(app_state)
+    if globals.verbose:
+        print(f"[INFO] {len(entries)} files in '{SAVE_DIR}' indexed, {hashed} newly hashed")
+
+
+def max_chunk_size_for(ip: str, binary: bool = False) -> int:
+    """
+    Largest chunk (raw bytes, before base64) that fits one unfragmented
+    datagram to ip. binary: sent as a raw PAYLOAD, without base64.
+    """
+    try:
+        loopback = ipaddress.ip_address(ip).is_loopback
+    except ValueError:
+        loopback = False
+    budget = globals.MAX_UDP_PAYLOAD if loopback else globals.PATH_MTU - 28  # IP + UDP
+    size = budget - globals.CHUNK_HEADER_RESERVE
+    if not binary:
+        size = size // 4 * 3  # base64 turns every 3 bytes into 4
+    if globals.MAX_CHUNK_SIZE:
+        size = min(size, globals.MAX_CHUNK_SIZE)
+    # whole checkpoint blocks, so every chunk starts on a block boundary
+    size -= size % globals.CHUNK_SIZE
+    return max(size, globals.CHUNK_SIZE)
+
+
+def window_limit(chunk_size: int) -> int:
+    """Max congestion window in chunks, so large chunks don't flood the receiver"""
+    limit = globals.FILE_WINDOW_BYTES // chunk_size
+    return max(globals.FILE_WINDOW_INITIAL, min(limit, globals.FILE_WINDOW_MAX))
+
+
 def handle_file_offer(message, app_state, sock):
     print(f"[DEBUG] handle_file_offer called with file_id={message.get('FILEID')}")
     file_id = message["FILEID"]
@@ -38,50 +224,277 @@ def handle_file_offer(message, app_state, sock):
         "filetype": message["FILETYPE"],
         "description": message.get("DESCRIPTION", ""),
         "timestamp": int(message["TIMESTAMP"]),
+        # sender understands FILE_SACK, otherwise every chunk gets its own ACK
+        "sack": message.get("SACK") == "1",
+        "max_chunk_size": int(message.get("MAX_CHUNK_SIZE", globals.CHUNK_SIZE)),
+        "filehash": message.get("FILEHASH", ""),  # sha256 hex, empty for older senders
+        # one to many send, chunks come on broadcast/multicast in CHUNK_SIZE pieces
+        "multi": message.get("MULTI") == "1",
+        "chunk_size": int(message.get("CHUNK_SIZE", 0)),
+        # sender can send just the changes against an old copy, see file_delta.py
+        "delta": message.get("DELTA") == "1",
+        # sender can put chunks raw after the header instead of base64 in DATA
+        "binary": message.get("BINARY") == "1",
+        # a folder, manifest + contents in one stream, see file_batch.py
+        "batch": None,
     }
-
-    print(
-        f"\nUser {sender_user} is sending you a file: {message['FILENAME']} ({message['FILESIZE']} bytes)"
-    )
+    offer = app_state.pending_file_offers[file_id]
+    if message.get("BATCH") == "1":
+        try:
+            offer["batch"] = {
+                "manifest_size": int(message["MANIFEST_SIZE"]),
+                "count": int(message["FILECOUNT"]),
+            }
+        except (KeyError, ValueError):
+            del app_state.pending_file_offers[file_id]
+            return
+        print(
+            f"\nUser {sender_user} is sending you a folder: {message['FILENAME']} "
+            f"({offer['batch']['count']} files, {message['FILESIZE']} bytes)"
+        )
+    else:
+        print(
+            f"\nUser {sender_user} is sending you a file: {message['FILENAME']} ({message['FILESIZE']} bytes)"
+        )
     print(f"Description: {message.get('DESCRIPTION', 'No description')}")
+    if offer["filehash"] and find_shared_file(app_state, offer["filehash"], offer["filesize"]):
+        print("You already have this file, accepting it transfers nothing.")
     print(f"To see current file offers, run cmd accept_file\n")
 
 
-def accept_file(file_id, app_state, sock):
+def new_transfer(
+    checkpoint_id, sender, filename, filesize, filehash, part_path, part_file, blocks
+):
+    """
+    Receive state of one file. blocks marks the CHUNK_SIZE byte blocks already
+    on disk and is what gets checkpointed, the rest is per FILEID session.
+    """
+    transfer = {
+        "checkpoint_id": checkpoint_id,  # names the part and checkpoint files
+        "offer_id": checkpoint_id,  # FILEID the sender currently knows it by
+        "from": sender,
+        "filename": filename,
+        "filesize": filesize,
+        "filehash": filehash,
+        # sha256 of the in-order prefix written so far, only touched by the disk writer
+        "digest": hashlib.sha256() if filehash else None,
+        "digest_offset": 0,
+        "part_path": part_path,
+        "file": part_file,
+        "blocks": blocks,
+        "checkpoint_at": 0.0,
+        "sack": True,
+        "multi": False,  # one to many send, see join_multi
+        "sources": None,  # swarm download, ip -> seeder state (file_swarm.py)
+        "delta": None,  # receiving a delta, the old copy and the file it rebuilds (file_delta.py)
+        "batch": None,  # receiving a folder, where and how far it is unpacked (file_batch.py)
+        "sack_timer": None,
+        "nack_timer": None,
+        "lock": threading.Lock(),
+        # held (before lock, never by the disk writer) while queueing this
+        # file's writes, so they reach the writer in the order lock decided
+        # them without lock being held when a full queue blocks
+        "write_lock": threading.Lock(),
+    }
+    reset_session(transfer)
+    return transfer
+
+
+def reset_session(transfer):
+    """Chunk indices start over for every FILEID the file is (re)sent under"""
+    for timer in ("sack_timer", "nack_timer"):
+        if transfer[timer] is not None:
+            transfer[timer].cancelled = True
+    transfer.update(
+        {
+            "received": ChunkBitmap(),  # chunk indices already written
+            "complete": False,
+            "total_chunks": None,
+            "chunk_size": None,  # set when indices are fixed by offset (one to many, swarm)
+            "accepted_time": time.time(),
+            "cumulative": 0,  # every chunk below this index has arrived
+            "unsacked": 0,
+            "sack_timer": None,
+            "last_chunk_at": None,
+            "nack_timer": None,
+            "nacks_sent": 0,
+            "parity": {},  # chunk index -> FEC group that can still rebuild it
+            "recovered": 0,  # chunks rebuilt from parity, reported in FILE_SACK
+        }
+    )
+
+
+def block_count(filesize: int) -> int:
+    return (filesize + globals.CHUNK_SIZE - 1) // globals.CHUNK_SIZE
+
+
+def accept_file(file_id, app_state, sock, swarm=False):
+    """swarm: fetch disjoint parts from every peer that has the file, see file_swarm.py"""
     if file_id not in app_state.pending_file_offers:
         print("No such file offer found.")
         return
 
     offer = app_state.pending_file_offers.pop(file_id)
-    app_state.file_transfers[file_id] = {
-        "from": offer["from"],
-        "filename": offer["filename"],
-        "chunks": {},
-        "total_chunks": None,
-        "accepted_time": time.time(),
-    }
+
+    to_id = offer["from"]
+    if "@" not in to_id or len(to_id.split("@")) < 2:
+        print(f"Invalid user ID format for recipient: {to_id}")
+        return
+    to_ip = to_id.split("@")[1]
+
+    # same content is already here, no chunks needed at all
+    if offer["filehash"]:
+        have = find_shared_file(app_state, offer["filehash"], offer["filesize"])
+        if have is not None and receive_from_copy(sock, app_state, file_id, offer, have):
+            return
+
+    if offer["multi"]:
+        # the sender picked it for every recipient
+        chunk_size = offer["chunk_size"]
+        if chunk_size <= 0 or chunk_size % globals.CHUNK_SIZE:
+            print(f"[ERROR] Invalid chunk size {chunk_size} in file offer {file_id}")
+            return
+    else:
+        # pick the chunk size, no bigger than the sender offered or our side of the path allows
+        chunk_size = min(offer["max_chunk_size"], max_chunk_size_for(to_ip))
+    text_chunk_size = chunk_size
+    if offer["binary"] and not offer["multi"]:
+        # no base64 to make room for, MAX_CHUNK_SIZE was for text chunks but
+        # the sender caps this to its own side of the path again
+        chunk_size = max_chunk_size_for(to_ip, binary=True)
+
+    # same file from the same sender was interrupted before, only fetch what's missing
+    transfer = find_resumable(
+        app_state, offer["from"], offer["filename"], offer["filesize"], offer["filehash"]
+    )
+    swarm = swarm and not (offer["multi"] or offer["batch"]) and bool(offer["filehash"])
+    if transfer is not None and transfer["delta"] != offer.get("delta_target"):
+        # same name and size, but a delta against another old copy (or none)
+        transfer["file"].close()
+        transfer = None
+    if transfer is not None and not (offer["multi"] or swarm):
+        transfer["sack"] = offer["sack"]
+        resume_transfer(sock, app_state, file_id, transfer, chunk_size)
+        return
+
+    # an older copy is here, ask only for what changed since
+    if offer["delta"] and not swarm and transfer is None:
+        basis = find_basis(offer["filename"])
+        if basis is not None and request_delta(
+            sock, app_state, file_id, offer, basis, text_chunk_size
+        ):
+            return
+
+    if transfer is not None:
+        # chunk indices are fixed by offset here, mark_blocks_received skips what we have
+        reset_session(transfer)
+        transfer["offer_id"] = file_id
+    else:
+        # chunks go straight to a preallocated part file, renamed once complete
+        try:
+            batch = start_batch(offer["filename"], offer["batch"]) if offer["batch"] else None
+            part_path, part_file = create_part_file(file_id, offer["filesize"])
+        except OSError as e:
+            print(f"[ERROR] Could not create file in '{SAVE_DIR}': {e}")
+            return
+
+        transfer = new_transfer(
+            file_id,
+            offer["from"],
+            offer["filename"],
+            offer["filesize"],
+            offer["filehash"],
+            part_path,
+            part_file,
+            ChunkBitmap(block_count(offer["filesize"])),
+        )
+        transfer["delta"] = offer.get("delta_target")
+        transfer["batch"] = batch
+    transfer["sack"] = offer["sack"]
+    app_state.file_transfers[file_id] = transfer
+    get_disk_writer(app_state).call(save_transfer_checkpoint, transfer)
+
+    if swarm:
+        from file_swarm import find_seeders
+
+        print(f"Accepted file offer for {offer['filename']}, looking for more peers that have it...")
+        find_seeders(sock, app_state, file_id, transfer, chunk_size)
+        return
 
     print(f"Accepted file offer for {offer['filename']}")
     print(f"Transfer in progress...")
 
     # Send FILE_ACCEPTED back to sender to signal readiness
-    from_id = app_state.user_id
-    to_id = offer["from"]
     file_accepted_msg = {
         "TYPE": "FILE_ACCEPTED",
-        "FROM": from_id,
+        "FROM": app_state.user_id,
         "TO": to_id,
         "FILEID": file_id,
         "TIMESTAMP": str(int(time.time())),
+        "CHUNK_SIZE": chunk_size,
+        "FEC": "1",  # we can rebuild chunks from FILE_PARITY
+        "BINARY": "1",  # and take them as a raw PAYLOAD
     }
-    # Extract IP from to_id
-    if "@" not in to_id or len(to_id.split("@")) < 2:
-        print(f"Invalid user ID format for recipient: {to_id}")
-        return
-    to_ip = to_id.split("@")[1]
-    sock.sendto(build_message(file_accepted_msg).encode("utf-8"), (to_ip, globals.PORT))
+    sock.sendto(encode_message(file_accepted_msg), (to_ip, globals.PORT))
     if globals.verbose:
-        print(f"[INFO] FILE_ACCEPTED for file_id={file_id} to {to_id}")
+        print(
+            f"[INFO] FILE_ACCEPTED for file_id={file_id} to {to_id} "
+            f"(chunk size {file_accepted_msg['CHUNK_SIZE']})"
+        )
+    if offer["multi"]:
+        join_multi(sock, app_state, file_id, transfer, chunk_size, to_ip)
+
+
+def receive_from_copy(sock, app_state, file_id, offer, source_path) -> bool:
+    """Save the offered file as a hardlink (or copy) of our own, False if that failed"""
+    filepath = unique_path(offer["filename"])
+    try:
+        link_or_copy(source_path, filepath)
+    except OSError as e:
+        print(f"[ERROR] Could not link {source_path}, transferring it instead: {e}")
+        return False
+    print(f"\n[INFO] Already had {offer['filename']} as {source_path}. File saved as: {filepath}\n")
+    send_file_received(sock, app_state.user_id, offer["from"], file_id, deduped=True)
+    return True
+
+
+def join_multi(sock, app_state, file_id, transfer, chunk_size, sender_ip):
+    """
+    One to many send (file_multicast.py): chunk i starts at byte i * chunk_size
+    and nobody ACKs, so chunks already on disk count as received and the
+    stall timer starts right away, the stream may be over or lost on the way
+    and then check_stall NACKs everything we miss.
+    """
+    with transfer["lock"]:
+        transfer["multi"] = True
+        complete = mark_blocks_received(transfer, chunk_size)
+        transfer["last_chunk_at"] = time.monotonic()
+        if not complete and app_state.scheduler is not None:
+            transfer["nack_timer"] = app_state.scheduler.call_later(
+                globals.NACK_STALL, check_stall, sock, app_state, file_id, sender_ip
+            )
+    if complete:
+        get_disk_writer(app_state).call(assemble_file, file_id, app_state, sock)
+
+
+def mark_blocks_received(transfer, chunk_size) -> bool:
+    """
+    For chunk indices fixed by offset (index * chunk_size), mark the chunks
+    whose blocks are all on disk already. Returns True if that is every
+    chunk. Caller holds the lock.
+    """
+    total_chunks = max(1, -(-transfer["filesize"] // chunk_size))
+    per_chunk = chunk_size // globals.CHUNK_SIZE
+    received = transfer["received"]
+    received.grow(total_chunks)
+    transfer["total_chunks"] = total_chunks
+    transfer["chunk_size"] = chunk_size
+    blocks = transfer["blocks"]
+    for index in range(total_chunks):
+        first = index * per_chunk
+        if all(block in blocks for block in range(first, min(first + per_chunk, blocks.size))):
+            received.add(index)
+    return note_progress(transfer)
 
 
 def handle_file_chunk(message, app_state, sock, sender_ip):
@@ -102,9 +515,26 @@ def handle_file_chunk(message, app_state, sock, sender_ip):
             f"[DEBUG] Received FILE_CHUNK with FILEID: {file_id}, chunk: {chunk_index}"
         )
 
-    send_ack(sock, ack_id, sender_ip, app_state)
+    transfer = app_state.file_transfers.get(file_id)
+    multi = message.get("MULTI") == "1"
+    if transfer is None and multi:
+        return  # broadcast chunk of a one to many send we're not part of
+
+    chunk_data = decode_chunk(message)
+    if chunk_data is None:
+        # damaged on the way, no ACK and ask for just this chunk again
+        print(f"[DEBUG] Chunk {chunk_index} of file_id={file_id} failed its CRC check.")
+        if transfer is not None and (transfer["sack"] or transfer["multi"]):
+            send_file_nack(
+                sock, app_state, file_id, transfer, sender_ip, [(chunk_index, chunk_index)]
+            )
+        return
+
+    # one to many chunks are never ACKed, every receiver only NACKs its own gaps
+    if (transfer is None or not transfer["sack"]) and not multi:
+        send_ack(sock, ack_id, sender_ip, app_state)
 
-    if file_id not in app_state.file_transfers:
+    if transfer is None:
         print(f"[DEBUG] Chunk received for unknown file_id={file_id}, ignoring.")
         return
 
@@ -114,119 +544,843 @@ def handle_file_chunk(message, app_state, sock, sender_ip):
 
     try:
         total_chunks = int(message["TOTAL_CHUNKS"])
-        chunk_data = base64.b64decode(message["DATA"])
+        offset = chunk_offset(message, chunk_index, total_chunks, chunk_data, transfer)
     except Exception as e:
         print(f"[DEBUG] Exception decoding chunk data: {e}")
         return
 
-    transfer = app_state.file_transfers[file_id]
-    transfer["chunks"][chunk_index] = chunk_data
-    transfer["total_chunks"] = total_chunks
+    if offset < 0 or offset + len(chunk_data) > transfer["filesize"]:
+        print(f"[DEBUG] Chunk {chunk_index} outside of file_id={file_id}, ignoring.")
+        return
+    if not valid_chunk_range(transfer, chunk_index, 1, total_chunks):
+        print(
+            f"[DEBUG] Chunk index {chunk_index}/{total_chunks} invalid for "
+            f"file_id={file_id}, ignoring."
+        )
+        return
+
+    writer = get_disk_writer(app_state)
+    with transfer["write_lock"]:
+        with transfer["lock"]:
+            received = transfer["received"]
+            # the sender may fall back to smaller chunks mid-transfer, which only
+            # ever increases the total, so a late retransmit can't shrink it again
+            received.grow(total_chunks)
+            total_chunks = received.size
+            transfer["total_chunks"] = total_chunks
+
+            duplicate = not received.add(chunk_index)
+            group = rebuilt = None
+            if not duplicate:
+                group = transfer["parity"].get(chunk_index)
+                if group is not None:
+                    rebuilt = claim_recovery(transfer, group)
+            complete = note_progress(transfer)
+
+            transfer["last_chunk_at"] = time.monotonic()
+            transfer["nacks_sent"] = 0
+            if transfer["sources"] and sender_ip in transfer["sources"]:
+                transfer["sources"][sender_ip]["last_chunk_at"] = transfer["last_chunk_at"]
+            if (
+                not transfer["complete"]
+                and transfer["nack_timer"] is None
+                and app_state.scheduler is not None
+            ):
+                transfer["nack_timer"] = app_state.scheduler.call_later(
+                    globals.NACK_STALL, check_stall, sock, app_state, file_id, sender_ip
+                )
+
+        # chunk_written takes lock on the writer thread, so a full queue must
+        # not block us while we hold it
+        if not duplicate:
+            writer.write(
+                transfer["file"], offset, chunk_data, partial(chunk_written, transfer)
+            )
+        if rebuilt is not None:
+            writer.call(rebuild_chunk, transfer, group, rebuilt)
+
+    if transfer["sack"]:
+        # a duplicate means our last FILE_SACK was lost, repeat it right away
+        queue_sack(
+            sock, app_state, file_id, transfer, sender_ip, duplicate or complete
+        )
 
     if globals.verbose:
         print(
             f"[DEBUG] Received chunk {chunk_index + 1}/{total_chunks} for file '{transfer['filename']}' (file_id={file_id})"
         )
         print(
-            f"[DEBUG] Total chunks received so far: {len(transfer['chunks'])}/{total_chunks}"
+            f"[DEBUG] Total chunks received so far: {len(transfer['received'])}/{total_chunks}"
         )
 
-    if len(transfer["chunks"]) == total_chunks:
+    if complete:
         if globals.verbose:
             print(
                 f"[DEBUG] All chunks received for file_id={file_id}, assembling file."
             )
-        assemble_file(file_id, app_state, sock)
+        # queued behind the chunk writes, so the rename happens once they're on disk
+        writer.call(assemble_file, file_id, app_state, sock)
+    elif globals.verbose:
+        print(f"[DEBUG] Still missing {total_chunks - len(received)} chunks")
+
+
+def valid_chunk_range(transfer, first: int, count: int, total_chunks: int) -> bool:
+    """
+    Chunk indices first..first+count-1 and TOTAL_CHUNKS from the wire make
+    sense for the file. No chunk is smaller than CHUNK_SIZE (but the last),
+    so that bounds the total, and with it what the bitmap may grow to.
+    """
+    limit = max(1, block_count(transfer["filesize"]))
+    return 0 < total_chunks <= limit and 0 <= first and first + count <= total_chunks
+
+
+def note_progress(transfer) -> bool:
+    """Advance the cumulative index, True the first time every chunk is in. Caller holds the lock"""
+    received = transfer["received"]
+    while transfer["cumulative"] in received:
+        transfer["cumulative"] += 1
+    if received.complete() and not transfer["complete"]:
+        transfer["complete"] = True
+        return True
+    return False
+
+
+def handle_file_parity(message, app_state, sock, sender_ip):
+    """XOR of a group of chunks, rebuilds the group's chunk if exactly one is missing"""
+    file_id = message["FILEID"]
+    transfer = app_state.file_transfers.get(file_id)
+    if transfer is None or not is_valid_token(message["TOKEN"], "file"):
+        return
+
+    parity = decode_chunk(message)
+    if parity is None:
+        return  # damaged parity is just dropped, the chunks still get retransmitted
+    try:
+        first = int(message["FIRST_INDEX"])
+        offset = int(message["OFFSET"])
+        lengths = [int(n) for n in message["LENGTHS"].split(",")]
+        total_chunks = int(message["TOTAL_CHUNKS"])
+    except (KeyError, ValueError):
+        return
+    offsets = []
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+    if offsets[0] < 0 or min(lengths) < 0 or offset > transfer["filesize"]:
+        return
+    if max(lengths) != len(parity):
+        return
+    if not valid_chunk_range(transfer, first, len(lengths), total_chunks):
+        return
+
+    # copied, a binary PAYLOAD is a view that would hold its receive buffer
+    # for as long as the group waits for its chunks
+    group = {"first": first, "offsets": offsets, "lengths": lengths, "data": bytes(parity)}
+    writer = get_disk_writer(app_state)
+    with transfer["write_lock"]:
+        with transfer["lock"]:
+            transfer["received"].grow(total_chunks)
+            transfer["total_chunks"] = transfer["received"].size
+            for index in range(first, first + len(lengths)):
+                transfer["parity"][index] = group
+            rebuilt = claim_recovery(transfer, group)
+            complete = note_progress(transfer)
+        if rebuilt is not None:
+            writer.call(rebuild_chunk, transfer, group, rebuilt)
+
+    if globals.verbose:
+        print(
+            f"[DEBUG] FILE_PARITY for chunks {first}-{first + len(lengths) - 1} "
+            f"of file_id={file_id}"
+            + (f", rebuilt chunk {rebuilt}" if rebuilt is not None else "")
+        )
+
+    if rebuilt is not None and transfer["sack"]:
+        queue_sack(sock, app_state, file_id, transfer, sender_ip, complete)
+    if complete:
+        writer.call(assemble_file, file_id, app_state, sock)
+
+
+def claim_recovery(transfer, group):
+    """
+    Caller holds the lock. Once a group is down to one missing chunk, mark it
+    received and return its index, or None. The caller queues rebuild_chunk
+    for it behind the writes of the others, still under write_lock.
+    """
+    indices = range(group["first"], group["first"] + len(group["lengths"]))
+    missing = [index for index in indices if index not in transfer["received"]]
+    if len(missing) > 1:
+        return None
+    for index in indices:
+        transfer["parity"].pop(index, None)
+    if not missing:
+        return None
+    transfer["received"].add(missing[0])
+    return missing[0]
+
+
+def rebuild_chunk(transfer, group, index):
+    """Runs on the disk writer thread, the other chunks of the group are on disk by now"""
+    position = index - group["first"]
+    others = [
+        read_at(transfer["file"], offset, length)
+        for n, (offset, length) in enumerate(zip(group["offsets"], group["lengths"]))
+        if n != position
+    ]
+    offset = group["offsets"][position]
+    data = fec.rebuild(group["data"], others, group["lengths"][position])
+    write_at(transfer["file"], offset, data)
+    with transfer["lock"]:
+        transfer["recovered"] += 1
+    chunk_written(transfer, offset, data)
+
+
+def decode_chunk(message):
+    """
+    Chunk bytes, or None if DATA doesn't decode or doesn't match its CRC. A
+    binary PAYLOAD is a memoryview into the datagram, written out as is.
+    """
+    if "PAYLOAD" in message:
+        chunk_data = message["PAYLOAD"]
     else:
-        missing_chunks = [i for i in range(total_chunks) if i not in transfer["chunks"]]
-        if globals.verbose and missing_chunks:
-            print(f"[DEBUG] Still missing chunks: {missing_chunks}")
+        try:
+            chunk_data = base64.b64decode(message["DATA"], validate=True)
+        except (KeyError, ValueError):
+            return None
+    if "CRC" in message and format(zlib.crc32(chunk_data), "08x") != message["CRC"]:
+        return None
+    return chunk_data
 
 
-def assemble_file(file_id, app_state, sock):
-    transfer = app_state.file_transfers[file_id]
-    filename = transfer["filename"]
-    chunks = transfer["chunks"]
-    total_chunks = transfer["total_chunks"]
+def check_stall(sock, app_state, file_id, sender_ip):
+    """
+    Receiver side timer. If no chunk arrived for NACK_STALL seconds, ask the
+    sender for the missing ranges right away instead of waiting out its RTO.
+    """
+    transfer = app_state.file_transfers.get(file_id)
+    if transfer is None:
+        return
+
+    with transfer["lock"]:
+        transfer["nack_timer"] = None
+        if transfer["complete"]:
+            return
+        idle = time.monotonic() - transfer["last_chunk_at"]
+        if idle < globals.NACK_STALL:
+            # chunks are still flowing, check again when this one would stall
+            transfer["nack_timer"] = app_state.scheduler.call_later(
+                globals.NACK_STALL - idle,
+                check_stall,
+                sock,
+                app_state,
+                file_id,
+                sender_ip,
+            )
+            return
+        if transfer["nacks_sent"] >= globals.NACK_MAX:
+            return  # sender is gone, leave it to its own timeouts
+        ranges = transfer["received"].missing_ranges(
+            transfer["cumulative"], globals.NACK_MAX_RANGES
+        )
+        transfer["nacks_sent"] += 1
+        reassign = bool(transfer["sources"]) and transfer["nacks_sent"] >= globals.SWARM_REASSIGN
+        # back off while the stream stays stalled
+        transfer["nack_timer"] = app_state.scheduler.call_later(
+            globals.NACK_STALL * (2 ** transfer["nacks_sent"]),
+            check_stall,
+            sock,
+            app_state,
+            file_id,
+            sender_ip,
+        )
+
+    # the sender may be gone for good, make sure what we have survives a restart
+    get_disk_writer(app_state).call(save_transfer_checkpoint, transfer)
+    if ranges:
+        # every seeder of a swarm download only resends the chunks it has in flight
+        for ip in transfer["sources"] or [sender_ip]:
+            send_file_nack(sock, app_state, file_id, transfer, ip, ranges)
+    if reassign:
+        from file_swarm import reassign_missing
+
+        reassign_missing(sock, app_state, file_id, transfer)
+
+
+def send_file_nack(sock, app_state, file_id, transfer, sender_ip, ranges):
+    message = {
+        "TYPE": "FILE_NACK",
+        "FROM": app_state.user_id,
+        "TO": transfer["from"],
+        "FILEID": file_id,
+        "MISSING": format_ranges(ranges),
+    }
+    sock.sendto(encode_message(message), (sender_ip, globals.PORT))
 
-    save_dir = "received_files"
     if globals.verbose:
-        print(f"[DEBUG] Checking if directory '{save_dir}' exists...")
+        print(f"\n[SEND >]")
+        print(f"Message Type : FILE_NACK")
+        print(f"Timestamp    : {int(time.time())}")
+        print(f"From         : {app_state.user_id}")
+        print(f"To           : {transfer['from']}")
+        print(f"File ID      : {file_id}")
+        print(f"Missing      : {message['MISSING']}\n")
+
+
+def handle_file_nack(message, app_state, sock, sender_ip):
+    """Sender side, resend the requested chunks that are still unacknowledged now"""
+    file_id = message.get("FILEID")
+    if file_id in app_state.multi_sends:
+        from file_multicast import handle_multi_nack
+
+        handle_multi_nack(message, app_state, sender_ip)
+        return
+    window = app_state.file_send_windows.get(file_id)
+    if window is None:
+        return
+
     try:
-        os.makedirs(save_dir, exist_ok=True)
+        ranges = parse_ranges(message.get("MISSING", ""))
+    except ValueError:
         if globals.verbose:
-            print(f"[DEBUG] Directory '{save_dir}' is ready.")
-    except Exception as e:
-        print(f"[ERROR] Could not create directory '{save_dir}': {e}")
+            print(f"[DEBUG] Malformed FILE_NACK for file_id={file_id}, ignoring.")
+        return
+
+    resent = 0
+    for ack_id in window.in_flight_snapshot():
+        index = int(ack_id.rsplit("_", 1)[1])
+        if any(first <= index <= last for first, last in ranges):
+            resent += retransmit_now(sock, app_state, ack_id)
+
+    if globals.verbose:
+        print(f"\n[RECV <]")
+        print(f"Message Type : FILE_NACK")
+        print(f"From IP      : {sender_ip}")
+        print(f"File ID      : {file_id}")
+        print(f"Missing      : {message.get('MISSING', '')}")
+        print(f"Resent       : {resent}\n")
+
+
+def queue_sack(sock, app_state, file_id, transfer, sender_ip, immediate=False):
+    """Coalesce chunk acknowledgements, a FILE_SACK goes out every SACK_EVERY chunks or after SACK_DELAY"""
+    with transfer["lock"]:
+        transfer["unsacked"] += 1
+        send_now = (
+            immediate
+            or transfer["unsacked"] >= globals.SACK_EVERY
+            or app_state.scheduler is None
+        )
+        if not send_now and transfer["sack_timer"] is None:
+            transfer["sack_timer"] = app_state.scheduler.call_later(
+                globals.SACK_DELAY,
+                send_sack,
+                sock,
+                app_state,
+                file_id,
+                transfer,
+                sender_ip,
+            )
+    if send_now:
+        send_sack(sock, app_state, file_id, transfer, sender_ip)
+
+
+def send_sack(sock, app_state, file_id, transfer, sender_ip):
+    """
+    Selective ACK: CUMULATIVE is the first missing chunk index, bit k of BITMAP
+    (hex) is set when chunk CUMULATIVE + 1 + k has arrived
+    """
+    with transfer["lock"]:
+        if transfer["sack_timer"] is not None:
+            transfer["sack_timer"].cancelled = True
+            transfer["sack_timer"] = None
+        transfer["unsacked"] = 0
+        if transfer["sources"]:
+            # swarm, each seeder gets a FILE_SACK starting at its own part of the
+            # file, anything before that is another seeder's and not in its window
+            sacks = [
+                (ip, source["user_id"], *sack_fields(transfer, source["start"]))
+                for ip, source in transfer["sources"].items()
+                if source["ranges"]
+            ]
+        else:
+            sacks = [(sender_ip, transfer["from"], *sack_fields(transfer, 0))]
+        recovered = transfer["recovered"]
+
+    for ip, to_id, cumulative, bitmap in sacks:
+        message = {
+            "TYPE": "FILE_SACK",
+            "FROM": app_state.user_id,
+            "TO": to_id,
+            "FILEID": file_id,
+            "CUMULATIVE": cumulative,
+            "BITMAP": format(bitmap, "x"),
+            "RECOVERED": recovered,
+        }
+        sock.sendto(encode_message(message), (ip, globals.PORT))
+
+        if globals.verbose:
+            print(f"\n[SEND >]")
+            print(f"Message Type : FILE_SACK")
+            print(f"Timestamp    : {int(time.time())}")
+            print(f"From         : {app_state.user_id}")
+            print(f"To           : {to_id}")
+            print(f"File ID      : {file_id}")
+            print(f"Cumulative   : {cumulative}")
+            print(f"Bitmap       : {message['BITMAP']}\n")
+
+
+def sack_fields(transfer, start: int):
+    """CUMULATIVE and BITMAP from chunk index start on. Caller holds the lock"""
+    received = transfer["received"]
+    cumulative = transfer["cumulative"]
+    if start > cumulative:
+        missing = received.missing_ranges(start, 1)
+        cumulative = missing[0][0] if missing else received.size
+    last = min(cumulative + globals.SACK_RANGE, transfer["total_chunks"] or 0)
+    bitmap = 0
+    for index in range(cumulative + 1, last):
+        if index in received:
+            bitmap |= 1 << (index - cumulative - 1)
+    return cumulative, bitmap
+
+
+def handle_file_sack(message, app_state, sender_ip):
+    """Sender side, clears every chunk the FILE_SACK covers from pending_acks in one go"""
+    file_id = message.get("FILEID")
+    window = app_state.file_send_windows.get(file_id)
+    if window is None:
         return
 
-    base_name, ext = os.path.splitext(filename)
-    filepath = os.path.join(save_dir, filename)
-    counter = 1
-    while os.path.exists(filepath):
-        filepath = os.path.join(save_dir, f"{base_name}_{counter}{ext}")
-        counter += 1
+    try:
+        cumulative = int(message["CUMULATIVE"])
+        bitmap = int(message.get("BITMAP") or "0", 16)
+    except (KeyError, ValueError):
+        if globals.verbose:
+            print(f"[DEBUG] Malformed FILE_SACK for file_id={file_id}, ignoring.")
+        return
+
+    # only what is in flight can be newly acknowledged, so this is O(window)
+    acked = []
+    for ack_id in window.in_flight_snapshot():
+        index = int(ack_id.rsplit("_", 1)[1])
+        if index < cumulative or (
+            index > cumulative and (bitmap >> (index - cumulative - 1)) & 1
+        ):
+            acked.append(ack_id)
+    cleared = acknowledge(app_state, acked)
+    window.recovered = max(window.recovered, int(message.get("RECOVERED", 0)))
+
+    if globals.verbose:
+        print(f"\n[RECV <]")
+        print(f"Message Type : FILE_SACK")
+        print(f"From IP      : {sender_ip}")
+        print(f"File ID      : {file_id}")
+        print(f"Cumulative   : {cumulative}")
+        print(f"Chunks ACKed : {cleared}\n")
 
+
+def chunk_offset(message, chunk_index, total_chunks, chunk_data, transfer) -> int:
+    """Byte offset of a chunk, from OFFSET or, for senders without it, from the uniform chunk size"""
+    if "OFFSET" in message:
+        return int(message["OFFSET"])
+    if chunk_index == total_chunks - 1:
+        return transfer["filesize"] - len(chunk_data)
+    return chunk_index * len(chunk_data)
+
+
+def chunk_written(transfer, offset, data):
+    """
+    Runs on the disk writer thread, marks the blocks the chunk fully covers.
+    Takes lock, so nobody may queue a write while holding it (write_lock).
+    """
+    end = offset + len(data)
+    first = -(-offset // globals.CHUNK_SIZE)
+    if end < transfer["filesize"]:
+        stop = end // globals.CHUNK_SIZE
+    else:
+        stop = transfer["blocks"].size  # the last block may be short
+    with transfer["lock"]:
+        transfer["blocks"].add_range(first, stop)
+        due = time.monotonic() - transfer["checkpoint_at"] >= globals.CHECKPOINT_INTERVAL
+    if transfer["digest"] is not None:
+        advance_digest(transfer, offset, data)
+    if transfer["batch"] is not None:
+        extract_ready(transfer)
+    if due:
+        save_transfer_checkpoint(transfer)
+
+
+def advance_digest(transfer, offset=None, data=b""):
+    """
+    Runs on the disk writer thread. Feeds the whole-file digest in byte order:
+    an in-order chunk is hashed from memory, chunks that arrived ahead of a gap
+    are read back from the part file once the gap is filled. By the time the
+    last chunk is written the digest is done, nothing is re-read at the end.
+    """
+    if offset == transfer["digest_offset"]:
+        transfer["digest"].update(data)
+        transfer["digest_offset"] += len(data)
+
+    blocks = transfer["blocks"]
+    filesize = transfer["filesize"]
+    position = transfer["digest_offset"]
+    while position < filesize and position % globals.CHUNK_SIZE == 0:
+        first = stop = position // globals.CHUNK_SIZE
+        while stop < blocks.size and stop in blocks and stop - first < 4096:
+            stop += 1
+        if stop == first:
+            break
+        end = min(stop * globals.CHUNK_SIZE, filesize)
+        transfer["digest"].update(read_at(transfer["file"], position, end - position))
+        position = end
+    transfer["digest_offset"] = position
+
+
+def save_transfer_checkpoint(transfer):
+    """Runs on the disk writer thread, only blocks already written are in the bitmap"""
+    if transfer["file"].closed:
+        return  # already assembled
+    os.fsync(transfer["file"].fileno())
+    with transfer["lock"]:
+        bitmap = transfer["blocks"].to_bytes()
+        transfer["checkpoint_at"] = time.monotonic()
+    meta = {
+        "FILEID": transfer["checkpoint_id"],
+        "OFFER_ID": transfer["offer_id"],
+        "FROM": transfer["from"],
+        "FILENAME": transfer["filename"],
+        "FILESIZE": transfer["filesize"],
+        "FILEHASH": transfer["filehash"],
+        "BLOCK_SIZE": globals.CHUNK_SIZE,
+    }
+    if transfer["delta"] is not None:
+        delta = transfer["delta"]
+        meta.update(
+            {
+                "DELTA_BASIS": delta["basis"],
+                "DELTA_BASIS_SIZE": delta["basis_size"],
+                "DELTA_BLOCK_SIZE": delta["block_size"],
+                "TARGET_SIZE": delta["filesize"],
+                "TARGET_HASH": delta["filehash"],
+            }
+        )
+    if transfer["batch"] is not None:
+        meta.update(checkpoint_fields(transfer["batch"]))
+    save_checkpoint(meta, bitmap)
+
+
+def load_transfer(meta, bitmap):
+    """Rebuild a transfer from its checkpoint, None if it can't be used anymore"""
     try:
-        with open(filepath, "wb") as f:
-            for i in range(total_chunks):
-                f.write(chunks[i])
+        filesize = int(meta["FILESIZE"])
+        if int(meta["BLOCK_SIZE"]) != globals.CHUNK_SIZE:
+            return None
+        delta = None
+        if "DELTA_BASIS" in meta:
+            delta = {
+                "basis": meta["DELTA_BASIS"],
+                "basis_size": int(meta["DELTA_BASIS_SIZE"]),
+                "block_size": int(meta["DELTA_BLOCK_SIZE"]),
+                "filesize": int(meta["TARGET_SIZE"]),
+                "filehash": meta["TARGET_HASH"],
+            }
+        batch = load_batch(meta) if "BATCH_DEST" in meta else None
+        part_path, part_file = open_part_file(meta["FILEID"], filesize)
+    except (KeyError, ValueError, OSError):
+        return None
+    transfer = new_transfer(
+        meta["FILEID"],
+        meta["FROM"],
+        meta["FILENAME"],
+        filesize,
+        meta.get("FILEHASH", ""),
+        part_path,
+        part_file,
+        ChunkBitmap.from_bytes(bitmap, block_count(filesize)),
+    )
+    transfer["offer_id"] = meta.get("OFFER_ID", meta["FILEID"])
+    transfer["delta"] = delta
+    transfer["batch"] = batch
+    return transfer
+
+
+def find_resumable(app_state, sender, filename, filesize, filehash=""):
+    """Interrupted transfer of this file, still in memory or checkpointed on disk"""
+    for file_id, transfer in list(app_state.file_transfers.items()):
+        if not transfer["complete"] and (
+            transfer["from"],
+            transfer["filename"],
+            transfer["filesize"],
+            transfer["filehash"],
+        ) == (sender, filename, filesize, filehash):
+            del app_state.file_transfers[file_id]
+            return transfer
+
+    for meta, bitmap in load_checkpoints():
+        if (
+            meta.get("FROM"),
+            meta.get("FILENAME"),
+            meta.get("FILESIZE"),
+            meta.get("FILEHASH", ""),
+        ) == (sender, filename, str(filesize), filehash):
+            return load_transfer(meta, bitmap)
+    return None
+
+
+def interrupted_transfers(app_state) -> list:
+    """Checkpoints no transfer is actively receiving, for the resume_file command"""
+    active = {
+        transfer["checkpoint_id"]
+        for transfer in app_state.file_transfers.values()
+        if transfer["nacks_sent"] < globals.NACK_MAX
+    }
+    found = []
+    for meta, bitmap in load_checkpoints():
+        if meta.get("FILEID") in active:
+            continue
+        transfer = load_transfer(meta, bitmap)
+        if transfer is None:
+            continue
+        transfer["file"].close()  # just listing, reopened by resume_file
+        found.append(transfer)
+    return found
+
+
+def resume_file(checkpoint_id, app_state, sock):
+    """Ask the original sender to continue an interrupted transfer"""
+    transfer = None
+    for file_id, active in list(app_state.file_transfers.items()):
+        if active["checkpoint_id"] == checkpoint_id and not active["complete"]:
+            transfer = app_state.file_transfers.pop(file_id)
+            break
+    if transfer is None:
+        for meta, bitmap in load_checkpoints():
+            if meta.get("FILEID") == checkpoint_id:
+                transfer = load_transfer(meta, bitmap)
+                break
+    if transfer is None:
+        print("No such interrupted transfer found.")
+        return
+
+    to_ip = transfer["from"].split("@")[-1]
+    resume_transfer(
+        sock, app_state, transfer["offer_id"], transfer, max_chunk_size_for(to_ip)
+    )
+
+
+def missing_byte_ranges(transfer) -> list:
+    """Inclusive (first, last) byte ranges not on disk yet, block aligned"""
+    blocks = transfer["blocks"]
+    limit = globals.RESUME_MAX_RANGES
+    ranges = blocks.missing_ranges(0, limit + 1)
+    if len(ranges) > limit:
+        # too many holes for one message, the last range runs to the end instead
+        ranges = ranges[: limit - 1] + [(ranges[limit - 1][0], blocks.size - 1)]
+    return [
+        (
+            first * globals.CHUNK_SIZE,
+            min((last + 1) * globals.CHUNK_SIZE, transfer["filesize"]) - 1,
+        )
+        for first, last in ranges
+    ]
+
+
+def resume_transfer(sock, app_state, file_id, transfer, chunk_size):
+    """Receive the rest of an interrupted transfer under file_id, sends FILE_RESUME"""
+    reset_session(transfer)
+    transfer["offer_id"] = file_id
+    app_state.file_transfers[file_id] = transfer
+    writer = get_disk_writer(app_state)
+    writer.call(save_transfer_checkpoint, transfer)
+
+    with transfer["lock"]:
+        missing = missing_byte_ranges(transfer)
+        have = len(transfer["blocks"]) * globals.CHUNK_SIZE
+    if not missing:
+        # everything was on disk already, it only wasn't renamed yet
+        transfer["complete"] = True
+        writer.call(assemble_file, file_id, app_state, sock)
+        return
+
+    message = {
+        "TYPE": "FILE_RESUME",
+        "FROM": app_state.user_id,
+        "TO": transfer["from"],
+        "FILEID": file_id,
+        "CHUNK_SIZE": chunk_size,
+        "FEC": "1",
+        "BINARY": "1",
+        "MISSING": format_ranges(missing),
+        "TIMESTAMP": str(int(time.time())),
+    }
+    to_ip = transfer["from"].split("@")[-1]
+    sock.sendto(encode_message(message), (to_ip, globals.PORT))
+
+    print(f"Resuming {transfer['filename']}, ", end="")
+    print(f"{min(have, transfer['filesize'])}/{transfer['filesize']} bytes already received")
+    if globals.verbose:
+        print(f"[INFO] FILE_RESUME for file_id={file_id} missing {message['MISSING']}")
+
+
+def get_disk_writer(app_state):
+    with app_state.lock:
+        if app_state.disk_writer is None:
+            app_state.disk_writer = DiskWriter()
+            app_state.disk_writer.start()
+        return app_state.disk_writer
+
+
+def assemble_file(file_id, app_state, sock):
+    """Runs on the disk writer thread after the last chunk is written"""
+    transfer = app_state.file_transfers[file_id]
+
+    if transfer["digest"] is not None:
+        advance_digest(transfer)  # normally a no-op, the digest kept up with the writes
+        if transfer["digest"].hexdigest() != transfer["filehash"]:
+            # every chunk passed its CRC, so the sender's file itself changed
+            print(
+                f"\n[ERROR] {transfer['filename']} does not match the offered "
+                f"file hash, discarded.\n"
+            )
+            discard_transfer(file_id, app_state, sock, transfer)
+            return
+
+    if transfer["batch"] is not None:
+        finish_batch(file_id, app_state, sock, transfer)
+        return
+    transfer["file"].close()
+
+    part_path = transfer["part_path"]
+    filehash = transfer["filehash"]
+    if transfer["delta"] is not None:
+        # what arrived are the changes, the file is rebuilt with the old copy
+        part_path = rebuild_file(transfer)
+        if part_path is None:
+            print(
+                f"\n[ERROR] {transfer['filename']} rebuilt from the changes does "
+                f"not match the offered file hash, discarded.\n"
+            )
+            discard_transfer(file_id, app_state, sock, transfer)
+            return
+        filehash = transfer["delta"]["filehash"]
+
+    filepath = unique_path(transfer["filename"])
+    try:
+        os.replace(part_path, filepath)
         print(f"\n[INFO] File transfer complete. File saved as: {filepath}\n")
     except Exception as e:
         print(f"[ERROR] Failed to write file: {e}")
         return
+    remove_checkpoint(transfer["checkpoint_id"])
+    if filehash:
+        # what came in a swarm or one to many send may go out the same way
+        shared = transfer["sources"] is not None or transfer["multi"]
+        share_file(app_state, filehash, filepath, (ANY_PEER,) if shared else ())
+
+    send_file_received(sock, app_state.user_id, transfer["from"], file_id)
+    del app_state.file_transfers[file_id]
 
+
+def finish_batch(file_id, app_state, sock, transfer):
+    """Runs on the disk writer thread, the files were unpacked as the stream came in"""
+    extract_ready(transfer)  # normally a no-op as well
+    batch = transfer["batch"]
+    if batch["error"] is not None or batch["next"] < batch["count"]:
+        print(f"\n[ERROR] {transfer['filename']} could not be unpacked, discarded.\n")
+        discard_transfer(file_id, app_state, sock, transfer)
+        return
+    transfer["file"].close()
+    os.remove(transfer["part_path"])  # the stream itself isn't kept
+    remove_checkpoint(transfer["checkpoint_id"])
+    print(
+        f"\n[INFO] File transfer complete. {batch['count']} files saved in: "
+        f"{batch['dest']}\n"
+    )
     send_file_received(sock, app_state.user_id, transfer["from"], file_id)
     del app_state.file_transfers[file_id]
 
 
-def send_file_received(sock, from_id, to_id, file_id):
+def discard_transfer(file_id, app_state, sock, transfer):
+    """Drop a file that doesn't match the offered hash and tell the sender"""
+    transfer["file"].close()
+    try:
+        os.remove(transfer["part_path"])
+    except OSError:
+        pass
+    if transfer["batch"] is not None:
+        discard_batch(transfer)
+    remove_checkpoint(transfer["checkpoint_id"])
+    send_file_received(sock, app_state.user_id, transfer["from"], file_id, "CORRUPT")
+    del app_state.file_transfers[file_id]
+
+
+def send_file_received(sock, from_id, to_id, file_id, status="COMPLETE", deduped=False):
     message = {
         "TYPE": "FILE_RECEIVED",
         "FROM": from_id,
         "TO": to_id,
         "FILEID": file_id,
-        "STATUS": "COMPLETE",
+        "STATUS": status,
         "TIMESTAMP": str(int(time.time())),
     }
+    if deduped:
+        message["DEDUPED"] = "1"  # had the content already, no chunks were needed
 
     if "@" not in to_id or len(to_id.split("@")) < 2:
         print(f"Invalid user ID format for recipient: {to_id}")
         return
 
     ip = to_id.split("@")[1]
-    sock.sendto(build_message(message).encode("utf-8"), (ip, globals.PORT))
+    sock.sendto(encode_message(message), (ip, globals.PORT))
 
 
-def handle_file_received(message):
+def handle_file_received(message, app_state):
     """
     Handler for FILE_RECEIVED message. Called when the sender receives confirmation that the file was received.
     """
+    if message.get("FILEID") in app_state.multi_sends:
+        from file_multicast import handle_multi_received
+
+        handle_multi_received(message, app_state)
+        return
+
+    with app_state.lock:
+        drop_pending_send(app_state, message.get("FILEID"))
 
     if globals.verbose:
         print("[FILE_RECEIVED] Message fields:")
         for key, value in message.items():
             print(f"  {key}: {value}")
+    elif message.get("STATUS", "COMPLETE") != "COMPLETE":
+        print(f"[ERROR] File {message.get('FILEID')} arrived {message['STATUS']}")
+    elif message.get("DEDUPED") == "1":
+        print("[INFO] FILE SENT SUCCESFULLY (receiver already had it)")
     else:
         print("[INFO] FILE SENT SUCCESFULLY")
 
 
+def file_type(filepath: str) -> str:
+    if filepath.endswith((".jpg", ".jpeg")):
+        return "image/jpeg"
+    elif filepath.endswith(".png"):
+        return "image/png"
+    elif filepath.endswith(".txt"):
+        return "text/plain"
+    return "application/octet-stream"  # fallback
+
+
 def send_file(sock, app_state, to_user_id, filepath, description=""):
     if not os.path.isfile(filepath):
         print("File not found.")
         return
 
     filesize = os.path.getsize(filepath)
-    filetype = "application/octet-stream"  # fallback
-    if filepath.endswith((".jpg", ".jpeg")):
-        filetype = "image/jpeg"
-    elif filepath.endswith(".png"):
-        filetype = "image/png"
-    elif filepath.endswith(".txt"):
-        filetype = "text/plain"
+    filetype = file_type(filepath)
 
-    with open(filepath, "rb") as f:
-        data = f.read()
+    try:
+        filehash = sha256_file(filepath)
+    except OSError as e:
+        print(f"[ERROR] Could not read {filepath}: {e}")
+        return
 
     file_id = uuid.uuid4().hex[:8]
     timestamp = int(time.time())
@@ -243,22 +1397,29 @@ def send_file(sock, app_state, to_user_id, filepath, description=""):
         "DESCRIPTION": description,
         "TIMESTAMP": timestamp,
         "TOKEN": token,
+        "SACK": "1",
+        "FILEHASH": filehash,
+        "MAX_CHUNK_SIZE": max_chunk_size_for(to_user_id.split("@")[-1]),
     }
+    if globals.BINARY_CHUNKS:
+        offer_msg["BINARY"] = "1"  # the receiver may pick bigger, unencoded chunks
+    if filesize >= globals.DELTA_MIN_SIZE:
+        offer_msg["DELTA"] = "1"  # receiver may answer with FILE_SIGNATURE instead
 
     if "@" not in to_user_id or len(to_user_id.split("@")) < 2:
         print("Invalid user ID format. Expected format: username@ip_address")
         return
 
     to_ip = to_user_id.split("@")[1]
-    sock.sendto(build_message(offer_msg).encode("utf-8"), (to_ip, globals.PORT))
+    sock.sendto(encode_message(offer_msg), (to_ip, globals.PORT))
 
-    # Save file data for later chunk sending after acceptance
+    # Only the path is kept until FILE_ACCEPTED, the data is mapped when sending
+    share_file(app_state, filehash, filepath, (to_user_id,))  # if they swarm it
     with app_state.lock:
         app_state.pending_file_sends[file_id] = {
             "sock": sock,
             "to_user_id": to_user_id,
             "to_ip": to_ip,
-            "data": data,
             "token": token,
             "filesize": filesize,
             "filepath": filepath,
@@ -268,56 +1429,254 @@ def send_file(sock, app_state, to_user_id, filepath, description=""):
     print(f"Waiting for FILE_ACCEPTED to send chunks...")
 
 
-def send_file_chunks_thread(send_info, app_state, file_id, to_user_id):
+def iter_send_file_chunks(send_info, app_state, file_id, to_user_id, window):
     """
-    Thread function to send file chunks without blocking the main message loop
+    Sends the file through a congestion window, driven by the TransferEngine.
+    Yields the bytes put on the wire after every chunk, and whenever the window
+    is full (or at the end, until every chunk is ACKed or given up) the
+    predicate to wait for.
     """
+    filesize = send_info["filesize"]
+    try:
+        if send_info.get("batch") is not None:
+            # a folder, its files read as one stream
+            data = open_batch(send_info["batch"], filesize)
+            if data is None:
+                print(f"[ERROR] {send_info['filepath']} changed since it was offered")
+                return
+            try:
+                yield from _send_chunks(
+                    send_info, app_state, file_id, to_user_id, window, data
+                )
+            finally:
+                data.close()
+            return
+        # a delta send streams the delta file in place of the file itself
+        with open(send_info.get("delta_path") or send_info["filepath"], "rb") as f:
+            if os.fstat(f.fileno()).st_size != filesize:
+                print(f"[ERROR] {send_info['filepath']} changed since it was offered")
+                return
+            # chunks are sliced straight from the page cache, so memory use doesn't
+            # depend on the file size (mmap can't map an empty file)
+            data = b""
+            if filesize:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield from _send_chunks(
+                    send_info, app_state, file_id, to_user_id, window, data
+                )
+            finally:
+                if filesize:
+                    data.close()
+    except OSError as e:
+        print(f"[ERROR] Could not read {send_info['filepath']}: {e}")
+    finally:
+        # Remove from pending sends after done, one that gave up is kept so
+        # the receiver can still FILE_RESUME it
+        with app_state.lock:
+            app_state.file_send_windows.pop(file_id, None)
+            if not window.failed:
+                drop_pending_send(app_state, file_id)
+
+
+def drop_pending_send(app_state, file_id):
+    """Caller holds the lock. Forget a finished send, and the delta file it sent if any"""
+    send_info = app_state.pending_file_sends.pop(file_id, None)
+    if send_info is not None and send_info.get("delta_path"):
+        try:
+            os.remove(send_info["delta_path"])
+        except OSError:
+            pass
+
+
+def count_chunks(ranges, chunk_size: int) -> int:
+    return sum((end - start + chunk_size - 1) // chunk_size for start, end in ranges)
+
+
+def _send_chunks(send_info, app_state, file_id, to_user_id, window, data):
     sock = send_info["sock"]
     to_ip = send_info["to_ip"]
-    data = send_info["data"]
     token = send_info["token"]
     filesize = send_info["filesize"]
 
-    chunk_size = globals.CHUNK_SIZE
-    total_chunks = (len(data) + chunk_size - 1) // chunk_size
+    # [start, end) byte ranges to send, only the missing ones when resuming
+    ranges = send_info.get("ranges", [(0, filesize)])
+    chunk_size = send_info["chunk_size"]
+    total_chunks = count_chunks(ranges, chunk_size)
+    # swarm seeders share one index space, chunk i is the bytes at i * chunk_size
+    indexed = "total_chunks" in send_info
+    if indexed:
+        total_chunks = send_info["total_chunks"]
+    window.set_max_window(window_limit(chunk_size))
 
     print(f"[SENDING CHUNKS] for file_id={file_id} to {to_user_id}")
 
-    for i in range(total_chunks):
-        chunk_data = data[i * chunk_size : (i + 1) * chunk_size]
-        chunk_msg = {
-            "TYPE": "FILE_CHUNK",
-            "FROM": app_state.user_id,
-            "TO": to_user_id,
-            "FILEID": file_id,
-            "CHUNK_INDEX": i,
-            "TOTAL_CHUNKS": total_chunks,
-            "CHUNK_SIZE": len(chunk_data),
-            "TOKEN": token,
-            "DATA": base64.b64encode(chunk_data).decode("utf-8"),
-        }
-        if globals.verbose:
-            print(f"\n[SEND >]")
-            print(f"Message Type : FILE_CHUNK")
-            print(f"Timestamp    : {int(time.time())}")
-            print(f"From         : {app_state.user_id}")
-            print(f"To           : {to_user_id}")
-            print(f"To IP        : {to_ip}")
-            print(f"File Name    : {send_info['filepath']}")
-            print(f"File ID      : {file_id}")
-            print(f"Chunk        : {i + 1}/{total_chunks}")
-            print(f"Chunk Size   : {len(chunk_data)} bytes")
-            print(f"Status       : SENT\n")
-        send_with_ack(sock, chunk_msg, app_state, to_ip)
+    i = 0
+    chunks_sent = 0  # by this send, i starts high when resuming or seeding a part
+    sent_at_size = 0
+    retransmits_at_size = 0
+    too_big = False  # the last chunk didn't fit a datagram after all
+    group = None  # FEC group being built, see fec.py
+    for r, (offset, end) in enumerate(ranges):
+        while offset < end:
+            if not window.has_room():
+                yield window.has_room
+            if window.failed:
+                break  # receiver is gone, it can FILE_RESUME the rest later
 
-        # No sleep needed - threading handles concurrency naturally
+            # Chunks already sent keep their size and index, only the rest of the
+            # file is re-split, so indices stay in byte order for the receiver.
+            # Sizes stay whole blocks so chunks keep starting on block boundaries.
+            lost = window.retransmits - retransmits_at_size
+            if indexed:
+                i = offset // chunk_size
+            elif chunk_size > globals.CHUNK_SIZE and (
+                too_big
+                or (
+                    sent_at_size >= globals.CHUNK_FALLBACK_SAMPLES
+                    and lost > sent_at_size * globals.CHUNK_FALLBACK_LOSS
+                )
+            ):
+                chunk_size = chunk_size // 2 - chunk_size // 2 % globals.CHUNK_SIZE
+                chunk_size = max(chunk_size, globals.CHUNK_SIZE)
+                total_chunks = i + count_chunks(
+                    [(offset, end)] + ranges[r + 1 :], chunk_size
+                )
+                window.set_max_window(window_limit(chunk_size))
+                sent_at_size = 0
+                retransmits_at_size = window.retransmits
+                if globals.verbose:
+                    reason = "too big to send" if too_big else f"losing {lost}"
+                    print(
+                        f"[DEBUG] file_id={file_id} chunks {reason}, "
+                        f"falling back to {chunk_size} byte chunks"
+                    )
+            too_big = False
 
-    print(f"[SENT FILE] {send_info['filepath']} ({filesize} bytes) to {to_user_id}")
+            chunk_data = data[offset : min(offset + chunk_size, end)]
+            chunk_msg = {
+                "TYPE": "FILE_CHUNK",
+                "FROM": app_state.user_id,
+                "TO": to_user_id,
+                "FILEID": file_id,
+                "CHUNK_INDEX": i,
+                "TOTAL_CHUNKS": total_chunks,
+                "CHUNK_SIZE": len(chunk_data),
+                "OFFSET": offset,
+                "CRC": format(zlib.crc32(chunk_data), "08x"),
+                "TOKEN": token,
+            }
+            if send_info.get("binary"):
+                chunk_msg["PAYLOAD"] = chunk_data  # raw after the header
+            else:
+                chunk_msg["DATA"] = base64.b64encode(chunk_data).decode("utf-8")
+            if globals.verbose:
+                print(f"\n[SEND >]")
+                print(f"Message Type : FILE_CHUNK")
+                print(f"Timestamp    : {int(time.time())}")
+                print(f"From         : {app_state.user_id}")
+                print(f"To           : {to_user_id}")
+                print(f"To IP        : {to_ip}")
+                print(f"File Name    : {send_info['filepath']}")
+                print(f"File ID      : {file_id}")
+                print(f"Chunk        : {i + 1}/{total_chunks}")
+                print(f"Chunk Size   : {len(chunk_data)} bytes")
+                print(f"Status       : SENT\n")
+            ack_id = f"{file_id}_chunk_{i}"
+            window.on_send(ack_id)
+            try:
+                send_with_ack(sock, chunk_msg, app_state, to_ip, tracker=window)
+            except OSError as e:
+                if e.errno not in MSG_TOO_BIG:
+                    # e.g. ENOBUFS, the chunk is pending like a lost one and
+                    # its retransmit timer sends it again
+                    if globals.verbose:
+                        print(f"[DEBUG] Chunk {i} of file_id={file_id} not sent: {e}")
+                elif not indexed and chunk_size > globals.CHUNK_SIZE:
+                    # the path is smaller than max_chunk_size_for assumed, this
+                    # chunk (same index, already pending) and the rest go smaller
+                    too_big = True
+                    continue
+                else:
+                    forget(app_state, ack_id)
+                    window.on_give_up(ack_id)
+                    print(
+                        f"[ERROR] Could not send {send_info['filepath']} to "
+                        f"{to_user_id}: {len(chunk_data)} byte chunks don't fit ({e})"
+                    )
+                    break
+            sent = len(chunk_data)
 
-    # Remove from pending sends after done
-    with app_state.lock:
-        if file_id in app_state.pending_file_sends:
-            del app_state.pending_file_sends[file_id]
+            if send_info.get("fec") and group is None:
+                size = fec.group_size(window, chunks_sent)
+                if size > 1:
+                    group = fec.new_group(size, i, offset)
+            if group is not None:
+                full = fec.add_chunk(group, chunk_data)
+                if full or offset + len(chunk_data) >= end:
+                    # groups never span ranges, so their chunks are contiguous
+                    sent += send_parity(
+                        send_info, app_state, file_id, to_user_id, total_chunks, group
+                    )
+                    group = None
+
+            i += 1
+            offset += len(chunk_data)
+            chunks_sent += 1
+            sent_at_size += 1
+            yield sent  # bytes on the wire, for the engine's scheduling and rate caps
+
+    if not window.drained():
+        yield window.drained
+
+    if window.failed:
+        print(
+            f"[ERROR] File {send_info['filepath']} to {to_user_id}: "
+            f"{len(window.failed)}/{total_chunks} chunks were never acknowledged"
+        )
+    else:
+        print(f"[SENT FILE] {send_info['filepath']} ({filesize} bytes) to {to_user_id}")
+    if globals.verbose:
+        print(
+            f"[DEBUG] file_id={file_id} retransmits={window.retransmits} "
+            f"final window={window.cwnd:.1f} chunks"
+        )
+
+
+def send_parity(send_info, app_state, file_id, to_user_id, total_chunks, group):
+    """
+    Fire and forget, a lost FILE_PARITY only means the chunks get retransmitted.
+    Goes binary like the chunks, base64 parity of a binary sized chunk would
+    not fit a datagram. Returns the parity bytes sent.
+    """
+    if len(group["lengths"]) < 2:
+        return 0  # parity of one chunk is just a copy of it
+    data = fec.parity_bytes(group)
+    message = {
+        "TYPE": "FILE_PARITY",
+        "FROM": app_state.user_id,
+        "TO": to_user_id,
+        "FILEID": file_id,
+        "FIRST_INDEX": group["first"],
+        "OFFSET": group["offset"],
+        "LENGTHS": ",".join(str(n) for n in group["lengths"]),
+        "TOTAL_CHUNKS": total_chunks,
+        "TOKEN": send_info["token"],
+        "CRC": format(zlib.crc32(data), "08x"),
+    }
+    if send_info.get("binary"):
+        message["PAYLOAD"] = data
+    else:
+        message["DATA"] = base64.b64encode(data).decode("utf-8")
+    try:
+        send_info["sock"].sendto(
+            encode_message(message), (send_info["to_ip"], globals.PORT)
+        )
+    except OSError as e:
+        if globals.verbose:
+            print(f"[DEBUG] FILE_PARITY for file_id={file_id} not sent: {e}")
+        return 0
+    return len(data)
 
 
 def handle_file_accepted(message, app_state):
@@ -325,6 +1684,11 @@ def handle_file_accepted(message, app_state):
     from_id = message.get("FROM")
     if file_id is None or from_id is None:
         return
+    if file_id in app_state.multi_sends:
+        from file_multicast import handle_multi_accepted
+
+        handle_multi_accepted(message, app_state)
+        return
 
     with app_state.lock:
         if file_id not in app_state.pending_file_sends:
@@ -335,11 +1699,113 @@ def handle_file_accepted(message, app_state):
             file_id
         ].copy()  # Copy to avoid thread conflicts
 
-    # Start chunk sending in a separate thread
-    thread = threading.Thread(
-        target=send_file_chunks_thread,
-        args=(send_info, app_state, file_id, from_id),
-        daemon=True,
+    send_info["binary"] = globals.BINARY_CHUNKS and message.get("BINARY") == "1"
+    send_info["chunk_size"] = negotiated_chunk_size(message, send_info)
+    send_info["fec"] = message.get("FEC") == "1"
+    start_sending(send_info, app_state, file_id, from_id)
+
+
+def negotiated_chunk_size(message, send_info) -> int:
+    """
+    CHUNK_SIZE the receiver picked, capped to our side of the path. Peers
+    that don't negotiate, or pick something that isn't a positive number of
+    whole blocks, get the default chunk size.
+    """
+    try:
+        chunk_size = int(message.get("CHUNK_SIZE", globals.CHUNK_SIZE))
+    except ValueError:
+        chunk_size = 0
+    if chunk_size <= 0 or chunk_size % globals.CHUNK_SIZE:
+        print(
+            f"[WARN] Invalid chunk size {message.get('CHUNK_SIZE')} from "
+            f"{message['FROM']}, using {globals.CHUNK_SIZE}"
+        )
+        chunk_size = globals.CHUNK_SIZE
+    return min(chunk_size, max_chunk_size_for(send_info["to_ip"], send_info["binary"]))
+
+
+def handle_file_resume(message, app_state):
+    """
+    Receiver already has part of the file (it restarted, or we gave up on it
+    earlier), send only the byte ranges listed in MISSING
+    """
+    file_id = message.get("FILEID")
+    from_id = message.get("FROM")
+    if file_id is None or from_id is None:
+        return
+
+    with app_state.lock:
+        if file_id not in app_state.pending_file_sends:
+            print(f"[WARN] Received FILE_RESUME for unknown file_id={file_id}")
+            return
+        send_info = app_state.pending_file_sends[file_id].copy()
+
+    try:
+        ranges = parse_ranges(message.get("MISSING", ""))
+    except ValueError:
+        if globals.verbose:
+            print(f"[DEBUG] Malformed FILE_RESUME for file_id={file_id}, ignoring.")
+        return
+
+    filesize = send_info["filesize"]
+    send_info["ranges"] = [
+        (first, min(last + 1, filesize)) for first, last in ranges if first < filesize
+    ]
+    # the token from the original offer may have expired in the meantime
+    timestamp = int(time.time())
+    send_info["token"] = f"{app_state.user_id}|{timestamp + globals.POST_TTL}|file"
+    send_info["binary"] = globals.BINARY_CHUNKS and message.get("BINARY") == "1"
+    send_info["chunk_size"] = negotiated_chunk_size(message, send_info)
+    send_info["fec"] = message.get("FEC") == "1"
+    resend = sum(end - start for start, end in send_info["ranges"])
+    print(f"[INFO] Resuming file_id={file_id}, {resend}/{filesize} bytes left to send")
+    start_sending(send_info, app_state, file_id, from_id)
+
+
+def get_transfer_engine(app_state):
+    with app_state.lock:
+        if app_state.transfer_engine is None:
+            app_state.transfer_engine = TransferEngine()
+            if app_state.event_loop is not None:
+                # asyncio runtime, the engine runs as a task on the loop
+                app_state.transfer_engine.start_async(app_state.event_loop)
+            else:
+                app_state.transfer_engine.start()
+        return app_state.transfer_engine
+
+
+def start_sending(send_info, app_state, file_id, from_id):
+    """Hand the file to the transfer engine, which multiplexes every send"""
+    engine = get_transfer_engine(app_state)
+    window = SendWindow(on_wake=engine.wake)
+    with app_state.lock:
+        if file_id in app_state.file_send_windows:
+            return  # already being sent
+        app_state.file_send_windows[file_id] = window
+
+    ranges = send_info.get("ranges", [(0, send_info["filesize"])])
+    engine.add(
+        file_id,
+        send_info["to_ip"],
+        sum(end - start for start, end in ranges),
+        window,
+        iter_send_file_chunks(send_info, app_state, file_id, from_id, window),
+    )
+    print(f"[INFO] Queued file_id={file_id} for sending")
+
+
+def register_handlers(dispatcher):
+    dispatcher.register("FILE_OFFER", handle_file_offer, needs_sock=True)
+    dispatcher.register(
+        "FILE_CHUNK", handle_file_chunk, lossy=True, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register(
+        "FILE_PARITY", handle_file_parity, lossy=True, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register("FILE_ACCEPTED", handle_file_accepted)
+    dispatcher.register("FILE_RESUME", handle_file_resume)
+    dispatcher.register("FILE_RECEIVED", handle_file_received)
+    dispatcher.register("FILE_SACK", handle_file_sack, needs_addr=True)
+    dispatcher.register(
+        "FILE_NACK", handle_file_nack, needs_sock=True, needs_addr=True
     )
-    thread.start()
-    print(f"[INFO] Started file chunk sending thread for file_id={file_id}")
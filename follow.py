@@ -25,7 +25,7 @@ def send_follow(sock: socket, target_user_id: str, app_state: AppState):
             "TOKEN": f"{app_state.user_id}|{timestamp_now + globals.TTL}|follow",
         }
         sock.sendto(
-            build_message(message).encode("utf-8"), (target_user["ip"], globals.PORT)
+            encode_message(message), (target_user["ip"], globals.PORT)
         )
         if globals.verbose:
             print(f"\n[SEND >]")
@@ -101,7 +101,7 @@ def send_unfollow(sock: socket, target_user_id: str, app_state: AppState):
                 f'\n[FOLLOW] You unfollowed {target_user["display_name"]}', end="\n\n"
             )
             sock.sendto(
-                build_message(message).encode("utf-8"),
+                encode_message(message),
                 (target_user["ip"], globals.PORT),
             )
         except KeyError as e:
@@ -136,6 +136,11 @@ def handle_unfollow_message(message, app_state: AppState):
             print("\n[ERROR]: TOKEN invalid\n")
 
 
+def register_handlers(dispatcher):
+    dispatcher.register("FOLLOW", handle_follow_message)
+    dispatcher.register("UNFOLLOW", handle_unfollow_message)
+
+
 # still thinking if we implement local storage
 def load_follow_list(): ...
 
@@ -34,13 +34,11 @@ def create_group(sock: socket, group_name: str, members: str, app_state: AppStat
                 "MEMBERS": member_set,
             }
 
-        # send the message to all members
+        # send the message to all members, encoded once for all of them
+        data = encode_message(message)
         for member in member_set:
             if member in app_state.peers:
-                sock.sendto(
-                    build_message(message).encode("utf-8"),
-                    (app_state.peers[member]["ip"], globals.PORT),
-                )
+                sock.sendto(data, (app_state.peers[member]["ip"], globals.PORT))
 
         if globals.verbose:
             print(f"\n[SEND >]")
@@ -165,13 +163,11 @@ def update_group(
             "TOKEN": f"{app_state.user_id}|{timestamp_now + globals.TTL}|group",
         }
 
-        # send the message to all members concerned
+        # send the message to all members concerned, encoded once for all of them
+        data = encode_message(message)
         for member in members_concerned:
             if member in app_state.peers:
-                sock.sendto(
-                    build_message(message).encode("utf-8"),
-                    (app_state.peers[member]["ip"], globals.PORT),
-                )
+                sock.sendto(data, (app_state.peers[member]["ip"], globals.PORT))
 
         if globals.verbose:
             print(f"\n[SEND >]")
@@ -287,12 +283,10 @@ def group_message(sock: socket, group_id: str, content: str, app_state: AppState
 
         member_set: set = group_identifier.get("MEMBERS") if group_identifier else set()
 
+        data = encode_message(message)
         for member in member_set:
             if member in app_state.peers:
-                sock.sendto(
-                    build_message(message).encode("utf-8"),
-                    (app_state.peers[member]["ip"], globals.PORT),
-                )
+                sock.sendto(data, (app_state.peers[member]["ip"], globals.PORT))
 
         # Save sent group message to app state
         if group_id in app_state.owned_groups:
@@ -380,3 +374,9 @@ def handle_group_message(message: dict, app_state: AppState):
     else:
         if globals.verbose:
             print("\n[ERROR]: TOKEN invalid\n")
+
+
+def register_handlers(dispatcher):
+    dispatcher.register("GROUP_CREATE", handle_create_group)
+    dispatcher.register("GROUP_UPDATE", handle_update_group)
+    dispatcher.register("GROUP_MESSAGE", handle_group_message)
@@ -33,7 +33,7 @@ def send_like(sock: socket, action: str, post_timestamp: str, app_state: AppStat
             and post_timestamp in app_state.received_posts
         ):
             sock.sendto(
-                build_message(message).encode("utf-8"),
+                encode_message(message),
                 (app_state.broadcast_ip, globals.PORT),
             )
             if globals.verbose:
@@ -55,7 +55,7 @@ def send_like(sock: socket, action: str, post_timestamp: str, app_state: AppStat
             and post_timestamp in app_state.received_posts
         ):
             sock.sendto(
-                build_message(message).encode("utf-8"),
+                encode_message(message),
                 (app_state.broadcast_ip, globals.PORT),
             )
             if globals.verbose:
@@ -126,3 +126,7 @@ def handle_like_message(message: dict, app_state: AppState):
     else:
         if globals.verbose:
             print("\n[ERROR]: TOKEN invalid\n")
+
+
+def register_handlers(dispatcher):
+    dispatcher.register("LIKE", handle_like_message)
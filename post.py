@@ -1,6 +1,7 @@
 # post.py
 import socket
 import uuid
+import avatar
 import utils.globals as globals
 from datetime import datetime, timezone
 from utils import *
@@ -21,11 +22,8 @@ def send_post(sock: socket, content: str, app_state: AppState):
             "TOKEN": f"{app_state.user_id}|{timestamp_now + globals.POST_TTL}|broadcast",
         }
 
-        # Add avatar fields if avatar data exists
-        if app_state.avatar_data:
-            message["AVATAR_TYPE"] = "text"
-            message["AVATAR_ENCODING"] = "base64"
-            message["AVATAR_DATA"] = app_state.avatar_data
+        # inline art too while some peer may not fetch by hash
+        avatar.add_avatar(message, app_state)
 
         # add to dictionary of sent posts
         with app_state.lock:
@@ -42,7 +40,7 @@ def send_post(sock: socket, content: str, app_state: AppState):
         # print(app_state.sent_posts)
 
         sock.sendto(
-            build_message(message).encode("utf-8"),
+            encode_message(message),
             (app_state.broadcast_ip, globals.PORT),
         )
         if globals.verbose:
@@ -58,7 +56,7 @@ def send_post(sock: socket, content: str, app_state: AppState):
         print(f"\n[ERROR] | {e}", end="\n\n")
 
 
-def handle_post_message(message: dict, app_state: AppState):
+def handle_post_message(message: dict, app_state: AppState, sock: socket, sender_ip: str):
     # verify TIMESTAMP, TOKEN, etc.
 
     post_timestamp: str = message["TIMESTAMP"]
@@ -77,7 +75,7 @@ def handle_post_message(message: dict, app_state: AppState):
         if timestamp_ttl - timestamp_now > 0 and scope == "broadcast":
 
             display_name = app_state.peers[user_id]["display_name"]
-            avatar_data = message.get("AVATAR_DATA", "")
+            avatar_hash = avatar.from_message(sock, app_state, message, user_id, sender_ip)
 
             if globals.verbose:
                 print(f"\n[RECV <]")
@@ -86,21 +84,12 @@ def handle_post_message(message: dict, app_state: AppState):
                 print(f"From         : {user_id}")
                 print(f"Display Name : {display_name}")
                 print(f"Content      : {content}")
-                if avatar_data:
-                    print(f"Avatar Type  : {message.get('AVATAR_TYPE', '')}")
-                    print(f"Avatar Encoding : {message.get('AVATAR_ENCODING', '')}")
-                    # Decode base64 avatar for verbose display
-                    from utils.utils import decode_avatar_data
-
-                    decoded_avatar = decode_avatar_data(avatar_data)
-                    print(f"Avatar Data  :\n{decoded_avatar}")
+                if avatar_hash:
+                    print(f"Avatar Hash  : {avatar_hash}")
                 print(f"Status       : RECEIVED\n")
 
             print(f"\n[POST : [UTC Time: {post_timestamp}] {display_name}: {content}")
-            if avatar_data:
-                from utils.utils import display_avatar
-
-                display_avatar(avatar_data)
+            avatar.show_avatar(app_state, avatar_hash)
             print(end="\n\n")
 
             with app_state.lock:
@@ -113,3 +102,10 @@ def handle_post_message(message: dict, app_state: AppState):
     else:
         if globals.verbose:
             print("\n[ERROR]: TOKEN invalid\n")
+
+
+def register_handlers(dispatcher):
+    # POST carries USER_ID instead of FROM
+    dispatcher.register(
+        "POST", handle_post_message, check_from=False, needs_sock=True, needs_addr=True
+    )
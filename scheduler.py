@@ -0,0 +1,86 @@
+# scheduler.py
+import heapq
+import itertools
+import threading
+import time
+
+
+class Timer:
+    """Handle returned by the schedulers, pass it to cancel()"""
+
+    __slots__ = ("when", "callback", "args", "interval", "cancelled")
+
+    def __init__(self, when, callback, args, interval=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def run(self):
+        try:
+            self.callback(*self.args)
+        except Exception as e:
+            print(f"[ERROR] Timer callback {self.callback.__name__} failed: {e}")
+
+
+class Scheduler:
+    """
+    Single deadline-ordered timer thread (binary heap on time.monotonic()).
+
+    Replaces the separate polling loops: retransmits, beacons and cleanup all
+    register here and each wakeup only touches the timers that are due.
+    Cancelled timers are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()  # tie breaker for equal deadlines
+        self._cond = threading.Condition()
+
+    def call_at(self, when: float, callback, *args) -> Timer:
+        return self._push(Timer(when, callback, args))
+
+    def call_later(self, delay: float, callback, *args) -> Timer:
+        return self._push(Timer(time.monotonic() + delay, callback, args))
+
+    def call_every(self, interval: float, callback, *args, first_delay=0) -> Timer:
+        timer = Timer(time.monotonic() + first_delay, callback, args, interval)
+        return self._push(timer)
+
+    def cancel(self, timer: Timer):
+        timer.cancelled = True
+
+    def _push(self, timer: Timer) -> Timer:
+        with self._cond:
+            heapq.heappush(self._heap, (timer.when, next(self._seq), timer))
+            # only wake the thread if the new timer is now the earliest one
+            if self._heap[0][2] is timer:
+                self._cond.notify()
+        return timer
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    when, _, timer = self._heap[0]
+                    if timer.cancelled:
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = when - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(delay)
+
+            # run outside the scheduler lock so callbacks can schedule again
+            timer.run()
+            if timer.interval is not None and not timer.cancelled:
+                timer.when = max(timer.when + timer.interval, time.monotonic())
+                self._push(timer)
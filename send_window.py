@@ -0,0 +1,85 @@
+# send_window.py
+import threading
+import time
+import utils.globals as globals
+
+
+class SendWindow:
+    """
+    AIMD congestion window for one file transfer, counted in chunks.
+
+    The sender only puts a new FILE_CHUNK on the wire while fewer than cwnd
+    chunks are unacknowledged. ACKs grow the window (slow start below ssthresh,
+    then +1 chunk per window), a retransmit timeout halves it, at most once per
+    RTO so a burst of losses from one window only counts once.
+
+    Passed to ack.send_with_ack as the tracker, which calls on_ack,
+    on_retransmit and on_give_up with the chunk's ack id. on_wake is called
+    whenever room opens up, e.g. TransferEngine.wake.
+    """
+
+    def __init__(self, initial=None, max_window=None, on_wake=None):
+        self.cwnd = float(initial or globals.FILE_WINDOW_INITIAL)
+        self.max_window = max_window or globals.FILE_WINDOW_MAX
+        self.ssthresh = float(self.max_window)
+        self.in_flight = set()
+        self.failed = set()
+        self.acked = 0
+        self.retransmits = 0
+        self.recovered = 0  # chunks the receiver rebuilt from FEC parity
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._on_wake = on_wake
+
+    def set_max_window(self, max_window: int):
+        with self._lock:
+            self.max_window = max_window
+            self.ssthresh = min(self.ssthresh, max_window)
+            self.cwnd = min(self.cwnd, max_window)
+
+    # predicates the sender waits on, called without the lock held
+    def has_room(self) -> bool:
+        return len(self.in_flight) < int(self.cwnd)
+
+    def drained(self) -> bool:
+        return not self.in_flight
+
+    def on_send(self, ack_id: str):
+        with self._lock:
+            self.in_flight.add(ack_id)
+
+    def on_ack(self, ack_id: str):
+        with self._lock:
+            if ack_id not in self.in_flight:
+                return
+            self.in_flight.discard(ack_id)
+            self.acked += 1
+            if self.cwnd < self.ssthresh:
+                self.cwnd += 1  # slow start
+            else:
+                self.cwnd += 1 / self.cwnd  # congestion avoidance
+            self.cwnd = min(self.cwnd, self.max_window)
+        self._wake()
+
+    def on_retransmit(self, ack_id: str, rto: float):
+        with self._lock:
+            self.retransmits += 1
+            now = time.monotonic()
+            if now - self.last_decrease > rto:
+                self.ssthresh = max(self.cwnd / 2, globals.FILE_WINDOW_MIN)
+                self.cwnd = self.ssthresh
+                self.last_decrease = now
+
+    def on_give_up(self, ack_id: str):
+        with self._lock:
+            self.in_flight.discard(ack_id)
+            self.failed.add(ack_id)
+        self._wake()
+
+    def in_flight_snapshot(self) -> list:
+        with self._lock:
+            return list(self.in_flight)
+
+    def _wake(self):
+        if self._on_wake is not None:
+            self._on_wake()
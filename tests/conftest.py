@@ -0,0 +1,63 @@
+# conftest.py
+# The modules live at the top of the repository, not in a package.
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.globals as globals
+from helpers import FakeSocket, make_node, meet
+from utils import AppState
+
+PORT = 52998
+
+
+@pytest.fixture
+def sock():
+    return FakeSocket()
+
+
+@pytest.fixture
+def save_dir(tmp_path, monkeypatch):
+    """received_files/ of the tests goes under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "received_files"
+
+
+@pytest.fixture
+def bob(save_dir):
+    """A receiver, its disk writer done with everything before save_dir goes"""
+    app_state = AppState(user_id="bob@127.0.0.1")
+    yield app_state
+    if app_state.disk_writer is not None:
+        done = threading.Event()
+        app_state.disk_writer.call(done.set)
+        done.wait(5)
+
+
+@pytest.fixture(scope="session")
+def nodes():
+    """alice on 127.0.0.1 and bob on 127.0.0.2, for the whole run"""
+    port = globals.PORT
+    globals.PORT = PORT
+    try:
+        alice = make_node("127.0.0.1", "alice", PORT)
+        bob = make_node("127.0.0.2", "bob", PORT)
+    except OSError as e:
+        globals.PORT = port
+        pytest.skip(f"no second loopback address: {e}")
+    meet(alice[0], bob[0])
+    yield alice, bob
+    globals.PORT = port
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """globals the tests change, put back afterwards"""
+    for name in ("PORT", "FEC_GROUP", "MAX_CHUNK_SIZE", "induce_loss", "loss_rate"):
+        monkeypatch.setattr(globals, name, getattr(globals, name))
+    globals.PORT = PORT
+    return globals
@@ -0,0 +1,99 @@
+# helpers.py
+# Receive side state for tests that call the file handlers directly, and
+# loopback nodes for the ones that go through real sockets.
+import hashlib
+import os
+import socket
+import threading
+import time
+
+import disk_writer
+import file_transfer
+from net_comms import build_dispatcher, listener_loop
+from scheduler import Scheduler
+from utils import AppState, ChunkBitmap
+from worker_pool import WorkerPool
+
+
+def receiving(app_state, data, file_id="f1"):
+    part_path, part_file = disk_writer.create_part_file(file_id, len(data))
+    transfer = file_transfer.new_transfer(
+        file_id,
+        "alice@127.0.0.1",
+        "payload.bin",
+        len(data),
+        hashlib.sha256(data).hexdigest(),
+        part_path,
+        part_file,
+        ChunkBitmap(file_transfer.block_count(len(data))),
+    )
+    app_state.file_transfers[file_id] = transfer
+    return transfer
+
+
+def chunk(file_id, index, total, offset, data):
+    return {
+        "TYPE": "FILE_CHUNK",
+        "FROM": "alice@127.0.0.1",
+        "TO": "bob@127.0.0.1",
+        "FILEID": file_id,
+        "CHUNK_INDEX": str(index),
+        "TOTAL_CHUNKS": str(total),
+        "OFFSET": str(offset),
+        "TOKEN": f"alice@127.0.0.1|{int(time.time()) + 600}|file",
+        "PAYLOAD": data,
+    }
+
+
+class FakeSocket:
+    """Records what would have been sent, (data, addr) each"""
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((bytes(data), addr))
+        return len(data)
+
+
+def make_node(ip, name, port):
+    app_state = AppState(user_id=f"{name}@{ip}", display_name=name, local_ip=ip, broadcast_ip=ip)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind((ip, port))
+    app_state.dispatcher = build_dispatcher()
+    app_state.worker_pool = WorkerPool(app_state.dispatcher, app_state, sock)
+    app_state.worker_pool.start()
+    app_state.scheduler = Scheduler()
+    app_state.scheduler.start()
+    threading.Thread(
+        target=listener_loop, args=(sock, app_state, app_state.worker_pool), daemon=True
+    ).start()
+    return app_state, sock
+
+
+def meet(a, b):
+    """a and b know each other, as if they'd seen each other's PROFILE"""
+    for one, other in ((a, b), (b, a)):
+        one.peers[other.user_id] = {
+            "ip": other.local_ip,
+            "display_name": other.display_name,
+            "status": "",
+            "last_seen": time.time(),
+        }
+
+
+class FlakySocket:
+    """alice's socket, but sendto fails with error for datagrams matching fails(data)"""
+
+    def __init__(self, sock, error, fails):
+        self.sock = sock
+        self.error = error
+        self.fails = fails
+        self.failed = 0
+
+    def sendto(self, data, addr):
+        if self.fails(data):
+            self.failed += 1
+            raise OSError(self.error, os.strerror(self.error))
+        return self.sock.sendto(data, addr)
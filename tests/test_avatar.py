@@ -0,0 +1,113 @@
+import base64
+
+import pytest
+
+import avatar
+import net_comms
+from helpers import FakeSocket, meet
+from utils import AppState, decode_message
+
+ART = " /\\_/\\\n( o.o )\n > ^ <\n"
+DATA = base64.b64encode(ART.encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def pair():
+    """alice has an avatar, bob knows her, both ask for avatars by hash"""
+    alice = AppState(user_id="alice@127.0.0.1", display_name="alice", local_ip="127.0.0.1")
+    bob = AppState(user_id="bob@127.0.0.2", display_name="bob", local_ip="127.0.0.2")
+    alice.avatar_data = DATA
+    meet(alice, bob)
+    alice.peers[bob.user_id]["avatar_fetch"] = True
+    bob.peers[alice.user_id]["avatar_fetch"] = True
+    return alice, bob
+
+
+def sent(sock):
+    return [decode_message(data) for data, addr in sock.sent]
+
+
+def profile(app_state):
+    sock = FakeSocket()
+    net_comms.send_profile(sock, "", app_state)
+    [message] = sent(sock)
+    return message
+
+
+def test_request_reply_round_trip(pair, capsys):
+    alice, bob = pair
+    alice_sock, bob_sock = FakeSocket(), FakeSocket()
+    message = profile(alice)
+    assert message["AVATAR_HASH"] == avatar.avatar_hash(DATA)
+    assert "AVATAR_DATA" not in message
+
+    net_comms.handle_profile(message, "127.0.0.1", bob, bob_sock)
+    [request] = sent(bob_sock)
+    assert request["TYPE"] == "AVATAR_REQUEST"
+    assert bob.peers[alice.user_id]["avatar_hash"] == message["AVATAR_HASH"]
+
+    avatar.handle_avatar_request(request, alice, alice_sock, "127.0.0.2")
+    [(data, addr)] = alice_sock.sent
+    assert addr[0] == "127.0.0.2"
+    avatar.handle_avatar_data(decode_message(data), bob)
+    assert bob.avatars[message["AVATAR_HASH"]]["text"] == ART
+    assert ART in capsys.readouterr().out
+
+    # known now, the next PROFILE asks for nothing
+    net_comms.handle_profile(profile(alice), "127.0.0.1", bob, bob_sock)
+    assert len(bob_sock.sent) == 1
+
+
+def test_art_goes_inline_until_every_peer_fetches_by_hash(pair):
+    alice, bob = pair
+    assert profile(alice)["AVATAR_FETCH"] == "1"
+    assert "AVATAR_DATA" not in profile(alice)
+
+    # carol runs an older build, she only sees AVATAR_DATA
+    alice.peers["carol@127.0.0.3"] = {"ip": "127.0.0.3", "display_name": "carol"}
+    message = profile(alice)
+    assert message["AVATAR_DATA"] == DATA
+    assert message["AVATAR_HASH"] == avatar.avatar_hash(DATA)
+
+    dm = {}
+    avatar.add_avatar(dm, alice, [bob.user_id])
+    assert "AVATAR_DATA" not in dm
+    avatar.add_avatar(dm, alice, ["carol@127.0.0.3"])
+    assert dm["AVATAR_DATA"] == DATA
+
+    # nobody known yet, the first PROFILE has it all
+    alice.peers.clear()
+    assert profile(alice)["AVATAR_DATA"] == DATA
+
+
+def test_inline_art_is_cached_without_a_request(pair):
+    alice, bob = pair
+    alice.peers["carol@127.0.0.3"] = {"ip": "127.0.0.3", "display_name": "carol"}
+    bob_sock = FakeSocket()
+    net_comms.handle_profile(profile(alice), "127.0.0.1", bob, bob_sock)
+    assert bob_sock.sent == []
+    assert bob.avatars[avatar.avatar_hash(DATA)]["text"] == ART
+
+
+def test_requests_from_unknown_peers_are_ignored(pair, sock):
+    alice, _ = pair
+    request = {
+        "TYPE": "AVATAR_REQUEST",
+        "FROM": "mallory@127.0.0.6",
+        "AVATAR_HASH": avatar.avatar_hash(DATA),
+    }
+    avatar.handle_avatar_request(request, alice, sock, "127.0.0.6")
+    assert sock.sent == []
+
+
+def test_replies_are_rate_limited_per_ip(pair, sock):
+    alice, bob = pair
+    request = {"TYPE": "AVATAR_REQUEST", "FROM": bob.user_id, "AVATAR_HASH": avatar.avatar_hash(DATA)}
+    for _ in range(5):
+        avatar.handle_avatar_request(request, alice, sock, "127.0.0.2")
+    assert len(sock.sent) == 1
+
+    # as if the interval had passed
+    alice.avatar_replies["127.0.0.2"] -= avatar.globals.AVATAR_REPLY_INTERVAL
+    avatar.handle_avatar_request(request, alice, sock, "127.0.0.2")
+    assert len(sock.sent) == 2
@@ -0,0 +1,38 @@
+import pytest
+
+from utils import ChunkBitmap, format_ranges, parse_ranges
+
+
+def test_add_and_complete():
+    bitmap = ChunkBitmap(10)
+    assert bitmap.add(3)
+    assert not bitmap.add(3)
+    assert 3 in bitmap and 4 not in bitmap
+    assert bitmap.add_range(0, 10) == 9
+    assert bitmap.complete()
+
+
+@pytest.mark.parametrize("index", [-1, -9, 10, 1 << 40])
+def test_add_outside_the_bitmap_is_refused(index):
+    bitmap = ChunkBitmap(10)
+    with pytest.raises(IndexError):
+        bitmap.add(index)
+    assert len(bitmap) == 0 and bitmap.size == 10 and len(bitmap.bits) == 2
+
+
+def test_grow_then_add():
+    bitmap = ChunkBitmap(4)
+    bitmap.grow(20)
+    assert bitmap.add(19)
+    bitmap.grow(8)  # never shrinks
+    assert bitmap.size == 20
+
+
+def test_bytes_round_trip_and_missing_ranges():
+    bitmap = ChunkBitmap(21)
+    bitmap.add_range(0, 8)
+    bitmap.add_range(10, 12)
+    copy = ChunkBitmap.from_bytes(bitmap.to_bytes(), 21)
+    assert len(copy) == 10
+    assert copy.missing_ranges() == [(8, 9), (12, 20)]
+    assert parse_ranges(format_ranges(copy.missing_ranges())) == [(8, 9), (12, 20)]
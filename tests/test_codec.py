@@ -0,0 +1,172 @@
+import pytest
+
+import utils.globals as globals
+from utils import LazyMessage, build_message, decode_message, encode_message, parse_message
+
+ALICE = "alice@192.168.1.10"
+BOB = "bob@192.168.1.11"
+TOKEN = f"{ALICE}|1900000000|file"
+
+# one message of every TYPE the dispatcher handles, as their senders build them
+MESSAGES = [
+    {"TYPE": "PING", "USER_ID": ALICE},
+    {"TYPE": "PROFILE", "USER_ID": ALICE, "DISPLAY_NAME": "Alice", "STATUS": "Exploring LSNP!", "AVATAR_HASH": "ab" * 32},
+    {"TYPE": "POST", "USER_ID": ALICE, "CONTENT": "Hello from LSNP!", "TTL": 3600, "MESSAGE_ID": "f83d2b1c", "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|broadcast"},
+    {"TYPE": "DM", "FROM": ALICE, "TO": BOB, "CONTENT": "Hi Bob!", "TIMESTAMP": 1728938500, "MESSAGE_ID": "f83d2b1d", "TOKEN": f"{ALICE}|1728942100|chat"},
+    {"TYPE": "FOLLOW", "MESSAGE_ID": "f83d2b1e", "FROM": ALICE, "TO": BOB, "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|follow"},
+    {"TYPE": "UNFOLLOW", "MESSAGE_ID": "f83d2b1f", "FROM": ALICE, "TO": BOB, "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|follow"},
+    {"TYPE": "LIKE", "FROM": ALICE, "TO": BOB, "POST_TIMESTAMP": 1728938500, "ACTION": "LIKE", "TIMESTAMP": 1728938501, "TOKEN": f"{ALICE}|1728942100|broadcast"},
+    {"TYPE": "ACK", "MESSAGE_ID": "f83d2b1d", "STATUS": "RECEIVED"},
+    {"TYPE": "GROUP_CREATE", "FROM": ALICE, "GROUP_ID": "tripbuds", "GROUP_NAME": "Trip Buddies", "MEMBERS": f"{ALICE},{BOB}", "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|group"},
+    {"TYPE": "GROUP_UPDATE", "FROM": ALICE, "GROUP_ID": "tripbuds", "ADD": "dave@192.168.1.14", "REMOVE": BOB, "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|group"},
+    {"TYPE": "GROUP_MESSAGE", "FROM": ALICE, "GROUP_ID": "tripbuds", "CONTENT": "See you at 7!", "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|group"},
+    {"TYPE": "TICTACTOE_INVITE", "FROM": ALICE, "TO": BOB, "GAMEID": "g123", "MESSAGE_ID": "f83d2b20", "SYMBOL": "X", "TIMESTAMP": 1728938500, "TOKEN": f"{ALICE}|1728942100|game"},
+    {"TYPE": "TICTACTOE_MOVE", "FROM": ALICE, "TO": BOB, "GAMEID": "g123", "MESSAGE_ID": "f83d2b21", "POSITION": 4, "SYMBOL": "X", "TURN": 1, "TOKEN": f"{ALICE}|1728942100|game"},
+    {"TYPE": "TICTACTOE_RESULT", "FROM": ALICE, "TO": BOB, "GAMEID": "g123", "MESSAGE_ID": "f83d2b22", "RESULT": "WIN", "SYMBOL": "X", "WINNING_LINE": "0,4,8", "TIMESTAMP": 1728938500},
+    {"TYPE": "AVATAR_REQUEST", "FROM": ALICE, "TO": BOB, "AVATAR_HASH": "ab" * 32, "TIMESTAMP": 1728938500},
+    {"TYPE": "AVATAR_DATA", "FROM": BOB, "TO": ALICE, "AVATAR_HASH": "ab" * 32, "AVATAR_TYPE": "text", "AVATAR_ENCODING": "base64", "AVATAR_DATA": "KF9fKQ==", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_OFFER", "FROM": ALICE, "TO": BOB, "FILENAME": "photo.jpg", "FILESIZE": 204800, "FILETYPE": "image/jpeg", "FILEID": "a1b2c3", "FILEHASH": "cd" * 32, "CHUNK_SIZE": 4096, "DESCRIPTION": "Vacation", "TIMESTAMP": 1728938500, "TOKEN": TOKEN},
+    {"TYPE": "FILE_ACCEPTED", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "CHUNK_SIZE": 4096, "FEC": "1", "BINARY": "1", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_RESUME", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "CHUNK_SIZE": 4096, "FEC": "1", "BINARY": "1", "MISSING": "0-4095,8192-204799", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_CHUNK", "FROM": ALICE, "TO": BOB, "FILEID": "a1b2c3", "CHUNK_INDEX": 3, "TOTAL_CHUNKS": 50, "CHUNK_SIZE": 4096, "OFFSET": 12288, "CRC": "1c291ca3", "TOKEN": TOKEN, "DATA": "AAECAwQF"},
+    {"TYPE": "FILE_PARITY", "FROM": ALICE, "TO": BOB, "FILEID": "a1b2c3", "FIRST_INDEX": 0, "OFFSET": 0, "LENGTHS": "4096,4096,4096,4096", "TOTAL_CHUNKS": 50, "CRC": "1c291ca3", "TOKEN": TOKEN, "DATA": "AAECAwQF"},
+    {"TYPE": "FILE_SACK", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "CUMULATIVE": 12, "BITMAP": "5f", "RECOVERED": 1},
+    {"TYPE": "FILE_NACK", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "MISSING": "3-5,9", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_RECEIVED", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "STATUS": "COMPLETE", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_WHO_HAS", "FROM": BOB, "FILEHASH": "cd" * 32, "FILESIZE": 204800, "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_HAVE", "FROM": ALICE, "TO": BOB, "FILEHASH": "cd" * 32, "FILESIZE": 204800, "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_REQUEST", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "FILEHASH": "cd" * 32, "CHUNK_SIZE": 4096, "RANGES": "0-24", "TIMESTAMP": 1728938500},
+    {"TYPE": "FILE_SIGNATURE", "FROM": BOB, "TO": ALICE, "FILEID": "a1b2c3", "BASIS_SIZE": 200000, "BLOCK_SIZE": 512, "PART": 0, "PARTS": 1, "DATA": "AAECAwQF"},
+    {"TYPE": "FILE_DELTA", "FROM": ALICE, "TO": BOB, "FILEID": "a1b2c3", "DELTA_SIZE": 1024, "TIMESTAMP": 1728938500},
+]
+TYPES = [message["TYPE"] for message in MESSAGES]
+BINARY = {"FILE_CHUNK", "FILE_PARITY"}
+
+
+def as_received(message: dict) -> dict:
+    """What the other end parses: every value a string, a bytes PAYLOAD as is"""
+    return {
+        key: value if key == "PAYLOAD" else str(value) for key, value in message.items()
+    }
+
+
+def padded(message: dict) -> dict:
+    """Same message with a header past LAZY_HEADER_SIZE, the way an inline avatar does"""
+    message = dict(message)
+    message["AVATAR_DATA"] = "QUJD" * (globals.LAZY_HEADER_SIZE // 4)
+    return message
+
+
+def test_every_dispatched_type_is_covered():
+    from net_comms import build_dispatcher
+
+    assert sorted(TYPES) == sorted(build_dispatcher().handlers)
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=TYPES)
+def test_text_round_trip(message):
+    text = build_message(message)
+    assert text.endswith("\n\n")
+    assert parse_message(text) == as_received(message)
+    decoded = decode_message(text.encode("utf-8"))
+    assert type(decoded) is dict
+    assert decoded == as_received(message)
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=TYPES)
+def test_lazy_round_trip(message):
+    message = padded(message)
+    decoded = decode_message(encode_message(message))
+    assert type(decoded) is LazyMessage
+    for key, value in as_received(message).items():
+        assert decoded.get(key) == value
+    assert decoded.get("MISSING_KEY", "x") == "x"
+    assert decoded.fields() == as_received(message)
+    assert dict(decoded) == as_received(message)
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["dict", "lazy"])
+@pytest.mark.parametrize("message", [m for m in MESSAGES if m["TYPE"] in BINARY], ids=sorted(BINARY))
+def test_binary_payload_round_trip(message, lazy):
+    message = {key: value for key, value in message.items() if key != "DATA"}
+    if lazy:
+        message = padded(message)
+    payload = bytes(range(256)) + b"\n\nPAYLOAD: 3\n\n" + bytes(range(256))
+    message["PAYLOAD"] = payload
+    data = encode_message(message)
+    assert data.endswith(payload)
+
+    decoded = decode_message(data)
+    assert (type(decoded) is LazyMessage) == lazy
+    assert bytes(decoded.get("PAYLOAD")) == payload
+    fields = dict(decoded)
+    assert bytes(fields.pop("PAYLOAD")) == payload
+    expected = as_received(message)
+    del expected["PAYLOAD"]
+    assert fields == expected
+
+
+def test_binary_payload_from_a_reused_buffer():
+    message = {"TYPE": "FILE_CHUNK", "FILEID": "a1b2c3", "CHUNK_INDEX": 0, "PAYLOAD": b"\x00\xff" * 100}
+    data = encode_message(message)
+    buffer = bytearray(b"\xee" * (len(data) + 64))  # stale bytes past the datagram
+    buffer[: len(data)] = data
+    decoded = decode_message(buffer, len(data))
+    assert decoded["CHUNK_INDEX"] == "0"
+    assert bytes(decoded.pop("PAYLOAD")) == message["PAYLOAD"]
+
+
+def test_payload_length_mismatch_is_rejected():
+    data = encode_message({"TYPE": "FILE_CHUNK", "PAYLOAD": b"abcdef"})
+    with pytest.raises(ValueError):
+        decode_message(data[:-1])
+
+
+def test_small_header_decodes_to_a_dict():
+    decoded = decode_message(encode_message(MESSAGES[0]))
+    assert type(decoded) is dict
+    assert decoded == as_received(MESSAGES[0])
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["dict", "lazy"])
+def test_duplicate_key_reads_as_the_last_one(lazy):
+    header = "TYPE: DM\nFROM: mallory@10.0.0.66\n"
+    if lazy:
+        header += "AVATAR_DATA: " + "A" * globals.LAZY_HEADER_SIZE + "\n"
+    header += "FROM: alice@10.0.0.5\nCONTENT: hi\n\n"
+    decoded = decode_message(header.encode("utf-8"))
+    assert (type(decoded) is LazyMessage) == lazy
+    assert decoded.get("FROM") == "alice@10.0.0.5"
+    assert dict(decoded)["FROM"] == "alice@10.0.0.5"
+    assert parse_message(header)["FROM"] == "alice@10.0.0.5"
+
+
+def test_lazy_keys_match_whole():
+    decoded = decode_message(encode_message(padded({"TYPE": "PROFILE", "USER_ID": ALICE})))
+    assert decoded.get("TYPE") == "PROFILE"  # on the first line, no "\n" before it
+    assert decoded.get("YPE") is None
+    assert decoded.get("ID") is None
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["dict", "lazy"])
+def test_non_ascii_round_trip(lazy):
+    message = {
+        "TYPE": "POST",
+        "USER_ID": "zoë@192.168.1.12",
+        "CONTENT": "Ĉu vi parolas? 日本語 🎲 naïve café",
+        "TIMESTAMP": 1728938500,
+    }
+    if lazy:
+        message = padded(message)
+    data = encode_message(message)
+    assert data == build_message(message).encode("utf-8")
+    decoded = decode_message(data)
+    assert (type(decoded) is LazyMessage) == lazy
+    assert decoded.get("CONTENT") == message["CONTENT"]
+    assert decoded.get("USER_ID") == "zoë@192.168.1.12"
+    assert dict(decoded) == as_received(message)
+
+
+def test_keys_with_braces_are_not_format_fields():
+    message = {"TYPE": "DM", "{0}": "x", "CONTENT": "{}"}
+    assert decode_message(encode_message(message)) == message
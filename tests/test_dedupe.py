@@ -0,0 +1,86 @@
+import hashlib
+import os
+import time
+
+import file_transfer
+from utils import AppState, decode_message
+
+
+def offer(app_state, data, filename="copy.bin"):
+    file_transfer.handle_file_offer(
+        {
+            "TYPE": "FILE_OFFER",
+            "FROM": "alice@127.0.0.1",
+            "TO": app_state.user_id,
+            "FILENAME": filename,
+            "FILESIZE": str(len(data)),
+            "FILETYPE": "application/octet-stream",
+            "FILEID": "f1",
+            "TIMESTAMP": str(int(time.time())),
+            "TOKEN": f"alice@127.0.0.1|{int(time.time()) + 600}|file",
+            "FILEHASH": hashlib.sha256(data).hexdigest(),
+        },
+        app_state,
+        None,
+    )
+
+
+def test_offer_of_a_file_we_have_transfers_nothing(bob, sock, save_dir):
+    data = os.urandom(50000)
+    save_dir.mkdir()
+    (save_dir / "original.bin").write_bytes(data)
+    file_transfer.share_file(bob, hashlib.sha256(data).hexdigest(), str(save_dir / "original.bin"))
+    offer(bob, data)
+
+    file_transfer.accept_file("f1", bob, sock)
+    assert bob.file_transfers == {}
+    [message] = [decode_message(data) for data, addr in sock.sent]
+    assert message["TYPE"] == "FILE_RECEIVED" and message["DEDUPED"] == "1"
+    assert (save_dir / "copy.bin").read_bytes() == data
+
+
+def test_changed_file_is_not_used(bob, sock, save_dir):
+    data = os.urandom(50000)
+    save_dir.mkdir()
+    path = save_dir / "original.bin"
+    path.write_bytes(data)
+    filehash = hashlib.sha256(data).hexdigest()
+    file_transfer.share_file(bob, filehash, str(path))
+    path.write_bytes(os.urandom(50000))
+    os.utime(path, ns=(0, 0))  # same size, mtime surely different
+
+    assert file_transfer.find_shared_file(bob, filehash, 50000) is None
+    assert filehash not in bob.shared_files
+    offer(bob, data)
+    file_transfer.accept_file("f1", bob, sock)
+    assert "f1" in bob.file_transfers  # received the usual way
+
+
+def test_index_only_hashes_what_it_does_not_cover(bob, save_dir, monkeypatch):
+    save_dir.mkdir()
+    files = {name: os.urandom(3000) for name in ("a.bin", "b.bin")}
+    for name, data in files.items():
+        (save_dir / name).write_bytes(data)
+    (save_dir / ".f9.part").write_bytes(b"half a file")
+
+    hashed = []
+    sha256_file = file_transfer.sha256_file
+
+    def counted(path):
+        hashed.append(os.path.basename(path))
+        return sha256_file(path)
+
+    monkeypatch.setattr(file_transfer, "sha256_file", counted)
+    file_transfer.index_received_files(bob)
+    assert sorted(hashed) == ["a.bin", "b.bin"]
+    indexed = {filehash: os.path.basename(entry["path"]) for filehash, entry in bob.shared_files.items()}
+    assert indexed == {hashlib.sha256(data).hexdigest(): name for name, data in files.items()}
+
+    # a restart, only the new and the edited file are read again
+    hashed.clear()
+    (save_dir / "c.bin").write_bytes(os.urandom(100))
+    (save_dir / "a.bin").write_bytes(os.urandom(3001))
+    restarted = AppState(user_id=bob.user_id)
+    file_transfer.index_received_files(restarted)
+    assert sorted(hashed) == ["a.bin", "c.bin"]
+    assert len(restarted.shared_files) == 3
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+
+import disk_writer
+import file_transfer
+import utils.globals as globals
+from helpers import chunk, receiving
+
+
+def test_full_queue_with_slow_disk_does_not_deadlock(bob, save_dir, sock, monkeypatch):
+    # every write takes a while and only one may be pending, so the handler
+    # waits for room in the queue while chunk_written wants the transfer lock
+    write_at = disk_writer.write_at
+
+    def slow_write_at(f, offset, data):
+        time.sleep(0.005)
+        write_at(f, offset, data)
+
+    monkeypatch.setattr(disk_writer, "write_at", slow_write_at)
+    monkeypatch.setattr(globals, "CHECKPOINT_INTERVAL", 0.0)
+
+    app_state = bob
+    app_state.disk_writer = disk_writer.DiskWriter(max_pending=1)
+    app_state.disk_writer.start()
+
+    size = globals.CHUNK_SIZE * 4
+    data = os.urandom(size * 40)
+    total = len(data) // size
+    receiving(app_state, data)
+
+    def receive_all(indices):
+        for index in indices:
+            offset = index * size
+            message = chunk("f1", index, total, offset, data[offset : offset + size])
+            file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+
+    workers = [
+        threading.Thread(target=receive_all, args=(range(n, total, 3),), daemon=True)
+        for n in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert not any(worker.is_alive() for worker in workers), "handlers deadlocked"
+
+    deadline = time.monotonic() + 10
+    while "f1" in app_state.file_transfers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "f1" not in app_state.file_transfers
+    assert (save_dir / "payload.bin").read_bytes() == data
+
+
+def test_call_from_the_writer_thread_runs_inline():
+    writer = disk_writer.DiskWriter(max_pending=1)
+    writer.start()
+    done = threading.Event()
+
+    def job():
+        # the queue may well be full here, waiting for room would never end
+        for _ in range(3):
+            writer.call(lambda: None)
+        done.set()
+
+    writer.call(job)
+    writer.call(lambda: None)
+    assert done.wait(5)
@@ -0,0 +1,58 @@
+import pytest
+
+import utils.globals as globals
+from dispatcher import Dispatcher
+from utils import AppState, LazyMessage, decode_message
+
+PADDING = "AVATAR_DATA: " + "A" * globals.LAZY_HEADER_SIZE + "\n"
+
+
+def dispatcher_for(received):
+    dispatcher = Dispatcher()
+    dispatcher.register("DM", lambda msg, app_state: received.append(msg))
+    return dispatcher
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        # the lazy FROM lookup and the full parse used to disagree on these
+        "TYPE: DM\nFROM: mallory@10.0.0.66\n{pad}FROM: alice@10.0.0.5\nCONTENT: hi\n\n",
+        "TYPE: DM\nFROM: mallory@10.0.0.66\n{pad} FROM : alice@10.0.0.5\nCONTENT: hi\n\n",
+        "TYPE: DM\n{pad}FROM: alice@10.0.0.5\nFROM\t: mallory@10.0.0.66\nCONTENT: hi\n\n",
+    ],
+    ids=["duplicate", "spaced", "tab"],
+)
+def test_lazy_message_cannot_spoof_from(header):
+    received = []
+    app_state = AppState(user_id="bob@10.0.0.7")
+    msg = decode_message(header.format(pad=PADDING).encode("utf-8"))
+    assert type(msg) is LazyMessage
+
+    dispatched = dispatcher_for(received).dispatch(msg, app_state, None, ("10.0.0.66", 50999))
+    for handled in received:
+        assert handled["FROM"].partition("@")[2] == "10.0.0.66"
+    assert dispatched == bool(received)
+
+
+@pytest.mark.parametrize("pad", ["", PADDING], ids=["dict", "lazy"])
+def test_matching_from_is_dispatched(pad):
+    received = []
+    app_state = AppState(user_id="bob@10.0.0.7")
+    header = f"TYPE: DM\nFROM: alice@10.0.0.5\n{pad}CONTENT: hi\n\n"
+    msg = decode_message(header.encode("utf-8"))
+
+    assert dispatcher_for(received).dispatch(msg, app_state, None, ("10.0.0.5", 50999))
+    assert type(received[0]) is dict
+    assert received[0]["CONTENT"] == "hi"
+
+
+def test_own_broadcast_is_dropped_before_parsing():
+    app_state = AppState(user_id="alice@10.0.0.5")
+    header = f"TYPE: DM\nFROM: alice@10.0.0.5\n{PADDING}CONTENT: hi\n\n"
+    msg = decode_message(header.encode("utf-8"))
+    dispatcher = dispatcher_for([])
+
+    assert not dispatcher.dispatch(msg, app_state, None, ("10.0.0.5", 50999))
+    assert msg._fields is None
+    assert dispatcher.dropped == 1
@@ -0,0 +1,74 @@
+import ack
+import group
+import net_comms
+from helpers import FakeSocket
+from scheduler import Scheduler
+from utils import AppState, decode_message
+
+
+class RecordingSocket(FakeSocket):
+    """FakeSocket that keeps the very objects it was given"""
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+        return len(data)
+
+
+def alice():
+    return AppState(
+        user_id="alice@10.0.0.5",
+        display_name="alice",
+        local_ip="10.0.0.5",
+        broadcast_ip="10.0.0.255",
+    )
+
+
+def test_beacons_are_encoded_again_only_when_they_change():
+    app_state = alice()
+    sock = RecordingSocket()
+    net_comms.send_profile(sock, "around", app_state)
+    net_comms.send_profile(sock, "around", app_state)
+    net_comms.send_ping(sock, app_state)
+    net_comms.send_ping(sock, app_state)
+    (first, _), (second, _), (ping, _), (ping_again, _) = sock.sent
+    assert second is first and ping_again is ping
+    assert decode_message(first)["STATUS"] == "around"
+
+    app_state.display_name = "alice b."
+    net_comms.send_profile(sock, "away", app_state)
+    changed = sock.sent[-1][0]
+    assert changed is not first
+    message = decode_message(changed)
+    assert (message["DISPLAY_NAME"], message["STATUS"]) == ("alice b.", "away")
+
+
+def test_retransmits_send_the_bytes_encoded_once():
+    app_state = alice()
+    app_state.scheduler = Scheduler()  # not started, timers only get queued
+    sock = RecordingSocket()
+    message = {"TYPE": "DM", "FROM": app_state.user_id, "MESSAGE_ID": "m1", "CONTENT": "hi"}
+    ack.send_with_ack(sock, message, app_state, "10.0.0.7")
+
+    entry = app_state.pending_acks["m1"]
+    assert entry["type"] == "DM" and "message" not in entry
+    ack.ack_timeout(sock, app_state, "m1", entry)
+    ack.retransmit_now(sock, app_state, "m1")
+    assert [data for data, addr in sock.sent] == [entry["data"]] * 3
+    assert all(data is entry["data"] for data, addr in sock.sent)
+    assert decode_message(entry["data"])["CONTENT"] == "hi"
+
+
+def test_group_fan_out_encodes_once():
+    app_state = alice()
+    members = {f"m{n}@10.0.0.{n}" for n in range(10, 14)}
+    for member in members:
+        app_state.peers[member] = {"ip": member.split("@")[1], "display_name": member}
+    app_state.owned_groups["g1"] = {"GROUP_NAME": "g", "MEMBERS": members}
+    sock = RecordingSocket()
+    group.group_message(sock, "g1", "hello all", app_state)
+
+    ips = sorted(addr[0] for data, addr in sock.sent)
+    assert ips == sorted(member.split("@")[1] for member in members)
+    first = sock.sent[0][0]
+    assert all(data is first for data, addr in sock.sent)
+    assert decode_message(first)["CONTENT"] == "hello all"
@@ -0,0 +1,111 @@
+import os
+import time
+
+import pytest
+
+import fec
+import file_transfer
+import utils.globals as globals
+from helpers import FakeSocket, chunk, receiving
+from send_window import SendWindow
+from utils import AppState, decode_message
+
+
+def parity_message(data, first, count, size, total):
+    """FILE_PARITY for chunks first..first + count - 1, as the sender builds it"""
+    group = fec.new_group(count, first, first * size)
+    for index in range(first, first + count):
+        fec.add_chunk(group, data[index * size : (index + 1) * size])
+    sock = FakeSocket()
+    send_info = {
+        "sock": sock,
+        "to_ip": "127.0.0.1",
+        "token": f"alice@127.0.0.1|{int(time.time()) + 600}|file",
+        "binary": True,
+    }
+    file_transfer.send_parity(
+        send_info, AppState(user_id="alice@127.0.0.1"), "f1", "bob@127.0.0.1", total, group
+    )
+    [(encoded, addr)] = sock.sent
+    return decode_message(encoded)
+
+
+@pytest.mark.parametrize("parity_first", [False, True])
+@pytest.mark.parametrize("lost", [0, 2, 3])
+def test_group_is_rebuilt_after_one_lost_chunk(bob, save_dir, sock, lost, parity_first):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 4 - 100)  # the last chunk is a short one
+    app_state = bob
+    receiving(app_state, data)
+
+    messages = [
+        chunk("f1", index, 4, index * size, data[index * size : (index + 1) * size])
+        for index in range(4)
+        if index != lost
+    ]
+    parity = parity_message(data, 0, 4, size, 4)
+    if parity_first:
+        file_transfer.handle_file_parity(parity, app_state, sock, "127.0.0.1")
+    for message in messages:
+        file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+    if not parity_first:
+        file_transfer.handle_file_parity(parity, app_state, sock, "127.0.0.1")
+
+    deadline = time.monotonic() + 10
+    while "f1" in app_state.file_transfers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (save_dir / "payload.bin").read_bytes() == data
+
+
+def test_two_lost_chunks_wait_for_retransmits(bob, sock):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 4)
+    app_state = bob
+    transfer = receiving(app_state, data)
+    for index in (0, 3):
+        message = chunk("f1", index, 4, index * size, data[index * size : (index + 1) * size])
+        file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+    file_transfer.handle_file_parity(parity_message(data, 0, 4, size, 4), app_state, sock, "127.0.0.1")
+
+    assert [index in transfer["received"] for index in range(4)] == [True, False, False, True]
+    assert not transfer["complete"]
+
+
+def test_auto_group_size_counts_the_chunks_of_this_send(tmp_path, monkeypatch):
+    # a swarm seeder whose part starts at chunk 1000 has only put 10 chunks
+    # out, too few to trust its loss rate however high the index is
+    monkeypatch.setattr(globals, "FEC_GROUP", "auto")
+    size = globals.CHUNK_SIZE
+    path = tmp_path / "payload.bin"
+    path.write_bytes(os.urandom(size * 1010))
+    seen = []
+    group_size = fec.group_size
+    monkeypatch.setattr(
+        fec, "group_size", lambda window, sent: seen.append(sent) or group_size(window, sent)
+    )
+
+    sock = FakeSocket()
+    send_info = {
+        "sock": sock,
+        "to_ip": "127.0.0.1",
+        "token": f"alice@127.0.0.1|{int(time.time()) + 600}|file",
+        "filesize": size * 1010,
+        "filepath": str(path),
+        "ranges": [(size * 1000, size * 1010)],
+        "chunk_size": size,
+        "total_chunks": 1010,
+        "fec": True,
+        "binary": True,
+    }
+    window = SendWindow(initial=64)
+    window.retransmits = 20  # whatever the losses, 10 chunks are no estimate yet
+    app_state = AppState(user_id="alice@127.0.0.1")
+    sends = file_transfer.iter_send_file_chunks(send_info, app_state, "f1", "bob@127.0.0.1", window)
+    for step in sends:
+        if callable(step):
+            break  # every chunk is out, waiting for ACKs
+    sends.close()
+
+    assert seen == list(range(10))
+    types = [decode_message(data)["TYPE"] for data, addr in sock.sent]
+    assert types == ["FILE_CHUNK"] * 10
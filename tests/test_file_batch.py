@@ -0,0 +1,92 @@
+import os
+import time
+
+import pytest
+
+import file_batch
+import file_transfer
+
+
+def make_tree(root):
+    files = {
+        "top.txt": b"top level\n",
+        "sub/a.bin": os.urandom(70000),
+        "sub/deeper/b.bin": os.urandom(1234),
+        "sub/empty": b"",
+        "other/c.txt": b"c" * 5000,
+    }
+    for relpath, data in files.items():
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+def test_folder_arrives_whole(nodes, settings, save_dir, tmp_path):
+    (alice, alice_sock), (bob, bob_sock) = nodes
+    files = make_tree(tmp_path / "proj")
+    bob.pending_file_offers.clear()
+    file_batch.send_batch(alice_sock, alice, bob.user_id, "proj")
+    deadline = time.monotonic() + 30
+    while not bob.pending_file_offers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    file_id = next(iter(bob.pending_file_offers))
+    file_transfer.accept_file(file_id, bob, bob_sock)
+
+    while (file_id in bob.file_transfers or file_id in alice.pending_file_sends) and (
+        time.monotonic() < deadline
+    ):
+        time.sleep(0.02)
+    for relpath, data in files.items():
+        assert (save_dir / "proj" / relpath).read_bytes() == data
+    # the stream itself isn't left behind
+    assert os.listdir(save_dir) == ["proj"]
+
+
+def test_stream_slices_across_files(tmp_path):
+    files = make_tree(tmp_path)
+    collected = file_batch.collect_files(str(tmp_path))
+    # a folder's own files, then its subfolders, each by name
+    assert [relpath for relpath, _, _ in collected] == [
+        "top.txt", "other/c.txt", "sub/a.bin", "sub/empty", "sub/deeper/b.bin"
+    ]
+    manifest = file_batch.build_manifest(collected)
+    data = file_batch.BatchData(manifest, [(path, size) for _, path, size in collected])
+    whole = manifest + b"".join(files[relpath] for relpath, _, _ in collected)
+    assert len(data) == len(whole)
+    cuts = [(0, 10), (len(manifest) - 3, len(manifest) + 5000), (5000, 80000), (0, len(whole))]
+    for start, stop in cuts:
+        assert data[start:stop] == whole[start:stop]
+    data.close()
+
+
+@pytest.mark.parametrize(
+    "name", ["../evil", "a/../../evil", "/etc/passwd", "a//b", "./a", "a\\b", "C:evil", ""]
+)
+def test_names_that_leave_the_folder_are_refused(name):
+    assert file_batch.safe_relpath(name) is None
+
+
+@pytest.mark.parametrize(
+    "manifest",
+    [
+        "3 a\n4 ../b\n",  # leaves the folder
+        "3 a\n4 b",  # cut short
+        "3 a\nfour b\n",
+        "3 a\n5 b\n",  # more bytes than offered
+        "3 a\n",  # fewer files than offered
+    ],
+)
+def test_bad_manifests_are_refused(manifest, tmp_path):
+    batch = file_batch.new_batch({"manifest_size": 9, "count": 2}, str(tmp_path))
+    with pytest.raises(ValueError):
+        file_batch.parse_manifest(manifest, batch, 9 + 7)
+
+
+def test_good_manifest_places_files_in_order(tmp_path):
+    batch = file_batch.new_batch({"manifest_size": 11, "count": 2}, str(tmp_path))
+    entries = file_batch.parse_manifest("3 a\n4 d/b\n", batch, 11 + 7)
+    assert entries == [
+        (11, 3, os.path.join(tmp_path, "a")),
+        (14, 4, os.path.join(tmp_path, "d", "b")),
+    ]
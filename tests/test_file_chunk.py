@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import file_transfer
+import utils.globals as globals
+from helpers import chunk, receiving
+
+
+@pytest.fixture
+def receiver(bob):
+    data = os.urandom(globals.CHUNK_SIZE * 8)
+    return bob, receiving(bob, data), data
+
+
+@pytest.mark.parametrize(
+    "index, total",
+    [(-1, 8), (-8, 8), (8, 8), (0, 1 << 40), (0, 0), (5, 9)],
+    ids=["negative", "wraps", "past-total", "huge-total", "zero-total", "total-past-file"],
+)
+def test_chunk_indices_outside_the_file_are_dropped(receiver, sock, index, total):
+    app_state, transfer, data = receiver
+    size = globals.CHUNK_SIZE
+    message = chunk("f1", index, total, 0, data[:size])
+    file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+
+    received = transfer["received"]
+    assert len(received) == 0
+    assert received.size == 0 and len(received.bits) == 0
+    assert not transfer["complete"]
+
+
+def test_chunks_inside_the_file_are_taken(receiver, sock):
+    app_state, transfer, data = receiver
+    size = globals.CHUNK_SIZE
+    message = chunk("f1", 7, 8, 7 * size, data[7 * size :])
+    file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+    assert 7 in transfer["received"] and transfer["received"].size == 8
+
+
+def test_parity_outside_the_file_is_dropped(receiver, sock):
+    app_state, transfer, data = receiver
+    size = globals.CHUNK_SIZE
+    message = dict(
+        chunk("f1", 0, 1 << 40, 0, data[:size]),
+        TYPE="FILE_PARITY",
+        FIRST_INDEX=str((1 << 40) - 2),
+        LENGTHS=f"{size},{size}",
+    )
+    file_transfer.handle_file_parity(message, app_state, sock, "127.0.0.1")
+    assert transfer["received"].size == 0 and not transfer["parity"]
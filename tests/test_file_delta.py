@@ -0,0 +1,124 @@
+import io
+import os
+import time
+
+import pytest
+
+import file_delta
+import file_transfer
+import utils.globals as globals
+from utils import AppState
+
+
+def delta_of(data, basis_path, basis):
+    block_size = file_delta.block_size_for(len(basis))
+    sig = file_delta.signature(basis_path, block_size)
+    out = io.BytesIO()
+    started = time.perf_counter()
+    literal = file_delta.compute_delta(
+        data, sig, block_size, len(basis), out, int(len(data) * globals.DELTA_MAX_LITERAL)
+    )
+    return literal, out.getvalue(), block_size, time.perf_counter() - started
+
+
+def test_unrelated_large_file_falls_back_quickly(tmp_path):
+    size = 8 << 20
+    basis = os.urandom(size)
+    basis_path = tmp_path / "old.bin"
+    basis_path.write_bytes(basis)
+
+    literal, _, block_size, elapsed = delta_of(os.urandom(size), basis_path, basis)
+    assert literal is None
+    # rolling all of it byte by byte takes seconds, the probe a fraction of that
+    assert elapsed < 1.5
+
+
+def test_edited_file_still_gets_a_delta(tmp_path):
+    size = 2 << 20
+    basis = os.urandom(size)
+    basis_path = tmp_path / "old.bin"
+    basis_path.write_bytes(basis)
+    data = bytearray(basis)
+    data[size // 2 : size // 2 + 5000] = os.urandom(5000)
+    data = os.urandom(100) + bytes(data) + os.urandom(3000)
+
+    literal, delta, block_size, _ = delta_of(data, basis_path, basis)
+    assert literal is not None and literal < 20000
+    with open(basis_path, "rb") as f:
+        rebuilt = b"".join(file_delta.apply_delta(io.BytesIO(delta), f, block_size, size))
+    assert rebuilt == data
+
+
+def test_mostly_new_tail_keeps_the_matched_part(tmp_path):
+    # half the file matches before the unmatched run starts, the probe
+    # mustn't throw that away, the literal share stays under the limit
+    size = 2 << 20
+    basis = os.urandom(size)
+    basis_path = tmp_path / "old.bin"
+    basis_path.write_bytes(basis)
+    data = basis[: size // 2] + os.urandom(size // 4)
+
+    literal, _, block_size, _ = delta_of(data, basis_path, basis)
+    assert literal is not None
+    assert literal < size // 4 + block_size  # the block cut by the edit goes literal too
+
+
+def pending_delta(app_state, file_id="f1"):
+    app_state.pending_deltas[file_id] = {
+        "offer": {
+            "from": "alice@127.0.0.1",
+            "filename": "a.bin",
+            "filesize": 5000,
+            "filehash": "ab" * 32,
+        },
+        "basis": "received_files/a.bin",
+        "basis_size": 4000,
+        "block_size": 1024,
+    }
+
+
+def file_delta_message(**fields):
+    return dict(
+        {"TYPE": "FILE_DELTA", "FROM": "alice@127.0.0.1", "FILEID": "f1", "MESSAGE_ID": "f1_delta"},
+        **fields,
+    )
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"MODE": "DELTA"},
+        {"MODE": "DELTA", "DELTA_SIZE": "lots"},
+        {"MODE": "DELTA", "DELTA_SIZE": "-5"},
+    ],
+)
+def test_malformed_delta_keeps_the_transfer(fields, sock, monkeypatch):
+    accepted = []
+    monkeypatch.setattr(file_transfer, "accept_file", lambda file_id, *args: accepted.append(file_id))
+    app_state = AppState(user_id="bob@127.0.0.2")
+    pending_delta(app_state)
+
+    file_delta.handle_file_delta(file_delta_message(**fields), app_state, sock, "127.0.0.1")
+    assert "f1" in app_state.pending_deltas
+    assert sock.sent == []  # not ACKed, so it comes again
+    assert accepted == []
+
+    message = file_delta_message(MODE="DELTA", DELTA_SIZE="1200")
+    file_delta.handle_file_delta(message, app_state, sock, "127.0.0.1")
+    assert accepted == ["f1"]
+    offer = app_state.pending_file_offers["f1"]
+    assert offer["filesize"] == 1200
+    assert offer["delta_target"]["filesize"] == 5000
+
+
+def test_full_mode_accepts_the_whole_file(sock, monkeypatch):
+    accepted = []
+    monkeypatch.setattr(file_transfer, "accept_file", lambda file_id, *args: accepted.append(file_id))
+    app_state = AppState(user_id="bob@127.0.0.2")
+    pending_delta(app_state)
+
+    file_delta.handle_file_delta(file_delta_message(MODE="FULL"), app_state, sock, "127.0.0.1")
+    assert accepted == ["f1"]
+    assert len(sock.sent) == 1
+    offer = app_state.pending_file_offers["f1"]
+    assert offer["filesize"] == 5000 and "delta_target" not in offer
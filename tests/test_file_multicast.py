@@ -0,0 +1,41 @@
+import errno
+import os
+import time
+
+import file_multicast
+import file_transfer
+from helpers import FlakySocket
+
+
+def test_chunks_that_fail_to_send_are_nacked_and_repaired(nodes, settings, save_dir, capsys, monkeypatch):
+    (alice, alice_sock), (bob, bob_sock) = nodes
+    # loopback has no broadcast, bob is the whole subnet
+    monkeypatch.setattr(alice, "broadcast_ip", bob.local_ip)
+    count = [0]
+
+    def every_third_chunk(data):
+        if not data.startswith(b"TYPE: FILE_CHUNK\n"):
+            return False
+        count[0] += 1
+        return count[0] % 3 == 0
+
+    sock = FlakySocket(alice_sock, errno.ENOBUFS, every_third_chunk)
+    data = os.urandom(256 << 10)
+    with open("payload.bin", "wb") as f:
+        f.write(data)
+    bob.pending_file_offers.clear()
+    file_multicast.send_file_multi(sock, alice, [bob.user_id], "payload.bin")
+    deadline = time.monotonic() + 30
+    while not bob.pending_file_offers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    file_id = next(iter(bob.pending_file_offers))
+    file_transfer.accept_file(file_id, bob, bob_sock)
+
+    while file_id in alice.multi_sends and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert file_id not in alice.multi_sends
+    assert sock.failed
+    assert (save_dir / "payload.bin").read_bytes() == data
+    out = capsys.readouterr().out
+    assert "re-broadcast" in out and "0 chunks re-broadcast" not in out
+    assert "Could not read" not in out
@@ -0,0 +1,107 @@
+import hashlib
+import time
+
+import pytest
+
+import file_swarm
+import file_transfer
+from helpers import meet
+from utils import AppState, decode_message
+
+DATA = bytes(range(256)) * 64
+FILEHASH = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def seeder(save_dir, monkeypatch):
+    """carol has DATA and knows dave, FILE_REQUESTs that pass end up in started"""
+    carol = AppState(user_id="carol@127.0.0.3", display_name="carol", local_ip="127.0.0.3")
+    dave = AppState(user_id="dave@127.0.0.4", display_name="dave", local_ip="127.0.0.4")
+    meet(carol, dave)
+    (save_dir.parent / "src.bin").write_bytes(DATA)
+    carol.started = []
+    monkeypatch.setattr(
+        file_swarm, "start_sending", lambda send_info, *args: carol.started.append(send_info)
+    )
+    return carol
+
+
+def request(from_id="dave@127.0.0.4", token=None):
+    if token is None:
+        token = f"{from_id}|{int(time.time()) + 600}|file"
+    return {
+        "TYPE": "FILE_REQUEST",
+        "FROM": from_id,
+        "TO": "carol@127.0.0.3",
+        "FILEID": "f1",
+        "FILEHASH": FILEHASH,
+        "FILESIZE": str(len(DATA)),
+        "CHUNK_SIZE": str(file_transfer.globals.CHUNK_SIZE),
+        "TOTAL_CHUNKS": "64",
+        "MISSING": "0-8191",
+        "TOKEN": token,
+    }
+
+
+@pytest.mark.parametrize("seed_to", [(file_transfer.ANY_PEER,), ("dave@127.0.0.4",)])
+def test_request_is_answered(seeder, sock, seed_to):
+    file_transfer.share_file(seeder, FILEHASH, "src.bin", seed_to)
+    file_swarm.handle_file_request(request(), seeder, sock, "127.0.0.4")
+    assert [send_info["ranges"] for send_info in seeder.started] == [[(0, 8192)]]
+
+
+@pytest.mark.parametrize(
+    "seed_to, message",
+    [
+        ((), request()),  # only indexed, never offered or swarmed
+        (("erin@127.0.0.5",), request()),  # offered to someone else
+        ((file_transfer.ANY_PEER,), request("mallory@127.0.0.6")),  # not a peer of ours
+        ((file_transfer.ANY_PEER,), request(token="")),
+        ((file_transfer.ANY_PEER,), request(token="carol@127.0.0.3|9999999999|file")),
+        ((file_transfer.ANY_PEER,), request(token="dave@127.0.0.4|1|file")),
+        ((file_transfer.ANY_PEER,), request(token="dave@127.0.0.4|9999999999|chat")),
+    ],
+)
+def test_request_is_refused(seeder, sock, seed_to, message):
+    file_transfer.share_file(seeder, FILEHASH, "src.bin", seed_to)
+    file_swarm.handle_file_request(message, seeder, sock, "127.0.0.4")
+    assert seeder.started == []
+
+
+def test_who_has_is_only_answered_for_seeded_files(seeder, sock):
+    who_has = {
+        "TYPE": "FILE_WHO_HAS",
+        "FROM": "dave@127.0.0.4",
+        "FILEHASH": FILEHASH,
+        "FILESIZE": str(len(DATA)),
+    }
+    file_transfer.share_file(seeder, FILEHASH, "src.bin")
+    file_swarm.handle_file_who_has(who_has, seeder, sock, "127.0.0.4")
+    assert sock.sent == []
+
+    # offering it again keeps the earlier peers, seeding only ever widens
+    file_transfer.share_file(seeder, FILEHASH, "src.bin", ("dave@127.0.0.4",))
+    file_transfer.share_file(seeder, FILEHASH, "src.bin", ("erin@127.0.0.5",))
+    file_swarm.handle_file_who_has(who_has, seeder, sock, "127.0.0.4")
+    [(data, addr)] = sock.sent
+    assert decode_message(data)["TYPE"] == "FILE_HAVE"
+    assert addr[0] == "127.0.0.4"
+
+
+def test_swarm_received_files_are_seeded_to_any_peer(nodes, settings, save_dir, monkeypatch):
+    (alice, alice_sock), (bob, bob_sock) = nodes
+    monkeypatch.setattr(file_transfer.globals, "SWARM_DISCOVERY", 0.1)
+    with open("payload.bin", "wb") as f:
+        f.write(DATA)
+    bob.pending_file_offers.clear()
+    file_transfer.send_file(alice_sock, alice, bob.user_id, "payload.bin")
+    deadline = time.monotonic() + 30
+    while not bob.pending_file_offers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    file_id = next(iter(bob.pending_file_offers))
+    file_transfer.accept_file(file_id, bob, bob_sock, swarm=True)
+    while FILEHASH not in bob.shared_files and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert (save_dir / "payload.bin").read_bytes() == DATA
+    assert alice.shared_files[FILEHASH]["seed_to"] == {bob.user_id}
+    assert bob.shared_files[FILEHASH]["seed_to"] == {file_transfer.ANY_PEER}
@@ -0,0 +1,132 @@
+import errno
+import os
+import time
+
+import pytest
+
+import file_transfer
+import utils.globals as globals
+from helpers import FlakySocket
+from utils import AppState, decode_message
+
+
+def transfer(nodes, data, sender_sock=None, timeout=30):
+    """Sends data from alice to bob, returns bob's copy or None"""
+    (alice, alice_sock), (bob, bob_sock) = nodes
+    with open("payload.bin", "wb") as f:
+        f.write(data)
+    bob.pending_file_offers.clear()
+    file_transfer.send_file(sender_sock or alice_sock, alice, bob.user_id, "payload.bin")
+    deadline = time.monotonic() + timeout
+    while not bob.pending_file_offers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    file_id = next(iter(bob.pending_file_offers))
+    file_transfer.accept_file(file_id, bob, bob_sock)
+
+    received = os.path.join(file_transfer.SAVE_DIR, "payload.bin")
+    while time.monotonic() < deadline:
+        if os.path.exists(received) and file_id not in bob.file_transfers:
+            with open(received, "rb") as f:
+                return f.read()
+        time.sleep(0.02)
+    return None
+
+
+def test_binary_parity_fits_a_datagram():
+    # the biggest group of the biggest binary chunks we'd pick on loopback
+    chunk_size = file_transfer.max_chunk_size_for("127.0.0.1", binary=True)
+    group = file_transfer.fec.new_group(globals.FEC_MAX_GROUP, 123456, 10**10)
+    for _ in range(globals.FEC_MAX_GROUP):
+        file_transfer.fec.add_chunk(group, os.urandom(chunk_size))
+
+    sent = []
+
+    class Sock:
+        def sendto(self, data, addr):
+            sent.append(data)
+
+    send_info = {
+        "sock": Sock(),
+        "to_ip": "127.0.0.1",
+        "token": f"alice@192.168.100.200|{int(time.time())}|file",
+        "binary": True,
+    }
+    assert file_transfer.send_parity(
+        send_info, AppState(user_id="alice@192.168.100.200"), "a1b2c3d4",
+        "bob@192.168.100.201", 1000000, group,
+    ) == chunk_size
+    assert len(sent[0]) <= globals.MAX_UDP_PAYLOAD
+    message = decode_message(sent[0])
+    assert "DATA" not in message
+    assert bytes(message["PAYLOAD"]) == file_transfer.fec.parity_bytes(group)
+
+
+def test_fec_over_binary_chunks(nodes, settings, save_dir, capsys):
+    settings.FEC_GROUP = 4
+    data = os.urandom(2 << 20)
+    assert transfer(nodes, data) == data
+    assert "[ERROR]" not in capsys.readouterr().out
+
+
+def test_fec_over_binary_chunks_rebuilds_lost_ones(nodes, settings, save_dir):
+    settings.FEC_GROUP = 4
+    settings.induce_loss = True
+    settings.loss_rate = 0.05
+    data = os.urandom(1 << 20)
+    assert transfer(nodes, data) == data
+
+
+def test_chunks_too_big_for_the_path_are_resent_smaller(nodes, settings, save_dir, capsys):
+    (alice, alice_sock), _ = nodes
+    sock = FlakySocket(alice_sock, errno.EMSGSIZE, lambda data: len(data) > 20000)
+    data = os.urandom(1 << 20)
+    assert transfer(nodes, data, sock) == data
+    assert sock.failed
+    assert "Could not read" not in capsys.readouterr().out
+
+
+def test_send_errors_are_retried_as_losses(nodes, settings, save_dir, capsys):
+    (alice, alice_sock), _ = nodes
+    count = [0]
+
+    def every_tenth_chunk(data):
+        if not data.startswith(b"TYPE: FILE_CHUNK\n"):
+            return False
+        count[0] += 1
+        return count[0] % 10 == 0
+
+    sock = FlakySocket(alice_sock, errno.ENOBUFS, every_tenth_chunk)
+    data = os.urandom(1 << 20)
+    assert transfer(nodes, data, sock) == data
+    assert sock.failed
+    assert "Could not read" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "chunk_size, expected",
+    [
+        ("0", globals.CHUNK_SIZE),
+        ("-256", globals.CHUNK_SIZE),
+        ("1000", globals.CHUNK_SIZE),
+        ("lots", globals.CHUNK_SIZE),
+        (None, globals.CHUNK_SIZE),
+        ("512", 512),
+        ("1048576", None),  # capped to our side of the path
+    ],
+)
+def test_accepted_chunk_size_is_validated(chunk_size, expected, monkeypatch):
+    started = []
+    monkeypatch.setattr(
+        file_transfer, "start_sending", lambda send_info, *args: started.append(send_info)
+    )
+    app_state = AppState(user_id="alice@10.0.0.5")
+    app_state.pending_file_sends["f1"] = {"to_ip": "10.0.0.7", "filesize": 4096}
+    message = {"TYPE": "FILE_ACCEPTED", "FROM": "bob@10.0.0.7", "FILEID": "f1", "BINARY": "1"}
+    if chunk_size is not None:
+        message["CHUNK_SIZE"] = chunk_size
+
+    file_transfer.handle_file_accepted(message, app_state)
+    file_transfer.handle_file_resume(dict(message, TYPE="FILE_RESUME", MISSING="0-4095"), app_state)
+    if expected is None:
+        expected = file_transfer.max_chunk_size_for("10.0.0.7", binary=True)
+    assert [send_info["chunk_size"] for send_info in started] == [expected, expected]
@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import os
+import time
+import zlib
+
+import pytest
+
+import file_transfer
+import utils.globals as globals
+from helpers import chunk, receiving
+from utils import decode_message
+
+
+def crc(data):
+    return format(zlib.crc32(data), "08x")
+
+
+def wait_assembled(app_state, file_id="f1"):
+    deadline = time.monotonic() + 10
+    while file_id in app_state.file_transfers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert file_id not in app_state.file_transfers
+
+
+@pytest.mark.parametrize(
+    "fields, expected",
+    [
+        ({"DATA": base64.b64encode(b"hello").decode(), "CRC": crc(b"hello")}, b"hello"),
+        ({"DATA": base64.b64encode(b"hello").decode()}, b"hello"),  # from before CRC
+        ({"DATA": base64.b64encode(b"hello").decode(), "CRC": crc(b"hellO")}, None),
+        ({"DATA": "not base64!", "CRC": crc(b"hello")}, None),
+        ({"CRC": crc(b"hello")}, None),
+        ({"PAYLOAD": memoryview(b"hello"), "CRC": crc(b"hello")}, b"hello"),
+        ({"PAYLOAD": memoryview(b"hellO"), "CRC": crc(b"hello")}, None),
+    ],
+)
+def test_decode_chunk_checks_the_crc(fields, expected):
+    data = file_transfer.decode_chunk(fields)
+    assert (None if data is None else bytes(data)) == expected
+
+
+def test_damaged_chunk_is_dropped(bob, sock):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 4)
+    transfer = receiving(bob, data)
+    message = chunk("f1", 1, 4, size, bytearray(data[size : 2 * size]))
+    message["CRC"] = crc(data[size : 2 * size])
+    message["PAYLOAD"][10] ^= 0xFF
+    file_transfer.handle_file_chunk(message, bob, sock, "127.0.0.1")
+    assert 1 not in transfer["received"]
+    # asked for again at once instead of acknowledged
+    [reply] = [decode_message(data) for data, addr in sock.sent]
+    assert reply["TYPE"] == "FILE_NACK" and reply["MISSING"] == "1"
+
+
+def test_digest_follows_chunks_in_any_order(bob, sock, save_dir):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 16 + 77)
+    transfer = receiving(bob, data)
+    order = [5, 3, 16, 0, 1, 2, 9, 4, 15, 6, 7, 8, 10, 11, 13, 12, 14]
+    for index in order:
+        piece = data[index * size : (index + 1) * size]
+        message = chunk("f1", index, 17, index * size, piece)
+        message["CRC"] = crc(piece)
+        file_transfer.handle_file_chunk(message, bob, sock, "127.0.0.1")
+    wait_assembled(bob)
+    assert transfer["digest"].hexdigest() == hashlib.sha256(data).hexdigest()
+    assert (save_dir / "payload.bin").read_bytes() == data
+
+
+def test_file_not_matching_the_offered_hash_is_discarded(bob, sock, save_dir):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 4)
+    transfer = receiving(bob, data)
+    transfer["filehash"] = hashlib.sha256(b"something else").hexdigest()
+    for index in range(4):
+        piece = data[index * size : (index + 1) * size]
+        file_transfer.handle_file_chunk(
+            chunk("f1", index, 4, index * size, piece), bob, sock, "127.0.0.1"
+        )
+    wait_assembled(bob)
+
+    assert not (save_dir / "payload.bin").exists()
+    assert not os.path.exists(transfer["part_path"])
+    statuses = [
+        message.get("STATUS")
+        for message in (decode_message(data) for data, addr in sock.sent)
+        if message["TYPE"] == "FILE_RECEIVED"
+    ]
+    assert statuses == ["CORRUPT"]
@@ -0,0 +1,75 @@
+import os
+
+import ack
+import file_transfer
+import utils.globals as globals
+from helpers import chunk, receiving
+from send_window import SendWindow
+from utils import AppState, decode_message
+
+
+def sender(sock, count):
+    """alice with chunks 0..count - 1 of f1 in flight"""
+    app_state = AppState(user_id="alice@127.0.0.1")
+    window = SendWindow(initial=64)
+    app_state.file_send_windows["f1"] = window
+    for index in range(count):
+        message = {"TYPE": "FILE_CHUNK", "FILEID": "f1", "CHUNK_INDEX": index}
+        window.on_send(f"f1_chunk_{index}")
+        ack.send_with_ack(sock, message, app_state, "127.0.0.2", tracker=window)
+    return app_state, window
+
+
+def sack(cumulative, bitmap, **fields):
+    message = {
+        "TYPE": "FILE_SACK",
+        "FROM": "bob@127.0.0.2",
+        "FILEID": "f1",
+        "CUMULATIVE": cumulative,
+        "BITMAP": bitmap,
+    }
+    return dict(message, **fields)
+
+
+def test_receiver_reports_gaps_in_the_bitmap(bob, sock):
+    size = globals.CHUNK_SIZE
+    data = os.urandom(size * 8)
+    app_state = bob
+    receiving(app_state, data)
+    for index in (0, 1, 3, 5):
+        message = chunk("f1", index, 8, index * size, data[index * size : (index + 1) * size])
+        file_transfer.handle_file_chunk(message, app_state, sock, "127.0.0.1")
+
+    messages = [decode_message(data) for data, addr in sock.sent]
+    assert {message["TYPE"] for message in messages} == {"FILE_SACK"}  # no per chunk ACKs
+    last = messages[-1]
+    assert last["CUMULATIVE"] == "2"
+    assert int(last["BITMAP"], 16) == 0b101  # chunks 3 and 5
+
+
+def test_one_sack_clears_every_chunk_it_covers(sock):
+    app_state, window = sender(sock, 6)
+    file_transfer.handle_file_sack(sack("2", "5"), app_state, "127.0.0.2")
+
+    assert set(app_state.pending_acks) == {"f1_chunk_2", "f1_chunk_4"}
+    assert set(window.in_flight) == {"f1_chunk_2", "f1_chunk_4"}
+    assert window.acked == 4
+
+    # everything below CUMULATIVE, the rest of the bitmap is past the window
+    file_transfer.handle_file_sack(sack("6", "ff"), app_state, "127.0.0.2")
+    assert app_state.pending_acks == {} and window.drained()
+
+
+def test_recovered_chunks_are_counted(sock):
+    app_state, window = sender(sock, 4)
+    file_transfer.handle_file_sack(sack("4", "0", RECOVERED="2"), app_state, "127.0.0.2")
+    # an older one that arrived late
+    file_transfer.handle_file_sack(sack("4", "0", RECOVERED="1"), app_state, "127.0.0.2")
+    assert window.recovered == 2
+
+
+def test_malformed_sack_clears_nothing(sock):
+    app_state, window = sender(sock, 4)
+    for message in (sack("two", "0"), sack("2", "zz"), {"TYPE": "FILE_SACK", "FILEID": "f1"}):
+        file_transfer.handle_file_sack(message, app_state, "127.0.0.2")
+    assert len(app_state.pending_acks) == 4 and window.acked == 0
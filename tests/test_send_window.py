@@ -0,0 +1,115 @@
+import os
+import time
+
+import ack
+import file_transfer
+import utils.globals as globals
+from helpers import FakeSocket
+from send_window import SendWindow
+from utils import AppState
+
+
+def fill(window, count, prefix="c"):
+    ids = [f"{prefix}{n}" for n in range(count)]
+    for ack_id in ids:
+        window.on_send(ack_id)
+    return ids
+
+
+def test_room_is_the_window():
+    window = SendWindow(initial=4, max_window=64)
+    fill(window, 3)
+    assert window.has_room()
+    window.on_send("c3")
+    assert not window.has_room()
+    window.on_ack("c0")
+    assert window.has_room()
+
+
+def test_slow_start_then_congestion_avoidance():
+    window = SendWindow(initial=2, max_window=64)
+    window.ssthresh = 8.0
+    # a whole window of ACKs doubles it below ssthresh
+    for ack_id in fill(window, 2):
+        window.on_ack(ack_id)
+    assert window.cwnd == 4
+    for ack_id in fill(window, 4, "d"):
+        window.on_ack(ack_id)
+    assert window.cwnd == 8
+    # and adds about one chunk above it
+    for ack_id in fill(window, 8, "e"):
+        window.on_ack(ack_id)
+    assert 8.9 < window.cwnd < 9.0
+
+
+def test_acks_of_chunks_not_in_flight_are_ignored():
+    window = SendWindow(initial=4, max_window=64)
+    [ack_id] = fill(window, 1)
+    window.on_ack(ack_id)
+    window.on_ack(ack_id)  # duplicate ACK
+    window.on_ack("never-sent")
+    assert window.acked == 1 and window.cwnd == 5
+
+
+def test_losses_halve_the_window_once_per_rto():
+    window = SendWindow(initial=32, max_window=64)
+    ids = fill(window, 32)
+    for ack_id in ids[:8]:
+        window.on_retransmit(ack_id, rto=10.0)
+    assert window.cwnd == 16 and window.retransmits == 8
+
+    window.last_decrease -= 11.0  # an RTO later
+    window.on_retransmit(ids[8], rto=10.0)
+    assert window.cwnd == 8
+
+
+def test_window_never_drops_below_the_minimum():
+    window = SendWindow(initial=globals.FILE_WINDOW_MIN, max_window=64)
+    window.on_retransmit("c0", rto=0.0)
+    assert window.cwnd == globals.FILE_WINDOW_MIN
+
+
+def test_window_is_capped():
+    window = SendWindow(initial=6, max_window=8)
+    for ack_id in fill(window, 6):
+        window.on_ack(ack_id)
+    assert window.cwnd == 8
+    window.set_max_window(4)
+    assert window.cwnd == 4 and window.ssthresh == 4
+
+
+def test_give_up_frees_the_slot_and_is_reported():
+    woken = []
+    window = SendWindow(initial=2, max_window=64, on_wake=lambda: woken.append(1))
+    fill(window, 2)
+    window.on_give_up("c0")
+    assert window.has_room() and window.failed == {"c0"} and woken
+    window.on_ack("c1")
+    assert window.drained()
+
+
+def test_sender_waits_for_room(tmp_path):
+    size = globals.CHUNK_SIZE
+    path = tmp_path / "payload.bin"
+    path.write_bytes(os.urandom(size * 20))
+    sock = FakeSocket()
+    send_info = {
+        "sock": sock,
+        "to_ip": "127.0.0.1",
+        "token": f"alice@127.0.0.1|{int(time.time()) + 600}|file",
+        "filesize": size * 20,
+        "filepath": str(path),
+        "chunk_size": size,
+    }
+    window = SendWindow(initial=4)
+    app_state = AppState(user_id="alice@127.0.0.1")
+    sends = file_transfer.iter_send_file_chunks(send_info, app_state, "f1", "bob@127.0.0.1", window)
+
+    step = next(step for step in sends if callable(step))
+    assert len(sock.sent) == 4 and step == window.has_room
+    # in slow start one ACK makes room for two more
+    ack.acknowledge(app_state, ["f1_chunk_0"])
+    assert window.has_room()
+    step = next(step for step in sends if callable(step))
+    assert len(sock.sent) == 6 and len(window.in_flight) == 5
+    sends.close()
@@ -0,0 +1,103 @@
+import itertools
+import time
+
+import pytest
+
+import utils.globals as globals
+from transfer_engine import TokenBucket, TransferEngine
+
+
+def chunks(size, count=None):
+    """A send that puts size byte chunks on the wire, forever or count times"""
+    for _ in itertools.repeat(None) if count is None else range(count):
+        yield size
+
+
+def steps(engine, count):
+    for _ in range(count):
+        engine._step()
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(globals, "FILE_RATE_LIMIT", 0)
+    monkeypatch.setattr(globals, "FILE_PEER_RATE_LIMIT", 0)
+    return globals
+
+
+def test_sends_share_bytes_not_chunks(limits):
+    engine = TransferEngine()
+    engine.add("small", "10.0.0.2", 0, None, chunks(1000))
+    engine.add("big", "10.0.0.3", 0, None, chunks(30000))
+    steps(engine, 50)
+    small, big = (engine.sends[file_id]["sent_bytes"] for file_id in ("small", "big"))
+    assert abs(small - big) <= 30000 + globals.ENGINE_QUANTUM
+    assert small > 20 * globals.ENGINE_QUANTUM
+
+
+def test_blocked_send_waits_without_holding_up_the_rest(limits):
+    room = [False]
+
+    def windowed():
+        yield 1000
+        yield lambda: room[0]  # window full
+        yield 1000
+
+    engine = TransferEngine()
+    engine.add("waits", "10.0.0.2", 0, None, windowed())
+    engine.add("runs", "10.0.0.3", 0, None, chunks(1000))
+    steps(engine, 5)
+    assert engine.sends["waits"]["sent_bytes"] == 1000
+    assert engine.sends["runs"]["sent_bytes"] >= 4 * globals.ENGINE_QUANTUM
+
+    room[0] = True
+    steps(engine, 2)
+    assert "waits" not in engine.sends  # sent the rest and finished
+
+
+def test_failed_send_is_dropped_alone(limits, capsys):
+    def broken():
+        yield 1000
+        raise OSError("disk went away")
+
+    engine = TransferEngine()
+    engine.add("broken", "10.0.0.2", 0, None, broken())
+    engine.add("fine", "10.0.0.3", 0, None, chunks(1000, count=10))
+    steps(engine, 3)
+    assert engine.sends == {}
+    out = capsys.readouterr().out
+    assert "File send broken failed: disk went away" in out
+    assert "file_id=fine sent 10000 bytes" in out
+
+
+def test_peer_rate_limit_caps_only_that_peer(limits):
+    limits.FILE_PEER_RATE_LIMIT = 100_000
+    engine = TransferEngine()
+    engine.add("a", "10.0.0.2", 0, None, chunks(1000))
+    engine.add("b", "10.0.0.2", 0, None, chunks(1000))
+    engine.add("c", "10.0.0.3", 0, None, chunks(1000))
+    progressed, timeout = engine._step()
+    # a burst for 10.0.0.2 shared by a and b, then it has to wait
+    same_peer = engine.sends["a"]["sent_bytes"] + engine.sends["b"]["sent_bytes"]
+    assert same_peer <= engine.buckets["10.0.0.2"].burst + 2 * 1000
+    assert engine.sends["c"]["sent_bytes"] >= globals.ENGINE_QUANTUM  # its whole turn
+    assert progressed and timeout is not None and timeout > 0
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(1000.0)
+    now = bucket.updated
+    assert bucket.delay(now) == 0.0
+    bucket.consume(bucket.burst + 500)
+    assert bucket.delay(now) == pytest.approx(0.5)
+    assert bucket.delay(now + 0.5) == 0.0
+
+
+def test_engine_thread_runs_sends_to_the_end(limits):
+    engine = TransferEngine()
+    engine.start()
+    engine.add("f1", "10.0.0.2", 100_000, None, chunks(1000, count=100))
+    deadline = time.monotonic() + 5
+    while engine.sends and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not engine.sends
@@ -0,0 +1,78 @@
+import threading
+
+from utils import AppState, encode_message
+from worker_pool import WorkerPool
+
+PEER = ("10.0.0.5", 50999)
+
+
+class RecordingDispatcher:
+    """Records the TYPEs handled, types in slow wait for release first"""
+
+    def __init__(self, slow=()):
+        self.slow = set(slow)
+        self.release = threading.Event()
+        self.handled = []
+        self.done = threading.Condition()
+
+    def dispatch(self, msg, app_state, sock, addr):
+        if msg["TYPE"] in self.slow:
+            self.release.wait(5)
+        with self.done:
+            self.handled.append(msg["TYPE"])
+            self.done.notify_all()
+
+    def wait_for(self, count):
+        with self.done:
+            return self.done.wait_for(lambda: len(self.handled) >= count, 5)
+
+
+def pool_with(dispatcher):
+    pool = WorkerPool(dispatcher, AppState(user_id="bob@10.0.0.7"), None, num_workers=2)
+    pool.start()
+    return pool
+
+
+def datagram(msg_type):
+    return encode_message({"TYPE": msg_type, "FROM": f"alice@{PEER[0]}", "GAMEID": "g1"})
+
+
+def test_move_waits_for_an_earlier_invite():
+    dispatcher = RecordingDispatcher(slow={"TICTACTOE_INVITE"})
+    pool = pool_with(dispatcher)
+    for msg_type in ("TICTACTOE_INVITE", "TICTACTOE_MOVE", "TICTACTOE_MOVE", "TICTACTOE_RESULT"):
+        pool.submit(datagram(msg_type), PEER)
+    dispatcher.release.set()
+
+    assert dispatcher.wait_for(4)
+    assert dispatcher.handled == [
+        "TICTACTOE_INVITE",
+        "TICTACTOE_MOVE",
+        "TICTACTOE_MOVE",
+        "TICTACTOE_RESULT",
+    ]
+
+
+def test_result_waits_for_an_earlier_fast_move():
+    dispatcher = RecordingDispatcher(slow={"TICTACTOE_MOVE"})
+    pool = pool_with(dispatcher)
+    pool.submit(datagram("TICTACTOE_MOVE"), PEER)
+    pool.submit(datagram("TICTACTOE_RESULT"), PEER)
+    dispatcher.release.set()
+
+    assert dispatcher.wait_for(2)
+    assert dispatcher.handled == ["TICTACTOE_MOVE", "TICTACTOE_RESULT"]
+
+
+def test_move_and_ack_skip_a_busy_peer_queue():
+    dispatcher = RecordingDispatcher(slow={"FILE_CHUNK"})
+    pool = pool_with(dispatcher)
+    pool.submit(datagram("FILE_CHUNK"), PEER)
+    pool.submit(datagram("TICTACTOE_MOVE"), PEER)
+    pool.submit(datagram("ACK"), PEER)
+
+    assert dispatcher.wait_for(2)
+    assert dispatcher.handled == ["TICTACTOE_MOVE", "ACK"]
+    dispatcher.release.set()
+    assert dispatcher.wait_for(3)
+    assert pool._games == {}
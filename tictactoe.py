@@ -431,3 +431,14 @@ def handle_result(
 
     send_ack(sock, message_id, sender_ip, app_state)
 
+
+def register_handlers(dispatcher):
+    dispatcher.register(
+        "TICTACTOE_INVITE", handle_invite, lossy=True, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register(
+        "TICTACTOE_MOVE", handle_move, lossy=True, needs_sock=True, needs_addr=True
+    )
+    dispatcher.register(
+        "TICTACTOE_RESULT", handle_result, lossy=True, needs_sock=True, needs_addr=True
+    )
@@ -0,0 +1,217 @@
+# transfer_engine.py
+import asyncio
+import threading
+import time
+import utils.globals as globals
+
+
+class TokenBucket:
+    """
+    rate bytes/s with a small burst. Tokens may go negative after a chunk, the
+    next one waits until the bucket is back above zero.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    @property
+    def burst(self) -> float:
+        return max(self.rate / 4, globals.ENGINE_QUANTUM)
+
+    def delay(self, now: float) -> float:
+        """Seconds until a send is allowed, 0 if it is now"""
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def consume(self, n: int):
+        self.tokens -= n
+
+
+class TransferEngine:
+    """
+    Sends every outgoing file from one thread (or one task on the asyncio
+    runtime) instead of a thread per file.
+
+    Each send is a generator from file_transfer.iter_send_file_chunks: it
+    yields the number of bytes it just put on the wire, or a predicate when
+    its congestion window is full. Sends take turns by deficit round robin,
+    so each gets ENGINE_QUANTUM bytes per round whatever its chunk size, and
+    the optional FILE_RATE_LIMIT / FILE_PEER_RATE_LIMIT token buckets cap the
+    total and per peer rate. A send may also bring its own bucket (one to
+    many sends pace themselves, they have no window).
+    """
+
+    def __init__(self):
+        self.sends = {}  # file_id -> send state
+        self.buckets = {}  # None (global) or peer ip -> TokenBucket
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._turn = 0  # rotates which send goes first in a round
+        self._loop = None
+        self._event = None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def start_async(self, loop: asyncio.AbstractEventLoop):
+        """Run as a task on loop instead of a thread"""
+        self._loop = loop
+        self._event = asyncio.Event()
+        asyncio.run_coroutine_threadsafe(self._run_async(), loop)
+
+    def add(self, file_id: str, to_ip: str, total_bytes: int, window, gen, bucket=None):
+        with self._cond:
+            self.sends[file_id] = {
+                "file_id": file_id,
+                "to_ip": to_ip,
+                "window": window,
+                "bucket": bucket,
+                "gen": gen,
+                "blocked": None,  # predicate the generator waits on
+                "deficit": 0,
+                "sent_bytes": 0,
+                "total_bytes": total_bytes,
+                "started": time.monotonic(),
+            }
+        self.wake()
+
+    def wake(self):
+        """Something changed (ACKs, a new send), called from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+            return
+        with self._cond:
+            self._dirty = True
+            self._cond.notify()
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        with self._cond:
+            sends = list(self.sends.values())
+        return [
+            {
+                "file_id": send["file_id"],
+                "to_ip": send["to_ip"],
+                "sent_bytes": send["sent_bytes"],
+                "total_bytes": send["total_bytes"],
+                "rate": send["sent_bytes"] / max(now - send["started"], 1e-6),
+                "cwnd": send["window"].cwnd if send["window"] else None,
+                "retransmits": send["window"].retransmits if send["window"] else 0,
+            }
+            for send in sends
+        ]
+
+    def _run(self):
+        timeout = None
+        while True:
+            with self._cond:
+                if not self._dirty:
+                    self._cond.wait(timeout)
+                self._dirty = False
+            progressed, timeout = self._step()
+            if progressed:
+                timeout = 0
+
+    async def _run_async(self):
+        while True:
+            self._event.clear()
+            progressed, timeout = self._step()
+            if progressed:
+                await asyncio.sleep(0)  # let the loop serve the socket in between
+                continue
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _step(self):
+        """
+        One round over all sends. Returns (progressed, timeout): whether
+        anything was sent, and how long until a rate limited send may go again
+        (None if only an ACK or a new send can unblock anything).
+        """
+        with self._cond:
+            sends = list(self.sends.values())
+        if sends:
+            # under a rate cap the first send in a round may use up all the
+            # tokens, so every round starts one send further
+            self._turn = (self._turn + 1) % len(sends)
+            sends = sends[self._turn :] + sends[: self._turn]
+
+        progressed = False
+        timeout = None
+        for send in sends:
+            if send["blocked"] is not None:
+                if not send["blocked"]():
+                    continue
+                send["blocked"] = None
+
+            send["deficit"] += globals.ENGINE_QUANTUM
+            while send["deficit"] > 0:
+                delay = self._rate_delay(send)
+                if delay > 0:
+                    timeout = delay if timeout is None else min(timeout, delay)
+                    break
+                try:
+                    result = next(send["gen"])
+                except StopIteration:
+                    self._finish(send)
+                    break
+                except Exception as e:
+                    print(f"[ERROR] File send {send['file_id']} failed: {e}")
+                    self._finish(send)
+                    break
+                if callable(result):
+                    send["blocked"] = result
+                    break
+                send["deficit"] -= result
+                send["sent_bytes"] += result
+                self._consume(send, result)
+                progressed = True
+            # DRR, a send waiting on its window doesn't bank its turn
+            if send["blocked"] is not None:
+                send["deficit"] = 0
+            send["deficit"] = min(send["deficit"], globals.ENGINE_QUANTUM)
+        return progressed, timeout
+
+    def _buckets_for(self, to_ip: str) -> list:
+        buckets = []
+        for key, rate in (
+            (None, globals.FILE_RATE_LIMIT),
+            (to_ip, globals.FILE_PEER_RATE_LIMIT),
+        ):
+            if not rate:
+                continue
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(rate)
+            bucket.rate = rate  # may be changed at runtime
+            buckets.append(bucket)
+        return buckets
+
+    def _send_buckets(self, send: dict) -> list:
+        buckets = self._buckets_for(send["to_ip"])
+        if send["bucket"] is not None:
+            buckets.append(send["bucket"])
+        return buckets
+
+    def _rate_delay(self, send: dict) -> float:
+        now = time.monotonic()
+        return max((bucket.delay(now) for bucket in self._send_buckets(send)), default=0.0)
+
+    def _consume(self, send: dict, n: int):
+        for bucket in self._send_buckets(send):
+            bucket.consume(n)
+
+    def _finish(self, send: dict):
+        with self._cond:
+            self.sends.pop(send["file_id"], None)
+        elapsed = time.monotonic() - send["started"]
+        rate = send["sent_bytes"] / max(elapsed, 1e-6)
+        print(
+            f"[TRANSFER] file_id={send['file_id']} sent {send['sent_bytes']} bytes "
+            f"in {elapsed:.2f}s ({rate / 1024:.1f} KB/s)"
+        )
@@ -1,3 +1,5 @@
 from .app_state import AppState
 from . import globals 
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .codec import LazyMessage, build_message, decode_message, encode_message
+from .bitmap import ChunkBitmap, format_ranges, parse_ranges
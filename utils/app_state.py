@@ -14,15 +14,31 @@ class AppState:
     broadcast_ip: Optional[str] = None
     lock: Lock = field(default_factory=Lock, repr=False, compare=False)
 
+    # message TYPE -> handler registry, built once at startup
+    dispatcher: Optional[object] = field(default=None, repr=False, compare=False)
+    worker_pool: Optional[object] = field(default=None, repr=False, compare=False)
+    # timers for retransmits, beacons and cleanup (scheduler.Scheduler)
+    scheduler: Optional[object] = field(default=None, repr=False, compare=False)
+    # set when running on the asyncio runtime (app.py --async)
+    event_loop: Optional[object] = field(default=None, repr=False, compare=False)
+    last_profile_time: float = 0
+    # PING / PROFILE -> (message, encoded bytes), see net_comms.encoded_beacon
+    encoded_beacons: Dict[str, tuple] = field(default_factory=dict, repr=False)
+
     # user object (stored in peers dict) has the following fields
-    # TODO add the avatar fields
-    # "ip", "display_name, "status","last_seen"
+    # "ip", "display_name, "status","last_seen" and "avatar_hash" if they have one,
+    # "avatar_fetch" if they ask for avatars by hash (see avatar.py)
 
     peers: Dict[str, dict] = field(default_factory=dict)
     following: Set[str] = field(default_factory=set)
     followers: Set[str] = field(default_factory=set)
     revoked_token: Dict[str, float] = field(default_factory=dict)
 
+    # AVATAR_HASH -> {"data": base64 as sent, "text": decoded art}, see avatar.py
+    avatars: Dict[str, dict] = field(default_factory=dict, repr=False)
+    avatar_requests: Dict[str, float] = field(default_factory=dict)  # AVATAR_HASH → when we asked for it
+    avatar_replies: Dict[str, float] = field(default_factory=dict)  # ip → when we last sent it AVATAR_DATA
+
     # used for referencing posts for like/unlike
     received_posts: Dict[str, dict] = field(default_factory=dict)
     sent_posts: Dict[str, dict] = field(default_factory=dict)
@@ -43,6 +59,8 @@ class AppState:
 
     # ACK
     pending_acks: Dict[str, dict] = field(default_factory=dict)
+    # ip -> {"srtt", "rttvar", "rto", "samples"} from ACK round trips
+    rtt_estimates: Dict[str, dict] = field(default_factory=dict)
 
     # TICTACTOE INFORMATION
     active_games: Dict[str, dict] = field(default_factory=dict)
@@ -51,4 +69,10 @@ class AppState:
     # FILE TRANSFER
     pending_file_offers: Dict[str, dict] = field(default_factory=dict)  # FILEID → offer metadata
     file_transfers: Dict[str, dict] = field(default_factory=dict)       # FILEID → chunks, etc.
-    pending_file_sends: Dict[str, dict] = field(default_factory=dict)  # FILEID → send info (chunks, metadata)
\ No newline at end of file
+    pending_file_sends: Dict[str, dict] = field(default_factory=dict)  # FILEID → send info (chunks, metadata)
+    disk_writer: Optional[object] = field(default=None, repr=False, compare=False)  # background file I/O
+    file_send_windows: Dict[str, object] = field(default_factory=dict)  # FILEID → SendWindow of active sends
+    transfer_engine: Optional[object] = field(default=None, repr=False, compare=False)  # multiplexes all sends
+    multi_sends: Dict[str, dict] = field(default_factory=dict)  # FILEID → one to many send session
+    shared_files: Dict[str, dict] = field(default_factory=dict)  # sha256 → path, size, mtime of a file we have
+    pending_deltas: Dict[str, dict] = field(default_factory=dict)  # FILEID → offer and old copy we sent a signature of
@@ -0,0 +1,90 @@
+class ChunkBitmap:
+    """
+    One bit per chunk index plus a running count, so marking a chunk and
+    checking completion are O(1) whatever the number of chunks.
+    """
+
+    __slots__ = ("bits", "count", "size")
+
+    def __init__(self, size: int = 0):
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+        self.size = size
+
+    def grow(self, size: int):
+        """The total can go up mid-transfer (chunk size fallback), never down"""
+        if size > self.size:
+            self.bits.extend(bytes((size + 7) // 8 - len(self.bits)))
+            self.size = size
+
+    def add(self, index: int) -> bool:
+        """Mark index as received, returns False if it already was. grow() first for a bigger index"""
+        if not 0 <= index < self.size:
+            raise IndexError(f"chunk index {index} outside of 0-{self.size - 1}")
+        byte, mask = index >> 3, 1 << (index & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.count += 1
+        return True
+
+    def add_range(self, first: int, stop: int) -> int:
+        """Mark first..stop-1, returns how many were new"""
+        return sum(self.add(index) for index in range(first, stop))
+
+    def __contains__(self, index: int) -> bool:
+        return index < self.size and bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def complete(self) -> bool:
+        return self.size > 0 and self.count == self.size
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, size: int) -> "ChunkBitmap":
+        """Inverse of to_bytes, e.g. for a bitmap read back from disk"""
+        bitmap = cls(size)
+        n = min(len(data), len(bitmap.bits))
+        bitmap.bits[:n] = data[:n]
+        if size & 7 and len(data) >= len(bitmap.bits):
+            bitmap.bits[-1] &= (1 << (size & 7)) - 1  # ignore bits past size
+        bitmap.count = bin(int.from_bytes(bitmap.bits, "little")).count("1")
+        return bitmap
+
+    def missing_ranges(self, start: int = 0, limit: int = 64) -> list:
+        """Up to limit (first, last) ranges of unset indices from start, skips full bytes"""
+        ranges = []
+        index = start
+        while index < self.size and len(ranges) < limit:
+            if index & 7 == 0 and self.bits[index >> 3] == 0xFF:
+                index += 8
+                continue
+            if index in self:
+                index += 1
+                continue
+            first = index
+            while index < self.size and index not in self:
+                index += 1
+            ranges.append((first, index - 1))
+        return ranges
+
+
+def format_ranges(ranges) -> str:
+    """[(3, 7), (10, 10)] -> '3-7,10'"""
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def parse_ranges(text: str) -> list:
+    """'3-7,10' -> [(3, 7), (10, 10)]"""
+    ranges = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        ranges.append((int(first), int(last or first)))
+    return ranges
@@ -0,0 +1,144 @@
+# codec.py
+# LSNP messages straight to and from bytes. Encoding formats one cached
+# template per set of keys, decoding hands out a LazyMessage the dispatcher
+# can check TYPE / FROM / USER_ID on, a datagram it drops is never parsed.
+from collections.abc import Mapping
+import utils.globals as globals
+
+# tuple of keys -> "KEY: {}\n" * n + "\n", messages of one type always use the same keys
+_templates = {}
+# field name -> (b"KEY: ", b"\nKEY: "), what LazyMessage.get looks for in the header
+_needles = {}
+
+
+def _template(keys: tuple) -> str:
+    template = _templates.get(keys)
+    if template is None:
+        template = "".join(
+            str(key).replace("{", "{{").replace("}", "}}") + ": {}\n" for key in keys
+        ) + "\n"
+        if len(_templates) < 1024:  # keys come from our own code, but just in case
+            _templates[keys] = template
+    return template
+
+
+def build_message(data: dict) -> str:
+    """convert dict to key:value string with terminator"""
+    return _template(tuple(data)).format(*data.values())
+
+
+def encode_message(data: dict) -> bytes:
+    """
+    build_message as bytes to send. A bytes PAYLOAD isn't a field but goes
+    raw after the blank line (binary framing), the header only has its length.
+    """
+    payload = data.get("PAYLOAD")
+    if payload is None:
+        return build_message(data).encode("utf-8")
+    header = {key: value for key, value in data.items() if key != "PAYLOAD"}
+    header["PAYLOAD"] = len(payload)
+    return build_message(header).encode("utf-8") + payload
+
+
+def parse_header(header, payload=None) -> dict:
+    """parse_message straight from bytes, without stripping the whole text first"""
+    fields = {}
+    for line in header.decode("utf-8").split("\n"):
+        key, sep, value = line.partition(": ")
+        if sep:
+            fields[key.strip()] = value.strip()
+    if payload is not None:
+        fields["PAYLOAD"] = payload
+    return fields
+
+
+class LazyMessage(Mapping):
+    """
+    Read-only view of a received message. get() finds a single field in the
+    header bytes and decodes just that value, which is all the dispatcher
+    needs (TYPE, FROM, USER_ID) to drop our own broadcasts, unknown types
+    and induced losses. fields() parses the whole header into the plain dict
+    handlers get, once. A key sent twice reads as its last line either way,
+    like parse_header.
+    """
+
+    __slots__ = ("_header", "_payload", "_fields")
+
+    def __init__(self, header, payload=None):
+        self._header = header
+        self._payload = payload
+        self._fields = None
+
+    def get(self, key, default=None):
+        if self._fields is not None:
+            return self._fields.get(key, default)
+        if key == "PAYLOAD" and self._payload is not None:
+            return self._payload
+        needles = _needles.get(key)
+        if needles is None:
+            first = key.encode("utf-8") + b": "
+            needles = (first, b"\n" + first)
+            if len(_needles) < 1024:
+                _needles[key] = needles
+        header = self._header
+        start = header.rfind(needles[1])
+        if start >= 0:
+            start += len(needles[1])
+        elif header.startswith(needles[0]):
+            start = len(needles[0])
+        else:
+            return default
+        end = header.find(b"\n", start)
+        return header[start : end if end >= 0 else None].decode("utf-8").strip()
+
+    def fields(self) -> dict:
+        if self._fields is None:
+            self._fields = parse_header(self._header, self._payload)
+        return self._fields
+
+    def pop(self, key, *default):
+        """Like dict.pop, PAYLOAD is handed over without parsing the header"""
+        if key != "PAYLOAD" or self._payload is None:
+            return self.fields().pop(key, *default)
+        payload, self._payload = self._payload, None
+        if self._fields is not None:
+            del self._fields["PAYLOAD"]
+        return payload
+
+    def __getitem__(self, key):
+        return self.fields()[key]
+
+    def __iter__(self):
+        return iter(self.fields())
+
+    def __len__(self):
+        return len(self.fields())
+
+    def __repr__(self):
+        return repr(self.fields())
+
+
+def decode_message(data, length: int = None):
+    """
+    A received datagram, the first length bytes of data (a bytes object, or
+    a reused receive buffer), as a dict, or as a LazyMessage if the header
+    is big enough that finding a few fields beats splitting all of it. Only
+    the header is copied out, the buffer goes back to its pool while the
+    message may still be around. A binary PAYLOAD comes back as a
+    memoryview slice, without copying it.
+    """
+    if length is None:
+        length = len(data)
+    # PAYLOAD is the last header field, the raw bytes follow its blank line
+    start = data.find(b"\nPAYLOAD: ", 0, length)
+    end = data.find(b"\n", start + 1, length) if start >= 0 else -1
+    if end < 0 or data[end + 1 : end + 2] != b"\n":
+        end, payload = length, None
+    else:
+        payload = memoryview(data)[end + 2 : length]
+        if len(payload) != int(data[start + 10 : end]):
+            raise ValueError(f"PAYLOAD is {len(payload)} bytes, expected {int(data[start + 10 : end])}")
+    # a slice is a copy (or data itself if it's all of a bytes object)
+    if end < globals.LAZY_HEADER_SIZE:
+        return parse_header(data[:end], payload)
+    return LazyMessage(data[:end], payload)
@@ -6,7 +6,88 @@ TTL = 60
 POST_TTL = 3600  # POST TTL fixed at 3600 unless runtime change allowed
 verbose = False
 broadcast_verbose = False
-CHUNK_SIZE = 256
+CHUNK_SIZE = 256  # smallest chunk size, also used with peers that don't negotiate
+# Chunk size is negotiated in FILE_OFFER/FILE_ACCEPTED up to what one datagram
+# can carry without IP fragmentation (PATH_MTU), or the UDP limit on loopback
+PATH_MTU = 1500
+MAX_UDP_PAYLOAD = 65507
+CHUNK_HEADER_RESERVE = 512  # bytes for the FILE_CHUNK key/value fields around DATA
+# binary framing, chunk bytes go raw after the header's blank line instead of
+# base64 in DATA, to receivers that say they take it (BINARY: 1)
+BINARY_CHUNKS = True
+MAX_CHUNK_SIZE = None  # optional hard cap, e.g. for benchmarks
+CHUNK_FALLBACK_LOSS = 0.1  # halve the chunk size if more than 10% get retransmitted
+CHUNK_FALLBACK_SAMPLES = 32  # chunks sent at a size before judging its loss
+SOCKET_BUFFER = 4 * 1024 * 1024  # requested SO_RCVBUF/SO_SNDBUF
+# file sender congestion window, in chunks
+FILE_WINDOW_INITIAL = 4
+FILE_WINDOW_MIN = 1
+FILE_WINDOW_MAX = 256
+FILE_WINDOW_BYTES = 1024 * 1024  # also cap the window at ~1 MB in flight
+# FILE_SACK, receiver acknowledges chunks in batches instead of one ACK each
+SACK_EVERY = 16  # chunks received before a FILE_SACK goes out
+SACK_DELAY = 0.05  # seconds, flush a partial batch after this long
+SACK_RANGE = 512  # chunks past the cumulative index covered by the bitmap
+# FILE_NACK, receiver asks for missing ranges once the chunk stream stalls
+NACK_STALL = 0.3  # seconds without a chunk
+NACK_MAX = 6  # consecutive NACKs without progress before giving up
+NACK_MAX_RANGES = 64
+# resumable transfers, the receiver checkpoints which CHUNK_SIZE blocks are on disk
+CHECKPOINT_INTERVAL = 1.0  # seconds between checkpoints while chunks arrive
+RESUME_MAX_RANGES = 32  # missing byte ranges listed in one FILE_RESUME
+# FEC, one XOR parity chunk per group of file chunks (see fec.py)
+FEC_GROUP = 0  # 0 = off, N = fixed group size, "auto" = sized from observed loss
+FEC_SAMPLES = 32  # chunks sent before "auto" trusts its loss estimate
+FEC_MIN_LOSS = 0.01  # "auto" sends no parity below this loss rate
+FEC_MAX_GROUP = 32
+# transfer engine, all file sends share one sender (see transfer_engine.py)
+ENGINE_QUANTUM = 64 * 1024  # bytes each send gets per round robin turn
+FILE_RATE_LIMIT = 0  # bytes/s for all file sends together, 0 = no cap
+FILE_PEER_RATE_LIMIT = 0  # bytes/s per destination peer, 0 = no cap
+# one to many sends (see file_multicast.py), chunks go out once to every recipient
+MULTICAST_GROUP = None  # e.g. "239.255.76.67", None = use the broadcast address
+MULTI_RATE_INITIAL = 1024 * 1024  # bytes/s, there are no ACKs to clock the stream
+MULTI_RATE_MIN = 64 * 1024
+MULTI_RATE_MAX = 8 * 1024 * 1024
+MULTI_RATE_STEP = 512 * 1024  # bytes/s added per second without NACKs
+MULTI_RATE_HOLD = 1.0  # seconds between rate cuts, one loss burst NACKs many times
+MULTI_IDLE = 60  # seconds without any feedback before a send stops waiting for stragglers
+# swarm downloads, disjoint parts of one file from every peer that has it (see file_swarm.py)
+SWARM_DISCOVERY = 0.5  # seconds to collect FILE_HAVE replies before splitting the file
+SWARM_REASSIGN = 2  # stalled NACK rounds before the missing chunks move to another seeder
+# delta transfers, only what changed since the receiver's old copy (see file_delta.py)
+DELTA_MIN_SIZE = 64 * 1024  # smaller files just go whole
+DELTA_MAX_LITERAL = 0.8  # send the whole file once more than this share of it is new
+DELTA_PROBE_BLOCKS = 32  # unmatched blocks in a row before checking that share on what was scanned
+# avatars, messages carry AVATAR_HASH and peers fetch the art once (see avatar.py)
+AVATAR_CACHE_SIZE = 256  # avatars kept by hash, the oldest go first
+AVATAR_REQUEST_RETRY = 10  # seconds before asking for the same missing avatar again
+AVATAR_REPLY_INTERVAL = 1.0  # seconds between AVATAR_DATA replies to the same ip
+
+# ACK / retransmission
+# RTO per peer is derived from measured ACK round trips (RFC 6298 style),
+# ACK_TIMEOUT is only used until the first sample from that peer
+ACK_TIMEOUT = 2  # seconds
+MAX_RETRIES = 3
+RTO_JITTER = 0.1  # +-10% on every retransmit timeout
+# per TYPE retry policy, anything not listed uses "default"
+RETRY_POLICIES = {
+    "default": {"max_retries": MAX_RETRIES, "min_rto": 0.2, "max_rto": 10.0},
+    # game moves are tiny and latency sensitive, retry fast and often
+    "TICTACTOE_INVITE": {"max_retries": 5, "min_rto": 0.1, "max_rto": 2.0},
+    "TICTACTOE_MOVE": {"max_retries": 6, "min_rto": 0.1, "max_rto": 2.0},
+    "TICTACTOE_RESULT": {"max_retries": 5, "min_rto": 0.1, "max_rto": 2.0},
+    "DM": {"max_retries": 4, "min_rto": 0.3, "max_rto": 10.0},
+    # file chunks are plentiful, back off harder so a lossy link isn't flooded
+    "FILE_CHUNK": {"max_retries": 5, "min_rto": 0.2, "max_rto": 8.0},
+}
+
+# Handler thread pool, listener_loop only receives and enqueues
+WORKER_THREADS = 4
+WORK_QUEUE_SIZE = 1024  # per worker, datagrams are dropped when full
+RECV_BUFFERS = 128  # reusable 64 KB receive buffers, past that datagrams get their own
+RECV_SMALL_BUFFERS = 4096  # and 2 KB ones, small datagrams are copied into these
+LAZY_HEADER_SIZE = 1024  # bigger headers decode to a LazyMessage, smaller ones to a dict
 
 # Packet loss simulation
 induce_loss = False
@@ -1,11 +1,6 @@
 import base64
 
 
-def build_message(data: dict) -> str:
-    """convert dict to key:value string with terminator"""
-    return "\n".join(f"{k}: {v}" for k, v in data.items()) + "\n\n"
-
-
 def parse_message(raw: str) -> dict:
     """Parse key:value string format to dict"""
     lines = raw.strip().split("\n")
@@ -43,17 +38,3 @@ def parse_token(token: str) -> dict:
         raise ValueError(f"Invalid token format: {token}") from e
 
     return {"USER_ID": user_id, "TIMESTAMP_TTL": timestamp_ttl, "SCOPE": scope}
-
-
-def display_avatar(avatar_data: str):
-    """Helper function to properly display ASCII art avatar"""
-    if avatar_data:
-        # Decode base64 avatar data back to ASCII art
-        decoded_avatar = decode_avatar_data(avatar_data)
-        if decoded_avatar:
-            print("Avatar:")
-            print(decoded_avatar)
-        else:
-            print("Avatar: [Unable to decode]")
-    else:
-        print("No avatar available")
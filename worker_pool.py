@@ -0,0 +1,138 @@
+# worker_pool.py
+import queue
+import threading
+from buffer_pool import SMALL_SIZE, BufferPool
+from utils import decode_message
+import utils.globals as globals
+
+# ACKs and game moves skip the per-peer queues so a big file transfer
+# from the same peer can't delay them, moves only while they can't overtake
+# an earlier game message of theirs (see WorkerPool)
+ACK_PREFIX = b"TYPE: ACK\n"
+GAME_PREFIX = b"TYPE: TICTACTOE_"
+MOVE_PREFIX = b"TYPE: TICTACTOE_MOVE\n"
+
+
+class WorkerPool:
+    """
+    Runs message handlers off the listener thread.
+
+    Each datagram is routed to a worker by sender IP, so all messages from one
+    peer (and therefore one FROM, since FROM must match the packet's IP) are
+    handled in order by the same thread. Every worker has its own bounded queue,
+    a full queue drops the datagram instead of blocking the socket.
+
+    ACKs go through a separate fast lane, out of order with the rest. So do
+    TICTACTOE_MOVEs, but a peer's game messages (INVITE, MOVE, RESULT) are
+    only ever queued in one lane at a time: a move goes fast only if none of
+    theirs is still waiting, otherwise it follows the others. Among
+    themselves, one peer's game messages are always handled in the order
+    they arrived, a move never finds its game not invited yet.
+    """
+
+    def __init__(self, dispatcher, app_state, sock, num_workers=None, queue_size=None):
+        self.dispatcher = dispatcher
+        self.app_state = app_state
+        self.sock = sock
+        self.num_workers = num_workers or globals.WORKER_THREADS
+        queue_size = queue_size or globals.WORK_QUEUE_SIZE
+
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(self.num_workers)]
+        self.fast_queue = queue.Queue(maxsize=queue_size)
+        # receive buffers for listener_loop, big datagrams are received into
+        # the first kind and handed over, small ones copied into the second
+        self.buffers = BufferPool(globals.RECV_BUFFERS)
+        self.small_buffers = BufferPool(globals.RECV_SMALL_BUFFERS, SMALL_SIZE)
+        self.overflow_drops = 0
+        self.max_depth = 0
+        # ip -> [queue, game messages of theirs in it not handled yet]
+        self._games = {}
+        self._games_lock = threading.Lock()
+
+    def start(self):
+        for q in self.queues:
+            threading.Thread(target=self._worker_loop, args=(q,), daemon=True).start()
+        threading.Thread(
+            target=self._worker_loop, args=(self.fast_queue,), daemon=True
+        ).start()
+
+    def submit(self, data, addr, length: int = None) -> bool:
+        """
+        Called from the listener thread, never blocks. length is set when
+        data is one of self.buffers, it goes back to the pool once handled.
+        """
+        game = False
+        if data.startswith(ACK_PREFIX):
+            q = self.fast_queue
+        elif data.startswith(GAME_PREFIX):
+            q = self._game_lane(data, addr[0])
+            game = True
+        else:
+            q = self.queues[hash(addr[0]) % self.num_workers]
+
+        try:
+            q.put_nowait((data, length, addr, game))
+        except queue.Full:
+            if game:
+                self._game_done(addr[0])
+            if length is not None:
+                self.pool_of(data).release(data)
+            # only the listener thread writes these
+            self.overflow_drops += 1
+            if globals.verbose:
+                print(f"[DROP !] Work queue full, dropped datagram from {addr[0]}")
+            return False
+
+        depth = q.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _game_lane(self, data, ip: str) -> queue.Queue:
+        """Queue for a game message, counted until _game_done"""
+        with self._games_lock:
+            lane = self._games.get(ip)
+            if lane is None:
+                if data.startswith(MOVE_PREFIX):
+                    q = self.fast_queue
+                else:
+                    q = self.queues[hash(ip) % self.num_workers]
+                lane = self._games[ip] = [q, 0]
+            lane[1] += 1
+            return lane[0]
+
+    def _game_done(self, ip: str):
+        with self._games_lock:
+            lane = self._games[ip]
+            lane[1] -= 1
+            if not lane[1]:
+                del self._games[ip]
+
+    def _worker_loop(self, q: queue.Queue):
+        while True:
+            data, length, addr, game = q.get()
+            msg = None
+            try:
+                msg = decode_message(data, length)
+                self.dispatcher.dispatch(msg, self.app_state, self.sock, addr)
+            except Exception as e:
+                print("[ERROR] Could not parse message:", e)
+            if game:
+                self._game_done(addr[0])
+            if length is not None:
+                self.pool_of(data).recycle(data, msg)
+            msg = None  # a kept PAYLOAD is the handler's now
+
+    def pool_of(self, buf: bytearray) -> BufferPool:
+        return self.small_buffers if len(buf) == SMALL_SIZE else self.buffers
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "depths": [q.qsize() for q in self.queues],
+            "fast_lane_depth": self.fast_queue.qsize(),
+            "max_depth": self.max_depth,
+            "overflow_drops": self.overflow_drops,
+            "buffers": self.buffers.stats(),
+            "small_buffers": self.small_buffers.stats(),
+        }